@@ -0,0 +1,86 @@
+import re
+
+from email.utils import getaddresses
+from functools import lru_cache
+from typing import Tuple, Dict, Optional
+
+# Distinct raw header values (and single mailboxes) remembered per process
+ADDRESS_CACHE_SIZE = 8192
+
+Address = Tuple[str, str, str]  # (name, email, domain)
+
+# Characters that need the full RFC 5322 grammar: quoting, comments, groups, literals, escapes
+_COMPLEX_CHARS = frozenset('"()[]\\:;')
+
+# Plain `Name <local@domain>` or bare `local@domain`
+_SIMPLE_MAILBOX = re.compile(r'\s*(?:([^<>@]*?)\s*<([^<>\s@]+@[^<>\s@]+)>|([^<>\s@]+@[^<>\s@]+))\s*')
+
+
+def _address(name: str, email: str) -> Optional[Address]:
+    email = email.lower().replace('"', '')
+    if '@' not in email:
+        return None
+
+    return (' '.join(name.replace('"', '').split()), email, email.rsplit('@', 1)[1])
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _parse_simple_mailbox(part: str) -> Optional[Address]:
+    ''' Parses one comma separated entry without quoting, None when it needs the full parser '''
+    match = _SIMPLE_MAILBOX.fullmatch(part)
+    if match is None:
+        return None
+
+    name, email, bare = match.groups()
+    return _address(name or '', email or bare)
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def parse_address_header(value: str) -> Tuple[Address, ...]:
+    '''
+    Splits a raw From/To/Cc/Bcc header value into (name, email, domain)
+    triples. Headers made of plain `Name <email>` entries are split on
+    commas and each entry is cached on its own, so a new combination of
+    known recipients is still mostly lookups. Anything with quoting,
+    comments or groups goes through the RFC 5322 parser from the email
+    package. Results are cached by the raw value since the same headers
+    repeat across a whole mailbox, the returned tuple is shared and must
+    not be changed.
+
+    Params:
+    -------
+        value: str
+            eg: '"Doe, Jane" <Jane.Doe@example.com>, team@example.com'
+    '''
+    if _COMPLEX_CHARS.isdisjoint(value):
+        parts = [part for part in value.split(',') if part.strip()]
+        addresses = [_parse_simple_mailbox(part) for part in parts]
+
+        if None not in addresses:
+            return tuple(addresses)
+
+    addresses = (_address(name, email) for name, email in getaddresses([value]))
+    return tuple(address for address in addresses if address is not None)
+
+
+def address_cache_counts() -> Tuple[int, int]:
+    ''' (hits, misses) of the header cache in this process so far '''
+    info = parse_address_header.cache_info()
+    return info.hits, info.misses
+
+
+def address_cache_stats() -> Dict[str, any]:
+    ''' Hit rate of the header cache in this process, mailbox cache lookups only happen on header misses '''
+    info = parse_address_header.cache_info()
+    mailbox_info = _parse_simple_mailbox.cache_info()
+    lookups = info.hits + info.misses
+
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'hit_rate': round(info.hits / lookups, 4) if lookups else 0.0,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'mailbox_hits': mailbox_info.hits,
+        'mailbox_misses': mailbox_info.misses,
+    }
@@ -0,0 +1,100 @@
+import os
+
+from enum import IntFlag
+from collections import namedtuple
+from typing import Tuple, Dict
+
+import numpy as np
+
+
+class Truncation(IntFlag):
+    '''
+    Limits a message body ran into, stored as a bit mask on each CommNode
+
+    Options:
+    --------
+        BYTES = 1
+            raw body cut before decoding
+        CHARS = 2
+            extracted text cut, html goes through the truncating extractor
+        TOKENS = 4
+            keyword counting stopped early
+    '''
+    NONE = 0
+    BYTES = 1
+    CHARS = 2
+    TOKENS = 4
+
+
+BodyLimits = namedtuple('BodyLimits', ['max_bytes', 'max_chars', 'max_tokens'])
+
+# Per message limits, set in every parse worker by configure_body_limits
+_limits = BodyLimits(
+    max_bytes=int(os.environ.get('MAX_BODY_BYTES', 2 * 1024 ** 2)),
+    max_chars=int(os.environ.get('MAX_BODY_CHARS', 200000)),
+    max_tokens=int(os.environ.get('MAX_KEYWORD_TOKENS', 50000)),
+)
+
+
+def configure_body_limits(max_bytes: int, max_chars: int, max_tokens: int) -> None:
+    ''' Sets the per message limits, 0 turns a limit off '''
+    global _limits
+    _limits = BodyLimits(max_bytes, max_chars, max_tokens)
+
+
+def get_body_limits() -> BodyLimits:
+    return _limits
+
+
+def limit_raw_body(raw: str) -> Tuple[str, Truncation]:
+    ''' Cuts base64 body data down to max_bytes decoded bytes, on a 4 character boundary '''
+    max_bytes = _limits.max_bytes
+
+    if not max_bytes or len(raw) * 3 // 4 <= max_bytes:
+        return raw, Truncation.NONE
+
+    return raw[:max_bytes // 3 * 4], Truncation.BYTES
+
+
+def limit_chars(text: str) -> Tuple[str, Truncation]:
+    max_chars = _limits.max_chars
+
+    if not max_chars or len(text) <= max_chars:
+        return text, Truncation.NONE
+
+    return text[:max_chars], Truncation.CHARS
+
+
+def limit_tokens(text: str) -> Tuple[str, Truncation]:
+    '''
+    Keeps the first max_tokens whitespace separated words. spaCy splits
+    punctuation off as well, so the tokens it counts can run a little over.
+    '''
+    max_tokens = _limits.max_tokens
+
+    # Every token takes at least a character and a separator
+    if not max_tokens or len(text) <= max_tokens * 2:
+        return text, Truncation.NONE
+
+    words = text.split(None, max_tokens)
+    if len(words) <= max_tokens:
+        return text, Truncation.NONE
+
+    # The last piece is everything after the first max_tokens words
+    return text[:len(text) - len(words[-1])].rstrip(), Truncation.TOKENS
+
+
+def keyword_text(node: 'CommNode') -> str:
+    ''' Body the keywords are counted from, plaintext first, capped at max_tokens '''
+    text, truncated = limit_tokens(node.plaintext_body or node.html_body)
+    node.truncated |= truncated
+
+    return text
+
+
+def truncation_counts(flags: np.ndarray) -> Dict[str, int]:
+    ''' Number of messages that hit each limit, from an array of Truncation masks '''
+    return {
+        flag.name.lower(): int(np.count_nonzero(flags & flag.value))
+        for flag in (Truncation.BYTES, Truncation.CHARS, Truncation.TOKENS)
+    }
@@ -4,31 +4,39 @@ import string
 import re
 import base64
 
-from typing import TypeVar, List, Callable, Dict, Generator, Union
+from typing import TypeVar, List, Callable, Dict, Generator, Union, Optional, Tuple
 from abc import ABCMeta, abstractmethod
 
 from collections import Counter
 from datetime import datetime, date
 
-from bs4 import BeautifulSoup
-from spacy.lang.en import English
-from spacy.lang.en.stop_words import STOP_WORDS
-
-from . import poc_set, target_set, Routine
+from . import poc_set, target_set
+from .TextCleaner import default_cleaner
+from .HtmlExtractor import get_html_extractor
+from .Keywords import keyword_counts
+from .AddressParser import parse_address_header
+from .InternPool import intern_pool
 from .Entity import POC, Entity
+from .MimeWalker import MimeIndex, Attachment
+from .BodyGuard import Truncation, get_body_limits, limit_raw_body, limit_chars, keyword_text
+from .HtmlExtractor import extract_truncated
 # from helpers.clock import noArgClock
 
 M = TypeVar("M")
-nlp = English()
+
+# Picked once per process, HTML_EXTRACTOR=soup switches back to BeautifulSoup
+html_extractor = get_html_extractor()
 
 class CommNode:
     '''
     Attributes:
     -----------
-        labels: List[str]
-            a list of labels for each message
-        mimetypes: List[str]
-            a list of mimetypes included in the message
+        labels: Tuple[str, ...]
+            interned tuple of labels for each message
+        mimetypes: Tuple[str, ...]
+            interned tuple of mimetypes included in the message
+        attachments: Tuple[Attachment, ...]
+            filename, mimetype and size of every attachment
         subject: str
             Subject of the message being parsed
         html_body: str
@@ -47,15 +55,21 @@ class CommNode:
             Gmail API thread ID
         keywords: Counter
             Word frequency counter object
+        term_vector: Optional[Tuple[np.ndarray, np.ndarray]]
+            Hashed (indices, counts) of the keywords, set by the parse batch stage
+        truncated: Truncation
+            Body size limits the message ran into, NONE for almost every message
     '''
 
-    __slots__ = ['labels', 'mimetypes', 'subject',
+    __slots__ = ['labels', 'mimetypes', 'attachments', 'subject',
                  'html_body', 'plaintext_body', 'entities',
-                 'date', 'ip_address', 'msg_id', 'thread_id', 'keywords']
+                 'date', 'ip_address', 'msg_id', 'thread_id', 'keywords', 'term_vector',
+                 'truncated']
 
     def __init__(self,
-                 labels: List[str] = list(),
-                 mimetypes: List[str] = list(),
+                 labels: Tuple[str, ...] = (),
+                 mimetypes: Tuple[str, ...] = (),
+                 attachments: Tuple[Attachment, ...] = (),
                  subject: str = '',
                  html_body: str = '',
                  plaintext_body: str = '',
@@ -65,10 +79,13 @@ class CommNode:
                  msg_id: str = '',
                  thread_id: str = '',
                  keywords: Dict[str, int] = {},
+                 term_vector: Optional[Tuple['np.ndarray', 'np.ndarray']] = None,
+                 truncated: Truncation = Truncation.NONE,
                  ) -> None:
 
         self.labels = labels
         self.mimetypes = mimetypes
+        self.attachments = attachments
         self.subject = subject
         self.html_body = html_body
         self.plaintext_body = plaintext_body
@@ -78,6 +95,8 @@ class CommNode:
         self.msg_id = msg_id
         self.thread_id = thread_id
         self.keywords = keywords
+        self.term_vector = term_vector
+        self.truncated = truncated
 
     def __str__(self) -> str:
         pp = pprint.PrettyPrinter(depth=4)
@@ -97,7 +116,7 @@ class Builder(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def generateCommObject(self, message: M) -> 'CommNodeBuilder':
+    def generateCommObject(self, message: M, metadata_only: bool = False, keywords: bool = True) -> 'CommNodeBuilder':
         pass
 
     @abstractmethod
@@ -171,11 +190,6 @@ class Builder(metaclass=ABCMeta):
     def _parseHTMLBody(self, raw: bytes) -> None:
         pass
 
-    @staticmethod
-    @abstractmethod
-    def mrClean() -> None:
-        pass
-
     @abstractmethod
     def _parseTextBody(self, raw: bytes) -> None:
         pass
@@ -192,9 +206,10 @@ class CommNodeBuilder:
         encryptText(self, content: str) -> str
             Takes a content string and encrypts the data for storage in Postgres
 
-        generateCommObject(self, message: M) -> CommNodeBuilder
+        generateCommObject(self, message: M, metadata_only: bool = False, keywords: bool = True) -> CommNodeBuilder
             Takes a raw message and parses the necessary information to store in Postgres.
             Returns an instance of itself to pass into the get_result function.
+            Skips the body and keywords for metadata only messages.
 
         _parseHeaders(self, message: M) -> None
             Creates a generator function to walk over the message
@@ -222,7 +237,8 @@ class CommNodeBuilder:
             Static method to create an Entity
 
         _parseBody(self, message: M) -> None:
-            Generator function to walk the message parts and mimetypes and send to delegator
+            Indexes the part tree, nested multiparts included, and sends
+            the preferred body part to the delegator
 
         _delegateToBodyParser(self, target: str, *args, **kwargs) -> Callable[[str], None]
             Handles delegation of parsing by mimetype
@@ -230,10 +246,6 @@ class CommNodeBuilder:
         _parseHTMLBody(self, raw: bytes) -> None
             Cleans and parses raw message body data with mimetype text/html
 
-        mrClean() -> Generator[None, Union[str, Routine], str]:
-            Generator function to streamline text cleaning pipelines
-            and reduce memory / cpu consumption
-
         _parseTextBody(self, raw: bytes) -> None
             Cleans and parses raw message body data with mimetype text/plain
 
@@ -242,19 +254,24 @@ class CommNodeBuilder:
             returns a counter object with the document vocabulary
     '''
 
-    __slots__ = ['comm_obj', 'entities', 'mimetypes']
+    __slots__ = ['comm_obj', 'entities', 'mimetypes', 'attachments']
 
     def __init__(self) -> None:
         self.comm_obj = CommNode()
         self.entities = list()
-        self.mimetypes = list()
+        self.mimetypes = ()
+        self.attachments = ()
 
     def encryptText(self, content: str) -> str:
         pass
 
     # @noArgClock
     # Need a way to take raw input from gmail api and return a cleaned comm node
-    def generateCommObject(self, message: M) -> 'CommNodeBuilder':
+    def generateCommObject(self,
+                           message: M,
+                           metadata_only: bool = False,
+                           keywords: bool = True,
+                           ) -> 'CommNodeBuilder':
         '''
         Top level function that takes a raw Message object from a Gmail
         API response and parses the necessary information into a suitable format
@@ -264,6 +281,10 @@ class CommNodeBuilder:
         -------
             message: M
                 a raw message response from a messages.get() request to Gmail API
+            metadata_only: bool
+                True for format=metadata responses, skips the body and keywords
+            keywords: bool
+                False leaves keywords to the batch stage in parse_batch
         '''
 
         # Sets the date, ip_address, subject, and entity array variables
@@ -272,20 +293,28 @@ class CommNodeBuilder:
         self.comm_obj.entities = self.entities
         # Parses date from internal date ms unix epoch timestamp
         self._parseDate(message.get('internalDate'))
-        # Sets the html_body, plaintext_body, and mimetype array variables
-        self._parseBody(message)
-        # Sets the mimetype array on the comm_obj node
-        self.comm_obj.mimetypes = self.mimetypes
 
-        self.comm_obj.labels = message.get('labelIds', [])
+        self.comm_obj.labels = intern_pool.intern_tuple(message.get('labelIds', []))
         self.comm_obj.msg_id = message.get('id', '')
         self.comm_obj.thread_id = message.get('threadId', '')
 
-        if len(self.comm_obj.plaintext_body) > 0:
-            self.comm_obj.keywords = self._genKeywordCounter(self.comm_obj.plaintext_body)
+        # Metadata responses carry no body to parse
+        if metadata_only:
+            return self
 
-        elif len(self.comm_obj.html_body) > 0:
-            self.comm_obj.keywords = self._genKeywordCounter(self.comm_obj.html_body)
+        # Sets the html_body, plaintext_body, mimetype and attachment array variables
+        self._parseBody(message)
+        # Sets the mimetype and attachment arrays on the comm_obj node
+        self.comm_obj.mimetypes = self.mimetypes
+        self.comm_obj.attachments = self.attachments
+
+        if not keywords:
+            return self
+
+        # Plaintext body first, falling back to the html body, capped at the token limit
+        text = keyword_text(self.comm_obj)
+        if len(text) > 0:
+            self.comm_obj.keywords = self._genKeywordCounter(text)
 
 
         return self
@@ -384,59 +413,25 @@ class CommNodeBuilder:
             poc_name: str
                 To, From, Cc, Bcc
             poc_value: str
-                eg: 'vinyl me, please <vinyl@gmail.com>, Qxhna Titcomb
+                eg: '"vinyl me, please" <vinyl@gmail.com>, Qxhna Titcomb
                 <qxhna.titcomb@techstars.com>, loop-zoop@gmail.com
             msg_id: str
                 gmail api message id string
         '''
 
-        # initialize empty list
-        # entities = list(self.comm_obj.entities)
-
         # POC string is the 'Part Of Conversation' in uppercase
         # Used to create an instance of Enum for Entity
-        poc_string = header.get('name', '').upper()
-        poc_value = header.get('value', '')
-
-        # set of all emails found by regex to help
-        # with separating the names from the emails
-        emails = set(re.findall(r"<?(\S*@[^>, ]*)", poc_value))
-
-        # Generates all individual words from POC header value
-        string_gen = (string for string in re.findall(r"[^<,> ]*", poc_value))
-
-        entity_name = ''
-        entity_email = ''
-
-        while True:
-            try:
-                curr_string = next(string_gen)
-            except StopIteration:
-                break
-
-            # if the current string is one of the emails, create an entity
-            if curr_string in emails:
-                poc = POC[poc_string]
-                entity_email = curr_string.lower().replace('"', '')
-                entity_domain = entity_email.split('@')[1]
-                entity = self.createEntity(
-                    entity_email,
-                    entity_name.replace('"', ''),
-                    entity_domain,
-                    msg_id,
-                    poc
-                )
-
-                # store it in the container
-                self.entities.append(entity)
-
-                # Reset name and email after appending to container
-                entity_name = ''
-                entity_email = ''
-
-            # Otherwise, extend the entity name until an email is found
-            else:
-                entity_name += f' {curr_string}'
+        poc = POC[header.get('name', '').upper()]
+
+        # Parsed once per distinct header value, repeats are a cache lookup
+        for name, email, domain in parse_address_header(header.get('value', '')):
+            self.entities.append(self.createEntity(
+                intern_pool.intern(email),
+                intern_pool.intern(name),
+                intern_pool.intern(domain),
+                msg_id,
+                poc
+            ))
 
         return
 
@@ -455,50 +450,29 @@ class CommNodeBuilder:
     #   Chooses which text should be parsed and cleaned
     def _parseBody(self, message: M) -> None:
         '''
-        Delegates raw message body to the appropriate parser to clean and store
-        the message body text
+        Delegates the preferred message body to the appropriate parser to clean
+        and store the message body text. The part tree is only indexed, so
+        attachments and the body that isn't picked are never decoded.
         Params:
         -------
             message: M
                 A message response from Gmail API
 
         '''
+        index = MimeIndex.from_payload(message.get('payload', {}))
 
-        # dict where keys are the mimetypes and the values are the raw messages
-        mime_dict = {}
-
+        self.mimetypes = intern_pool.intern_tuple(index.mimetypes)
+        self.attachments = tuple(
+            Attachment(attachment.filename, intern_pool.intern(attachment.mimetype), attachment.size)
+            for attachment in index.attachments
+        )
 
-        # If the message is multi-part
-        if 'multipart' in message.get('payload', {}).get('mimeType', ''):
-            # Create a generator to iterate over the parts and delegate
-            # the part's message to the appropriate parser
-            parts = (part for part in message['payload']['parts'])
-
-            while True:
-                try:
-                    curr = next(parts)
-                except StopIteration:
-                    break
-
-                mimetype = curr.get('mimeType', '')
-                raw_body = curr.get('body', {}).get('data', '')
-                mime_dict[mimetype] = raw_body
-
-        else:
-            mimetype = message.get('payload', {}).get('mimeType', '')
-            raw_body = message.get('payload', {}).get('body', {}).get('data', '')
-            mime_dict[mimetype] = raw_body
-
-        options = mime_dict.keys()
-        self.mimetypes = [key for key in mime_dict.keys()]
-
-        if 'text/plain' in options:
-            self._delegateToBodyParser('text/plain', mime_dict['text/plain'])
-            return
-
-        elif 'text/html' in options:
-            self._delegateToBodyParser('text/html', mime_dict['text/html'])
-            return
+        mimetype, raw_body = index.body()
+        if mimetype is not None:
+            # Oversized bodies are cut before they're decoded
+            raw_body, truncated = limit_raw_body(raw_body)
+            self.comm_obj.truncated |= truncated
+            self._delegateToBodyParser(mimetype, raw_body)
 
         return
 
@@ -532,47 +506,19 @@ class CommNodeBuilder:
         '''
 
         decoded = base64.urlsafe_b64decode(raw)
-        soup = BeautifulSoup(decoded, "lxml")
-        body = soup.find('body')
-        # Remove all html that isn't the target message
-        quotes = body.find("div", {"class": "gmail_quote"})
-        # Finds all style tags to remove them from the output
-        styles = body.find_all('style')
-        # Finds all script tags to remove them from the output
-        scripts = body.find_all('script')
-
-        if quotes is not None:
-            quotes.decompose()
+        max_chars = get_body_limits().max_chars
 
-        for style in styles:
-            style.decompose()
-
-        for script in scripts:
-            script.decompose()
+        # A document with more bytes than the char limit may hold more text than it too
+        if max_chars and len(decoded) > max_chars:
+            extracted, cut = extract_truncated(decoded, max_chars)
+            if cut:
+                self.comm_obj.truncated |= Truncation.CHARS
+        else:
+            extracted = html_extractor(decoded)
 
-        extracted = body.get_text(separator=' ', strip=True)
         self.comm_obj.html_body = extracted.lower()
         return
 
-    @staticmethod
-    def mrClean() -> Generator[None, Union[str, Routine], str]:
-        ''' Generator function that handles text cleaning pipelines '''
-        base_str = yield  # String to clean
-        while True:
-            op = yield  # text cleaning Routine
-            if op is None:
-                break
-            try:
-                base_str = re.sub(op.pattern, op.repl, base_str)
-                # For debugging
-                # print(f'Finished {op.op_name} \nOutput: {base_str} \n\n')
-            except Exception as e:
-                print(f'Error performing {op.op_name}: {e}')
-                continue
-
-        return base_str.lower()
-
-
     def _parseTextBody(self, raw: bytes) -> None:
         '''
         Instance method to clean and parse raw message body data.
@@ -583,61 +529,29 @@ class CommNodeBuilder:
                 Raw base64 encoded message body with mimetype text/plain
         '''
 
-        routines = [
-            Routine(r"\r", '', 'removing returns'),
-            Routine(r"\n", ' ', 'removing newlines'),
-            Routine(r"On\s\w{3},?\s.*?<\s?\S*?@\S*?\s?>.*", '', 'removing email quotes'),
-            Routine(r"<.*?\/>|<.*?><\/.*?>", '', 'removing HTML elements'),
-            Routine(r"http?s?://\S+", '', 'removing urls'),
-            Routine(r"\w*?=\"\S+|\S*?:\s?\S*?;\"?", '', 'removing css styles'),
-            Routine(r" {1,}", ' ', 'removing extra spaces'),
-            Routine(r"<\S*?>", '', 'removing HTML tags'),
-            None
-        ]
-
-        decoded = base64.urlsafe_b64decode(raw).decode('utf-8')
-        cleaned = ''
-
-        text_cleaner = self.mrClean()
-        next(text_cleaner)  # Prime the Generator
-        text_cleaner.send(decoded)  # Send the text that needs cleaning
-
-        for routine in routines:
-            try:
-                text_cleaner.send(routine)
-            except StopIteration as exc:
-                cleaned = exc.value
+        # A body cut at the byte limit can end partway through a character
+        errors = 'ignore' if self.comm_obj.truncated & Truncation.BYTES else 'strict'
+        decoded = base64.urlsafe_b64decode(raw).decode('utf-8', errors)
 
-        clean_words = ' '.join(re.findall(r"[a-zA-Z']{2,}", cleaned))
+        decoded, truncated = limit_chars(decoded)
+        self.comm_obj.truncated |= truncated
+
+        clean_words = ' '.join(default_cleaner.clean(decoded))
         self.comm_obj.plaintext_body = clean_words
         return
 
     # @noArgClock
     def _genKeywordCounter(self, text: str) -> Counter:
-        ''' Creates a Spacy NLP object with the cleaned message body text,
-        tokenizes the data, removes stopwords and punctuation,
-        then returns a Counter object containing word occurrences.
+        ''' Tokenizes the cleaned message body text, removes stopwords
+        and punctuation, then returns a Counter object containing word occurrences.
+        Batches should go through Keywords.keyword_counts instead.
 
         Params:
         -------
             text: str
                 Input string to clean and count keywords from
         '''
-        spacy_doc = nlp(text)
-
-        token_list = (token for token in spacy_doc)
-        filtered = []
-
-        while True:
-            try:
-                curr = next(token_list)
-            except StopIteration:
-                break
-
-            if curr.is_stop is False and curr.is_punct is False:
-                filtered.append(curr.text)
-
-        return Counter(filtered)
+        return keyword_counts([text])[0]
 
     # @noArgClock
     def get_result(self) -> CommNode:
@@ -650,13 +564,15 @@ class CommNodeBuildManager:
 
     Methods:
     --------
-        construct(message: M)
+        construct(message: M, metadata_only: bool = False, keywords: bool = True)
             Takes a message response from Gmail api and returns a new instance
             of CommNode data class
     '''
 
     @staticmethod
-    def construct(message: M) -> CommNode:
+    def construct(message: M, metadata_only: bool = False, keywords: bool = True) -> CommNode:
         return CommNodeBuilder().generateCommObject(
-            message
+            message,
+            metadata_only,
+            keywords
         ).get_result()
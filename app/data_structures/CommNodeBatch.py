@@ -0,0 +1,240 @@
+import json
+
+from datetime import datetime
+from typing import List, Tuple, Iterable, Iterator, Sequence
+
+import numpy as np
+
+from .CommNode import CommNode
+from .Entity import POC, Entity
+from .MimeWalker import Attachment
+from .BodyGuard import Truncation
+from .TermMatrix import hash_term, N_FEATURES
+from .InternPool import InternPool, intern_pool
+
+# POC values are stored as int8, names are what the entities.poc enum column takes
+_POC_NAMES = {poc.value: poc.name for poc in POC}
+
+
+def _concat(arrays: Sequence[np.ndarray], dtype: type) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+
+
+def _offsets(lengths: Iterable[int]) -> np.ndarray:
+    ''' Row start offsets with a trailing end offset, like a csr indptr '''
+    return np.concatenate(([0], np.cumsum(np.fromiter(lengths, dtype=np.int64)))).astype(np.int64)
+
+
+class CommNodeBatch:
+    '''
+    Struct of arrays for a batch of parsed messages. Every per-message
+    field is one column, entities are one flattened table with an offsets
+    array into it and the hashed term vectors are stacked the same way.
+    Built in the parse worker, so the event loop only unpickles a handful
+    of lists and arrays per batch and hands the columns to the bulk loaders
+    without building a dict for every row.
+
+    Attributes:
+    -----------
+        msg_ids / thread_ids: List[str]
+            Gmail API message and thread ids
+        dates: np.ndarray
+            int64 epoch ms of every message (internalDate)
+        subjects / html_bodies / text_bodies / ip_addresses: List[str]
+            Parsed header and body text
+        labels / mimetypes: List[Tuple[str, ...]]
+            Interned label and mimetype tuples
+        keywords: List[str]
+            Keyword counters already serialized to json for the comm_nodes table
+        attachments: List[str]
+            Attachment metadata serialized to json for the comm_nodes table
+        truncated: np.ndarray
+            int8 Truncation mask of every message
+        entity_offsets: np.ndarray
+            int64, entities of message i are rows entity_offsets[i]:entity_offsets[i+1]
+        entity_emails / entity_names / entity_domains: List[str]
+            Flattened entity table
+        entity_pocs: np.ndarray
+            int8 POC value of every entity
+        term_mask: np.ndarray
+            bool, messages that carry a term vector
+        term_indptr / term_indices / term_counts: np.ndarray
+            csr layout of the hashed term vectors, empty rows where term_mask is False
+        terms: Dict[int, str]
+            A term for every hashed column used in the batch
+        address_cache: Dict[str, int]
+            Address header cache hits and misses while the batch was parsed,
+            the cache lives in the parse worker so the counts travel with the batch
+
+    Methods:
+    --------
+        from_nodes(nodes: Iterable[CommNode], n_features: int = N_FEATURES) -> CommNodeBatch
+            Packs CommNodes into columns
+        concat(batches: Sequence[CommNodeBatch]) -> CommNodeBatch
+            Stacks batches into one
+        datetimes(self) -> List[datetime]
+            dates column as the naive datetimes CommNode.date holds
+        entity_msg_ids(self) -> List[str]
+            Message id for every entity row
+        comm_node_records(self) -> Iterator[Tuple]
+            Rows in COMM_NODE_COLUMNS order
+        entity_records(self) -> Iterator[Tuple]
+            Rows in ENTITY_COLUMNS order
+        to_nodes(self) -> List[CommNode]
+            Unpacks the batch back into CommNodes
+        intern(self, pool: InternPool = intern_pool) -> CommNodeBatch
+            Swaps the repeated string columns for the pooled copies of this process
+    '''
+    __slots__ = ['msg_ids', 'thread_ids', 'dates', 'subjects', 'html_bodies',
+                 'text_bodies', 'ip_addresses', 'labels', 'mimetypes', 'keywords', 'attachments', 'truncated',
+                 'entity_offsets', 'entity_emails', 'entity_names', 'entity_domains',
+                 'entity_pocs', 'term_mask', 'term_indptr', 'term_indices',
+                 'term_counts', 'terms', 'address_cache']
+
+    COMM_NODE_COLUMNS = ('message_id', 'html_body', 'text_body', 'mimetypes',
+                         'ip_address', 'subject', 'date', 'keywords', 'labels', 'attachments',
+                         'truncated')
+
+    ENTITY_COLUMNS = ('email', 'name', 'domain', 'msg_id', 'poc')
+
+    def __init__(self, **columns) -> None:
+        for name in self.__slots__:
+            setattr(self, name, columns[name])
+
+    def __len__(self) -> int:
+        return len(self.msg_ids)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[CommNode], n_features: int = N_FEATURES) -> 'CommNodeBatch':
+        nodes = list(nodes)
+        entities = [entity for node in nodes for entity in node.entities]
+        vectors = [node.term_vector for node in nodes if node.term_vector is not None]
+
+        terms = {}
+        for node in nodes:
+            if node.term_vector is not None:
+                for term in node.keywords:
+                    terms.setdefault(hash_term(term, n_features), term)
+
+        return cls(
+            msg_ids=[node.msg_id for node in nodes],
+            thread_ids=[node.thread_id for node in nodes],
+            dates=np.fromiter((round(node.date.timestamp() * 1000) for node in nodes),
+                              dtype=np.int64, count=len(nodes)),
+            subjects=[node.subject for node in nodes],
+            html_bodies=[node.html_body for node in nodes],
+            text_bodies=[node.plaintext_body for node in nodes],
+            ip_addresses=[node.ip_address for node in nodes],
+            labels=[node.labels for node in nodes],
+            mimetypes=[node.mimetypes for node in nodes],
+            keywords=[json.dumps(node.keywords) for node in nodes],
+            attachments=[json.dumps([attachment._asdict() for attachment in node.attachments])
+                         for node in nodes],
+            truncated=np.fromiter((node.truncated for node in nodes), dtype=np.int8, count=len(nodes)),
+            entity_offsets=_offsets(len(node.entities) for node in nodes),
+            entity_emails=[entity.email for entity in entities],
+            entity_names=[entity.name for entity in entities],
+            entity_domains=[entity.domain for entity in entities],
+            entity_pocs=np.fromiter((entity.poc.value for entity in entities),
+                                    dtype=np.int8, count=len(entities)),
+            term_mask=np.fromiter((node.term_vector is not None for node in nodes),
+                                  dtype=np.bool_, count=len(nodes)),
+            term_indptr=_offsets(0 if node.term_vector is None else len(node.term_vector[0])
+                                 for node in nodes),
+            term_indices=_concat([indices for indices, _ in vectors], np.int32),
+            term_counts=_concat([counts for _, counts in vectors], np.int32),
+            terms=terms,
+            address_cache={'hits': 0, 'misses': 0},
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence['CommNodeBatch']) -> 'CommNodeBatch':
+        if len(batches) == 1:
+            return batches[0]
+
+        def stacked_offsets(name: str) -> np.ndarray:
+            # Shift every batch's offsets past the rows of the batches before it
+            arrays = [getattr(batch, name) for batch in batches]
+            starts = np.cumsum([0] + [array[-1] for array in arrays[:-1]])
+            return np.concatenate([[0]] + [array[1:] + start for array, start in zip(arrays, starts)]).astype(np.int64)
+
+        columns = {}
+        for name in cls.__slots__:
+            values = [getattr(batch, name) for batch in batches]
+
+            if name in ('entity_offsets', 'term_indptr'):
+                columns[name] = stacked_offsets(name)
+            elif name == 'terms':
+                columns[name] = {column: term for value in values for column, term in value.items()}
+            elif name == 'address_cache':
+                columns[name] = {key: sum(value[key] for value in values) for key in ('hits', 'misses')}
+            elif isinstance(values[0], np.ndarray):
+                columns[name] = _concat(values, values[0].dtype)
+            else:
+                columns[name] = [item for value in values for item in value]
+
+        return cls(**columns)
+
+    def intern(self, pool: InternPool = intern_pool) -> 'CommNodeBatch':
+        '''
+        Unpickling gives every batch its own copies, so values interned in the
+        parse worker are only shared within the batch. Run on the receiving
+        side to share them across every batch the process is holding.
+        '''
+        for name in ('entity_emails', 'entity_names', 'entity_domains'):
+            setattr(self, name, [pool.intern(value) for value in getattr(self, name)])
+
+        for name in ('labels', 'mimetypes'):
+            setattr(self, name, [pool.intern_tuple(values) for values in getattr(self, name)])
+
+        return self
+
+    def datetimes(self) -> List[datetime]:
+        return [datetime.fromtimestamp(ms / 1000.0) for ms in self.dates.tolist()]
+
+    def entity_msg_ids(self) -> List[str]:
+        counts = np.diff(self.entity_offsets).tolist()
+        return [msg_id for msg_id, count in zip(self.msg_ids, counts) for _ in range(count)]
+
+    def comm_node_records(self) -> Iterator[Tuple]:
+        return zip(self.msg_ids, self.html_bodies, self.text_bodies, self.mimetypes,
+                   self.ip_addresses, self.subjects, self.datetimes(), self.keywords, self.labels,
+                   self.attachments, self.truncated.tolist())
+
+    def entity_records(self) -> Iterator[Tuple]:
+        pocs = [_POC_NAMES[value] for value in self.entity_pocs.tolist()]
+        return zip(self.entity_emails, self.entity_names, self.entity_domains,
+                   self.entity_msg_ids(), pocs)
+
+    def to_nodes(self) -> List[CommNode]:
+        dates = self.datetimes()
+        truncated = self.truncated.tolist()
+        entity_offsets = self.entity_offsets.tolist()
+        term_indptr = self.term_indptr.tolist()
+        entities = [Entity(*record[:4], POC[record[4]]) for record in self.entity_records()]
+
+        nodes = []
+        for i, msg_id in enumerate(self.msg_ids):
+            term_vector = None
+            if self.term_mask[i]:
+                start, stop = term_indptr[i], term_indptr[i + 1]
+                term_vector = (self.term_indices[start:stop], self.term_counts[start:stop])
+
+            nodes.append(CommNode(
+                labels=self.labels[i],
+                mimetypes=self.mimetypes[i],
+                attachments=tuple(Attachment(**attachment) for attachment in json.loads(self.attachments[i])),
+                subject=self.subjects[i],
+                html_body=self.html_bodies[i],
+                plaintext_body=self.text_bodies[i],
+                entities=entities[entity_offsets[i]:entity_offsets[i + 1]],
+                date=dates[i],
+                ip_address=self.ip_addresses[i],
+                msg_id=msg_id,
+                thread_id=self.thread_ids[i],
+                keywords=json.loads(self.keywords[i]),
+                term_vector=term_vector,
+                truncated=Truncation(truncated[i]),
+            ))
+
+        return nodes
@@ -0,0 +1,200 @@
+import asyncio
+
+from collections import deque
+from typing import Optional, Dict, Callable, Awaitable, Hashable
+
+# Lane for jobs that aren't tied to a user
+SHARED_LANE = ''
+
+
+class _Lane:
+    ''' Per-user sub-queue '''
+    __slots__ = ['jobs', 'weight', 'deficit', 'in_flight', 'putters']
+
+    def __init__(self, weight: int) -> None:
+        self.jobs = deque()
+        self.weight = weight
+        self.deficit = 0
+        self.in_flight = 0
+        self.putters = deque()
+
+
+class FairQueue:
+    '''
+    Drop-in replacement for the asyncio.Queue in front of the gmail workers that
+    keeps a sub-queue per user and hands jobs out by deficit round robin. Every
+    round a user may take as many jobs as their weight, and a user with
+    max_in_flight * weight jobs running is skipped until one finishes, so a
+    large backfill can't starve everyone else.
+
+    Attributes:
+    -----------
+        maxsize: int
+            Max number of queued jobs per user, put() waits beyond it. <= 0 is unbounded
+        max_in_flight: int
+            Number of jobs a user of weight 1 may have running at once
+        weight_lookup: Optional[Callable[[str], Awaitable[int]]]
+            Resolves a user's weight the first time they queue a job
+
+    Methods:
+    --------
+        put(self, job: Callable, owner: Optional[str] = None) -> None
+            Queues a job on its owner's lane, waiting while the lane is full
+        get(self) -> Callable
+            Waits for the next job in fair order and marks it in flight
+        task_done(self, job: Callable) -> None
+            Frees the owner's in flight slot once the job is finished
+        qsize(self) -> int
+            Number of queued jobs across every lane
+    '''
+    Empty = asyncio.QueueEmpty
+
+    def __init__(self,
+                 maxsize: int = 0,
+                 max_in_flight: int = 2,
+                 weight_lookup: Optional[Callable[[str], Awaitable[int]]] = None,
+                 ) -> None:
+        self.maxsize = maxsize
+        self.max_in_flight = max_in_flight
+        self.weight_lookup = weight_lookup
+        self._lanes = dict()  # owner -> _Lane
+        self._active = deque()  # owners with queued jobs, in round robin order
+        self._owners = dict()  # in flight job -> owner
+        self._getters = deque()
+
+    def qsize(self) -> int:
+        return sum(len(lane.jobs) for lane in self._lanes.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def in_flight(self, owner: Optional[str] = None) -> int:
+        lane = self._lanes.get(owner or SHARED_LANE)
+        return lane.in_flight if lane is not None else 0
+
+    @staticmethod
+    def _wake(waiters: deque) -> None:
+        ''' Wakes every waiter, each re-checks its own condition '''
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @staticmethod
+    async def _wait(waiters: deque) -> None:
+        waiter = asyncio.get_event_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            waiter.cancel()
+            try:
+                waiters.remove(waiter)
+            except ValueError:
+                pass
+            raise
+
+    async def _lane(self, owner: Hashable) -> _Lane:
+        lane = self._lanes.get(owner)
+
+        if lane is None:
+            weight = 1
+            if self.weight_lookup is not None and owner != SHARED_LANE:
+                try:
+                    weight = max(1, int(await self.weight_lookup(owner)))
+                except Exception as e:
+                    print(f'error looking up scheduler weight for {owner}: {e}')
+
+            # Another put may have created it while we looked the weight up
+            lane = self._lanes.setdefault(owner, _Lane(weight))
+
+        return lane
+
+    def _cap(self, lane: _Lane) -> int:
+        return self.max_in_flight * lane.weight
+
+    async def put(self, job: Callable, owner: Optional[str] = None) -> None:
+        owner = owner or SHARED_LANE
+        lane = await self._lane(owner)
+
+        while self.maxsize > 0 and len(lane.jobs) >= self.maxsize:
+            await self._wait(lane.putters)
+
+        lane.jobs.append(job)
+        if owner not in self._active:
+            self._active.append(owner)
+
+        self._wake(self._getters)
+
+    def _next_owner(self) -> Optional[Hashable]:
+        ''' Deficit round robin over the lanes that have jobs and a free slot '''
+        checked = 0
+
+        while checked < len(self._active):
+            owner = self._active[0]
+            lane = self._lanes.get(owner)
+
+            if lane is None or len(lane.jobs) == 0:
+                self._active.popleft()
+                if lane is not None:
+                    lane.deficit = 0
+                continue
+
+            if lane.in_flight >= self._cap(lane):
+                self._active.rotate(-1)
+                checked += 1
+                continue
+
+            # Fresh turn, top the lane up with its quantum
+            if lane.deficit <= 0:
+                lane.deficit += lane.weight
+
+            lane.deficit -= 1
+
+            # Turn is used up, the next lane goes first next time
+            if lane.deficit <= 0:
+                self._active.rotate(-1)
+
+            return owner
+
+        return None
+
+    async def get(self) -> Callable:
+        while True:
+            owner = self._next_owner()
+            if owner is not None:
+                break
+
+            await self._wait(self._getters)
+
+        return self._take(owner)
+
+    def get_nowait(self) -> Callable:
+        owner = self._next_owner()
+        if owner is None:
+            raise self.Empty()
+
+        return self._take(owner)
+
+    def _take(self, owner: Hashable) -> Callable:
+        lane = self._lanes[owner]
+        job = lane.jobs.popleft()
+        lane.in_flight += 1
+        self._owners[job] = owner
+
+        self._wake(lane.putters)
+        return job
+
+    def task_done(self, job: Callable) -> None:
+        owner = self._owners.pop(job, None)
+        if owner is None:
+            return
+
+        lane = self._lanes[owner]
+        lane.in_flight -= 1
+
+        # Forget idle users so the weight is looked up fresh next time
+        if lane.in_flight == 0 and len(lane.jobs) == 0 and len(lane.putters) == 0:
+            del self._lanes[owner]
+
+        self._wake(self._getters)
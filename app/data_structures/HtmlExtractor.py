@@ -0,0 +1,205 @@
+import os
+
+from typing import List, Dict, Callable, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+from lxml import etree
+
+# Subtrees that never make it into the extracted text
+SKIPPED_TAGS = frozenset(['style', 'script'])
+QUOTE_CLASS = 'gmail_quote'
+
+# Bytes handed to lxml at a time by the truncating extractor
+FEED_CHUNK_SIZE = 64 * 1024
+
+
+def extract_soup(decoded: bytes) -> str:
+    '''
+    Original extractor, builds a full BeautifulSoup tree and strips the
+    quote, style and script elements out of it before reading the text.
+    '''
+    soup = BeautifulSoup(decoded, "lxml")
+    body = soup.find('body')
+    # Remove all html that isn't the target message
+    quotes = body.find("div", {"class": "gmail_quote"})
+    # Finds all style tags to remove them from the output
+    styles = body.find_all('style')
+    # Finds all script tags to remove them from the output
+    scripts = body.find_all('script')
+
+    if quotes is not None:
+        quotes.decompose()
+
+    for style in styles:
+        style.decompose()
+
+    for script in scripts:
+        script.decompose()
+
+    return body.get_text(separator=' ', strip=True)
+
+
+class _TextTarget:
+    '''
+    lxml parser target that collects the body text while the document is
+    parsed, without building a tree. Strings are split at the same places
+    BeautifulSoup splits them (tags, comments, doctypes) so joining the
+    stripped strings matches get_text(separator=' ', strip=True).
+    With max_chars set, full turns True once that much text is collected.
+    '''
+    __slots__ = ['strings', 'found_body', 'max_chars', 'chars', '_in_body',
+                 '_skip_depth', '_quote_seen', '_buffer']
+
+    def __init__(self, max_chars: Optional[int] = None) -> None:
+        self.strings = []
+        self.found_body = False
+        self.max_chars = max_chars
+        # Length of the joined strings so far
+        self.chars = -1
+        self._in_body = 0
+        # > 0 while inside a dropped subtree
+        self._skip_depth = 0
+        # Only the first gmail_quote is dropped, like soup.find
+        self._quote_seen = False
+        self._buffer = []
+
+    def _flush(self) -> None:
+        if self._buffer:
+            text = ''.join(self._buffer).strip()
+            if text:
+                self.strings.append(text)
+                self.chars += len(text) + 1
+            self._buffer = []
+
+    @property
+    def full(self) -> bool:
+        return self.max_chars is not None and self.chars >= self.max_chars
+
+    def start(self, tag: str, attrib: Dict[str, str], nsmap: Optional[Dict[str, str]] = None) -> None:
+        self._flush()
+
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+
+        if self._in_body:
+            self._in_body += 1
+
+            if tag in SKIPPED_TAGS:
+                self._skip_depth = 1
+            elif tag == 'div' and not self._quote_seen \
+                    and QUOTE_CLASS in attrib.get('class', '').split():
+                self._quote_seen = True
+                self._skip_depth = 1
+
+        elif tag == 'body' and not self.found_body:
+            self.found_body = True
+            self._in_body = 1
+
+    def end(self, tag: str) -> None:
+        self._flush()
+
+        if self._skip_depth:
+            self._skip_depth -= 1
+            # Still inside the dropped subtree, its children never counted towards _in_body
+            if self._skip_depth:
+                return
+
+        if self._in_body:
+            self._in_body -= 1
+
+    def data(self, data: str) -> None:
+        if self._in_body and not self._skip_depth:
+            self._buffer.append(data)
+
+    def comment(self, text: str) -> None:
+        self._flush()
+
+    def pi(self, target: str, data: Optional[str] = None) -> None:
+        self._flush()
+
+    def doctype(self, *args) -> None:
+        self._flush()
+
+    def close(self) -> List[str]:
+        self._flush()
+        return self.strings
+
+
+def extract_lxml(decoded: bytes) -> str:
+    '''
+    Streams the document through lxml's HTML parser, dropping style, script
+    and the first gmail_quote subtree as they are parsed and collecting the
+    body text in the same pass. Encodings are tried in the order
+    BeautifulSoup tries them, anything lxml rejects or a document without
+    a body goes through the soup extractor instead.
+    '''
+    detector = EncodingDetector(decoded, is_html=True)
+
+    for encoding in detector.encodings:
+        target = _TextTarget()
+        parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True, encoding=encoding)
+
+        try:
+            parser.feed(detector.markup)
+            strings = parser.close()
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+
+        if not target.found_body:
+            break
+
+        return ' '.join(strings)
+
+    return extract_soup(decoded)
+
+
+def extract_truncated(decoded: bytes, max_chars: int) -> Tuple[str, bool]:
+    '''
+    Streaming extractor for oversized documents. The markup is fed to lxml
+    in chunks and parsing stops as soon as max_chars of body text have been
+    collected, so the rest of the document is never parsed. Returns the text
+    cut to max_chars and whether anything was cut.
+    '''
+    detector = EncodingDetector(decoded, is_html=True)
+
+    for encoding in detector.encodings:
+        target = _TextTarget(max_chars)
+        parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True, encoding=encoding)
+
+        try:
+            markup = detector.markup
+            for start in range(0, len(markup), FEED_CHUNK_SIZE):
+                parser.feed(markup[start:start + FEED_CHUNK_SIZE])
+                if target.full:
+                    break
+
+            strings = parser.close()
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+
+        if not target.found_body:
+            break
+
+        text = ' '.join(strings)
+        return text[:max_chars], len(text) > max_chars
+
+    text = extract_soup(decoded)
+    return text[:max_chars], len(text) > max_chars
+
+
+EXTRACTORS = {
+    'lxml': extract_lxml,
+    'soup': extract_soup,
+}
+
+
+def get_html_extractor(name: Optional[str] = None) -> Callable[[bytes], str]:
+    ''' Returns the extractor picked by name or the HTML_EXTRACTOR env var, lxml by default '''
+    name = name or os.environ.get('HTML_EXTRACTOR', 'lxml')
+
+    if name not in EXTRACTORS:
+        raise ValueError(f'Unknown html extractor: {name}')
+
+    return EXTRACTORS[name]
@@ -0,0 +1,86 @@
+import os
+
+from typing import Iterable, Tuple, Dict, Hashable, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+# Distinct values kept per process, the pool starts over once it fills up
+INTERN_POOL_SIZE = int(os.environ.get('INTERN_POOL_SIZE', 65536))
+
+
+class InternPool:
+    '''
+    Bounded pool of canonical copies for the small values that repeat across
+    messages (emails, domains, names, labels, mimetypes). Equal values handed
+    to intern() come back as one shared object, so a scrape holds each of them
+    once instead of once per message. The pool is per process: nodes pickled
+    back from a parse worker only keep the sharing within their batch through
+    pickle's memo, CommNodeBatch.intern re-pools them on the receiving side.
+
+    Attributes:
+    -----------
+        maxsize: int
+            Number of distinct values to hold, 0 turns interning off
+        hits / misses: int
+            Lookup counters
+
+    Methods:
+    --------
+        intern(self, value: T) -> T
+            Returns the pooled copy of value, pooling it first if it's new
+        intern_tuple(self, values: Iterable[T]) -> Tuple[T, ...]
+            Interns every value and the resulting tuple itself
+        stats(self) -> Dict[str, any]
+            Hit rate and size of the pool
+    '''
+    __slots__ = ['maxsize', 'hits', 'misses', '_pool']
+
+    def __init__(self, maxsize: int = INTERN_POOL_SIZE) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._pool = {}
+
+    def __len__(self) -> int:
+        return len(self._pool)
+
+    def intern(self, value: T) -> T:
+        pooled = self._pool.get(value)
+        if pooled is not None:
+            self.hits += 1
+            return pooled
+
+        self.misses += 1
+        if self.maxsize <= 0:
+            return value
+
+        # Dropping everything keeps the bookkeeping free, hot values come right back
+        if len(self._pool) >= self.maxsize:
+            self._pool.clear()
+
+        self._pool[value] = value
+        return value
+
+    def intern_tuple(self, values: Iterable[T]) -> Tuple[T, ...]:
+        return self.intern(tuple(self.intern(value) for value in values))
+
+    def clear(self) -> None:
+        ''' Empties the pool and resets the counters '''
+        self._pool.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, any]:
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self._pool),
+            'max_size': self.maxsize,
+        }
+
+
+# Shared by every builder in the process
+intern_pool = InternPool()
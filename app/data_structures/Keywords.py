@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import List, Iterable, Optional
+
+from spacy.attrs import ORTH
+from spacy.lang.en import English
+from spacy.lang.en.stop_words import STOP_WORDS
+
+nlp = English()
+
+# Batch stage settings, set in every parse worker by configure_keywords
+_batch_size = 256
+_n_process = 1
+
+# orth id -> True for stop words and punctuation, filled in as new tokens show up
+_skip = {nlp.vocab.strings.add(word): True for word in STOP_WORDS}
+
+
+def configure_keywords(batch_size: int, n_process: int) -> None:
+    ''' Sets the batch size and spaCy process count, used as the parse pool initializer '''
+    global _batch_size, _n_process
+    _batch_size = batch_size
+    _n_process = n_process
+
+
+def _is_skipped(orth: int) -> bool:
+    skip = _skip.get(orth)
+
+    if skip is None:
+        lexeme = nlp.vocab[orth]
+        skip = _skip[orth] = lexeme.is_stop or lexeme.is_punct
+
+    return skip
+
+
+def count_keywords(doc: 'Doc') -> Counter:
+    ''' Counts every token in a tokenized doc that isn't a stop word or punctuation '''
+    strings = nlp.vocab.strings
+    counts = Counter()
+
+    # Counting orth ids in C beats walking Token objects or doc.count_by
+    for orth, count in Counter(doc.to_array(ORTH).tolist()).items():
+        if not _is_skipped(orth):
+            counts[strings[orth]] = count
+
+    return counts
+
+
+def keyword_counts(texts: Iterable[str],
+                   batch_size: Optional[int] = None,
+                   n_process: Optional[int] = None,
+                   ) -> List[Counter]:
+    '''
+    Batch keyword stage. Tokenizes many cleaned bodies at once and returns
+    a keyword Counter per body, in order.
+
+    Params:
+    -------
+        texts: Iterable[str]
+            Cleaned message bodies
+        batch_size: Optional[int]
+            Number of texts handed to spaCy at once, defaults to the configured size
+        n_process: Optional[int]
+            Number of spaCy processes, > 1 goes through nlp.pipe. Parse workers
+            are processes already, so this stays at 1 unless they are few
+    '''
+    batch_size = batch_size or _batch_size
+    n_process = n_process or _n_process
+
+    if n_process > 1:
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+    else:
+        # The blank English pipeline is only a tokenizer, skip the pipeline machinery
+        docs = nlp.tokenizer.pipe(texts, batch_size=batch_size)
+
+    return [count_keywords(doc) for doc in docs]
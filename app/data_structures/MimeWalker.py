@@ -0,0 +1,118 @@
+from collections import namedtuple
+from typing import List, Dict, Tuple, Optional, Iterator
+
+# Body mimetypes in the order they're picked
+BODY_PREFERENCE = ('text/plain', 'text/html')
+
+MessagePart = Dict[str, any]
+
+
+class Attachment(namedtuple('Attachment', ['filename', 'mimetype', 'size'])):
+    '''
+    Metadata of a message attachment, the bytes themselves are never fetched or decoded.
+
+    Attributes:
+    -----------
+        filename: str
+            name the attachment was sent with
+        mimetype: str
+            declared mimetype of the attachment
+        size: int
+            decoded size in bytes as reported by Gmail
+    '''
+    __slots__ = ()
+
+
+def _is_attachment(part: MessagePart) -> bool:
+    if part.get('filename'):
+        return True
+
+    for header in part.get('headers', ()):
+        if header.get('name', '').lower() == 'content-disposition':
+            return header.get('value', '').lower().startswith('attachment')
+
+    return False
+
+
+def walk_parts(payload: MessagePart) -> Iterator[Tuple[MessagePart, bool]]:
+    '''
+    Yields (part, is_leaf) for every part below the payload in document order,
+    descending into nested multiparts. A single part payload yields itself.
+    '''
+    if not payload.get('parts'):
+        yield payload, True
+        return
+
+    # Children pushed in reverse so they pop in document order
+    stack = list(reversed(payload['parts']))
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+
+        yield part, not children
+
+        if children:
+            stack.extend(reversed(children))
+
+
+class MimeIndex:
+    '''
+    Index over the part tree of a Gmail message payload. Building it only
+    reads mimetypes, filenames and sizes; the body data strings are kept
+    by reference and nothing is decoded until a body is asked for.
+
+    Attributes:
+    -----------
+        mimetypes: List[str]
+            Distinct mimetypes of every part, nested multiparts included
+        bodies: Dict[str, str]
+            First inline base64 body for each mimetype
+        attachments: List[Attachment]
+            Metadata of every attachment in the message
+
+    Methods:
+    --------
+        from_payload(payload: MessagePart) -> MimeIndex
+            Walks the part tree once
+        body(self, preference: Tuple[str, ...] = BODY_PREFERENCE) -> Tuple[Optional[str], str]
+            The preferred (mimetype, base64 data) still encoded, (None, '') when there is none
+    '''
+    __slots__ = ['mimetypes', 'bodies', 'attachments']
+
+    def __init__(self,
+                 mimetypes: List[str],
+                 bodies: Dict[str, str],
+                 attachments: List[Attachment],
+                 ) -> None:
+        self.mimetypes = mimetypes
+        self.bodies = bodies
+        self.attachments = attachments
+
+    @classmethod
+    def from_payload(cls, payload: MessagePart) -> 'MimeIndex':
+        mimetypes, bodies, attachments = {}, {}, []
+
+        for part, is_leaf in walk_parts(payload):
+            mimetype = part.get('mimeType', '')
+            mimetypes.setdefault(mimetype, None)
+
+            if not is_leaf:
+                continue
+
+            body = part.get('body', {})
+
+            if _is_attachment(part):
+                attachments.append(Attachment(part.get('filename', ''), mimetype, body.get('size', 0)))
+
+            # Large bodies come as an attachmentId without data, they can't be parsed inline
+            elif body.get('data'):
+                bodies.setdefault(mimetype, body['data'])
+
+        return cls(list(mimetypes), bodies, attachments)
+
+    def body(self, preference: Tuple[str, ...] = BODY_PREFERENCE) -> Tuple[Optional[str], str]:
+        for mimetype in preference:
+            if mimetype in self.bodies:
+                return mimetype, self.bodies[mimetype]
+
+        return None, ''
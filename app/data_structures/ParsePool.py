@@ -0,0 +1,120 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+from .CommNode import CommNode, CommNodeBuildManager
+from .CommNodeBatch import CommNodeBatch
+from .Keywords import configure_keywords, keyword_counts
+from .AddressParser import address_cache_counts
+from .BodyGuard import BodyLimits, configure_body_limits, get_body_limits, keyword_text
+from .TermMatrix import hash_keywords
+
+# Process wide pool so fetch concurrency and parse concurrency can be tuned separately
+_pool = None
+_pool_size = None
+# (batch_size, n_process) for the keyword stage in every worker
+_keyword_args = (256, 1)
+# Per message body limits for every worker
+_body_limits = get_body_limits()
+
+
+def configure_parse_pool(max_workers: Optional[int],
+                         keyword_batch_size: int = 256,
+                         keyword_processes: int = 1,
+                         body_limits: Optional[BodyLimits] = None,
+                         ) -> None:
+    ''' Sets the number of parse processes, keyword stage settings and body limits, takes effect the next time the pool is created '''
+    global _pool_size, _keyword_args, _body_limits
+    _pool_size = max_workers
+    _keyword_args = (keyword_batch_size, keyword_processes)
+    _body_limits = body_limits or get_body_limits()
+
+
+def _init_worker(keyword_args: Tuple[int, int], body_limits: BodyLimits) -> None:
+    ''' Parse pool initializer, applies the pool settings inside each worker process '''
+    configure_keywords(*keyword_args)
+    configure_body_limits(*body_limits)
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    ''' Returns the shared parse pool, creating it on first use '''
+    global _pool
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=_pool_size or os.cpu_count(),
+                                    initializer=_init_worker,
+                                    initargs=(_keyword_args, _body_limits))
+
+    return _pool
+
+
+def reset_parse_pool() -> None:
+    ''' Drops a broken pool so the next call to get_parse_pool starts a fresh one '''
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+
+    _pool = None
+
+
+def shutdown_parse_pool(*args, **kwargs) -> None:
+    ''' Stops the worker processes, registered as a server stop listener '''
+    reset_parse_pool()
+
+
+def parse_batch(raw_responses: List[Dict[str, any]],
+                metadata_only: bool = False,
+                ) -> Tuple[List[CommNode], Dict[str, str]]:
+    '''
+    Runs in a parse worker process. Builds a CommNode for every raw
+    message response in the batch, counts and hashes keywords for the
+    whole batch in one pass and ships the nodes back to the event loop
+    along with the error of every message that couldn't be built, keyed
+    by message id, so the caller can dead letter them.
+    '''
+    output = []
+    failed = {}
+    for response in raw_responses:
+        try:
+            output.append(CommNodeBuildManager.construct(response, metadata_only, keywords=False))
+        except Exception as e:
+            print(f'Error parsing message {response.get("id")}: {e}')
+            failed[response.get('id')] = f'parse error: {e}'
+
+    if metadata_only:
+        return output, failed
+
+    # Keywords come from the plaintext body, falling back to the html body
+    targets = [node for node in output if node.plaintext_body or node.html_body]
+
+    try:
+        counts = keyword_counts(keyword_text(node) for node in targets)
+    except Exception as e:
+        print(f'Error counting keywords: {e}')
+        return output, failed
+
+    for node, keywords in zip(targets, counts):
+        node.keywords = keywords
+        node.term_vector = hash_keywords(keywords)
+
+    return output, failed
+
+
+def parse_columnar(raw_responses: List[Dict[str, any]],
+                   metadata_only: bool = False,
+                   ) -> Tuple[CommNodeBatch, Dict[str, str]]:
+    '''
+    Runs in a parse worker process. Same as parse_batch but packs the
+    nodes into a CommNodeBatch before they cross the process boundary,
+    so the event loop unpickles columns instead of a CommNode per message.
+    '''
+    hits, misses = address_cache_counts()
+    nodes, failed = parse_batch(raw_responses, metadata_only)
+
+    batch = CommNodeBatch.from_nodes(nodes)
+    end_hits, end_misses = address_cache_counts()
+    batch.address_cache = {'hits': end_hits - hits, 'misses': end_misses - misses}
+
+    return batch, failed
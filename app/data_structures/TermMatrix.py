@@ -0,0 +1,270 @@
+import io
+import zlib
+
+from typing import List, Dict, Tuple, Optional, Iterable, Collection
+
+import numpy as np
+from scipy import sparse
+
+# Width of the hashed term space, collisions are rare enough at 2^20 for mailbox sized vocabularies
+N_FEATURES = 2 ** 20
+
+
+def hash_term(term: str, n_features: int = N_FEATURES) -> int:
+    ''' Stable across processes, unlike hash() '''
+    return zlib.crc32(term.encode('utf-8')) % n_features
+
+
+def hash_keywords(keywords: Dict[str, int],
+                  n_features: int = N_FEATURES,
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Hashes a keyword Counter into a sparse term frequency vector.
+    Returns (indices, counts) sorted by index, colliding terms are summed.
+    '''
+    if not keywords:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    indices = np.fromiter((hash_term(term, n_features) for term in keywords),
+                          dtype=np.int32, count=len(keywords))
+    counts = np.fromiter(keywords.values(), dtype=np.int32, count=len(keywords))
+
+    unique, inverse = np.unique(indices, return_inverse=True)
+    return unique.astype(np.int32), np.bincount(inverse, weights=counts).astype(np.int32)
+
+
+class TermSegment:
+    '''
+    One block of rows of a user's term-document matrix, written for every
+    batch of messages that gets flushed to Postgres. Segments are appended,
+    never rewritten, and stacked back together by TermMatrix.
+
+    Attributes:
+    -----------
+        message_ids: List[str]
+            Gmail message id for every row
+        matrix: sparse.csr_matrix
+            (len(message_ids), n_features) hashed term counts
+        terms: Dict[int, str]
+            A term for every hashed column used in the segment, to label results
+
+    Methods:
+    --------
+        from_nodes(nodes: Iterable[CommNode], n_features: int = N_FEATURES) -> TermSegment
+            Builds a segment from nodes carrying a term_vector
+        from_batch(batch: CommNodeBatch, n_features: int = N_FEATURES, only: Optional[Collection[str]] = None) -> TermSegment
+            Builds a segment from the term columns of a CommNodeBatch, optionally
+            keeping only the rows of the message ids in only
+        encode(self) -> bytes
+            Serializes the segment to a compressed npz blob
+        decode(blob: bytes) -> TermSegment
+            Reads a segment back from its blob
+    '''
+    __slots__ = ['message_ids', 'matrix', 'terms']
+
+    def __init__(self,
+                 message_ids: List[str],
+                 matrix: sparse.csr_matrix,
+                 terms: Dict[int, str],
+                 ) -> None:
+        self.message_ids = message_ids
+        self.matrix = matrix
+        self.terms = terms
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable['CommNode'], n_features: int = N_FEATURES) -> 'TermSegment':
+        message_ids, indptr, indices, data = [], [0], [], []
+        terms = {}
+
+        for node in nodes:
+            if node.term_vector is None:
+                continue
+
+            node_indices, node_counts = node.term_vector
+            message_ids.append(node.msg_id)
+            indices.append(node_indices)
+            data.append(node_counts)
+            indptr.append(indptr[-1] + len(node_indices))
+
+            for term in node.keywords:
+                terms.setdefault(hash_term(term, n_features), term)
+
+        matrix = sparse.csr_matrix(
+            (
+                np.concatenate(data) if data else np.zeros(0, dtype=np.int32),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+                np.array(indptr, dtype=np.int64),
+            ),
+            shape=(len(message_ids), n_features),
+        )
+
+        return cls(message_ids, matrix, terms)
+
+    @classmethod
+    def from_batch(cls,
+                   batch: 'CommNodeBatch',
+                   n_features: int = N_FEATURES,
+                   only: Optional[Collection[str]] = None,
+                   ) -> 'TermSegment':
+        ''' The batch already holds its term vectors in csr layout, only the empty rows are dropped '''
+        matrix = sparse.csr_matrix(
+            (batch.term_counts, batch.term_indices, batch.term_indptr),
+            shape=(len(batch), n_features),
+        )
+        mask = batch.term_mask
+        if only is not None:
+            mask = mask & np.isin(np.array(batch.msg_ids, dtype=str), np.array(list(only), dtype=str))
+
+        rows = np.flatnonzero(mask)
+        message_ids = [batch.msg_ids[row] for row in rows.tolist()]
+
+        return cls(message_ids, matrix[rows], dict(batch.terms))
+
+    def encode(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            shape=np.array(self.matrix.shape, dtype=np.int64),
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            data=self.matrix.data,
+            message_ids=np.array(self.message_ids, dtype=str),
+            term_index=np.fromiter(self.terms.keys(), dtype=np.int32, count=len(self.terms)),
+            term_names=np.array(list(self.terms.values()), dtype=str),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def decode(cls, blob: bytes) -> 'TermSegment':
+        with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+            matrix = sparse.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']),
+                shape=tuple(arrays['shape']),
+            )
+            terms = dict(zip(arrays['term_index'].tolist(), arrays['term_names'].tolist()))
+
+            return cls(arrays['message_ids'].tolist(), matrix, terms)
+
+
+class TermMatrix:
+    '''
+    A user's hashed term-document matrix stacked from their segments.
+    Every analytics query is a sparse matrix operation over all rows.
+
+    Attributes:
+    -----------
+        message_ids: List[str]
+            Gmail message id for every row
+        matrix: sparse.csr_matrix
+            (messages, n_features) hashed term counts
+        terms: Dict[int, str]
+            Label for every hashed column seen
+
+    Methods:
+    --------
+        from_segments(segments: Iterable[TermSegment]) -> TermMatrix
+            Stacks segments, a message written twice keeps its latest row
+        rows(self, message_ids: Iterable[str]) -> np.ndarray
+            Row numbers for the message ids that are in the matrix
+        top_terms(self, message_ids: Optional[Iterable[str]] = None, n: int = 20) -> List[Tuple[str, int]]
+            Most frequent terms over a set of messages, every message by default
+        tfidf(self) -> sparse.csr_matrix
+            L2 normalized tf-idf weights with a smoothed idf
+        similar(self, message_id: str, n: int = 10) -> List[Tuple[str, float]]
+            Messages closest to message_id by cosine similarity of their tf-idf rows
+    '''
+    __slots__ = ['message_ids', 'matrix', 'terms', '_row_lookup', '_tfidf']
+
+    def __init__(self,
+                 message_ids: List[str],
+                 matrix: sparse.csr_matrix,
+                 terms: Dict[int, str],
+                 ) -> None:
+        self.message_ids = message_ids
+        self.matrix = matrix
+        self.terms = terms
+        self._row_lookup = {message_id: row for row, message_id in enumerate(message_ids)}
+        self._tfidf = None
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[TermSegment], n_features: int = N_FEATURES) -> 'TermMatrix':
+        segments = [segment for segment in segments if len(segment) > 0]
+        terms = {}
+        for segment in segments:
+            terms.update(segment.terms)
+
+        if not segments:
+            return cls([], sparse.csr_matrix((0, n_features), dtype=np.int32), terms)
+
+        message_ids = [message_id for segment in segments for message_id in segment.message_ids]
+        matrix = sparse.vstack([segment.matrix for segment in segments], format='csr')
+
+        # Re-scraped messages show up in more than one segment, keep the last row
+        last_rows = {message_id: row for row, message_id in enumerate(message_ids)}
+        if len(last_rows) < len(message_ids):
+            keep = np.array(sorted(last_rows.values()))
+            matrix = matrix[keep]
+            message_ids = [message_ids[row] for row in keep]
+
+        return cls(message_ids, matrix, terms)
+
+    def rows(self, message_ids: Iterable[str]) -> np.ndarray:
+        lookup = self._row_lookup
+        return np.array([lookup[message_id] for message_id in message_ids if message_id in lookup],
+                        dtype=np.int64)
+
+    def top_terms(self,
+                  message_ids: Optional[Iterable[str]] = None,
+                  n: int = 20,
+                  ) -> List[Tuple[str, int]]:
+        matrix = self.matrix if message_ids is None else self.matrix[self.rows(message_ids)]
+        totals = np.asarray(matrix.sum(axis=0)).ravel()
+
+        n = min(n, np.count_nonzero(totals))
+        if n == 0:
+            return []
+
+        top = np.argpartition(-totals, n - 1)[:n]
+        top = top[np.argsort(-totals[top])]
+
+        return [(self.terms.get(int(column), str(column)), int(totals[column])) for column in top]
+
+    def tfidf(self) -> sparse.csr_matrix:
+        if self._tfidf is not None:
+            return self._tfidf
+
+        n_docs = self.matrix.shape[0]
+        doc_freq = np.bincount(self.matrix.indices, minlength=self.matrix.shape[1])
+        idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+
+        weighted = self.matrix.astype(np.float32).multiply(idf.astype(np.float32)).tocsr()
+
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self._tfidf = sparse.diags(1 / norms).dot(weighted).tocsr()
+
+        return self._tfidf
+
+    def similar(self, message_id: str, n: int = 10) -> List[Tuple[str, float]]:
+        row = self._row_lookup.get(message_id)
+        if row is None:
+            return []
+
+        weights = self.tfidf()
+        scores = weights.dot(weights[row].T).toarray().ravel()
+        scores[row] = -1
+
+        n = min(n, len(scores) - 1)
+        if n <= 0:
+            return []
+
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+
+        return [(self.message_ids[i], float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,119 @@
+import re
+
+from typing import List, Optional, Union, Pattern, Tuple
+
+from . import Routine
+
+# Escapes that stand for a single literal character
+_ESCAPED_LITERALS = {
+    r'\r': '\r',
+    r'\n': '\n',
+    r'\t': '\t',
+    r'\f': '\f',
+    r'\v': '\v',
+}
+
+# Default plaintext cleaning routines, applied in order. Runs of spaces don't
+# need collapsing since clean() only keeps the words, and the css lookahead
+# rejects runs without a : or = before trying the lazy alternatives.
+DEFAULT_ROUTINES = [
+    Routine(r"\r", '', 'removing returns'),
+    Routine(r"\n", ' ', 'removing newlines'),
+    Routine(r"On\s\w{3},?\s.*?<\s?\S*?@\S*?\s?>.*", '', 'removing email quotes'),
+    Routine(r"<.*?\/>|<.*?><\/.*?>", '', 'removing HTML elements'),
+    Routine(r"http?s?://\S+", '', 'removing urls'),
+    Routine(r"(?=\S*[:=])(?:\w*?=\"\S+|\S*?:\s?\S*?;\"?)", '', 'removing css styles'),
+    Routine(r"<\S*?>", '', 'removing HTML tags'),
+]
+
+# Words kept in the cleaned output
+WORD_PATTERN = r"[a-zA-Z']{2,}"
+
+
+def _literal(pattern: str) -> Optional[str]:
+    ''' Returns the character a single character pattern matches, None for anything else '''
+    if pattern in _ESCAPED_LITERALS:
+        return _ESCAPED_LITERALS[pattern]
+
+    if len(pattern) == 1 and re.escape(pattern) == pattern:
+        return pattern
+
+    return None
+
+
+class TextCleaner:
+    '''
+    Compiles a list of text cleaning Routines once and runs them in as few
+    passes over the text as possible. Single character routines skip the regex
+    engine and run as str.replace, every other routine gets one pass with its
+    precompiled pattern. Regex routines are never fused into an
+    alternation, leftmost matching changes their output and disables the
+    literal prefix search that keeps most of them cheap.
+
+    Attributes:
+    -----------
+        routines: List[Routine]
+            Routines the cleaner was built from, in order
+        passes: List[Union[List[Tuple[str, str]], Tuple[Pattern, str]]]
+            (char, repl) lists and (compiled pattern, repl) pairs to run in order
+        words: Pattern
+            Compiled pattern for the words kept by clean()
+
+    Methods:
+    --------
+        clean_text(self, text: str) -> str
+            Runs every pass over the text and returns it lowercased
+        clean(self, text: str) -> List[str]
+            Runs every pass and returns the lowercased words left over
+    '''
+    __slots__ = ['routines', 'passes', 'words']
+
+    def __init__(self, routines: List[Routine], word_pattern: str = WORD_PATTERN) -> None:
+        self.routines = list(routines)
+        self.passes = self._compile(self.routines)
+        self.words = re.compile(word_pattern)
+
+    @staticmethod
+    def _compile(routines: List[Routine]) -> List[Union[List[Tuple[str, str]], Tuple[Pattern, str]]]:
+        passes = []
+        # Literal replacements being collected, None when the last pass was a regex
+        literals = None
+
+        for routine in routines:
+            try:
+                pattern = re.compile(routine.pattern)
+            except re.error as e:
+                print(f'Error compiling {routine.op_name}: {e}')
+                continue
+
+            char = _literal(routine.pattern)
+            if char is None or '\\' in routine.repl:
+                literals = None
+                passes.append((pattern, routine.repl))
+                continue
+
+            if literals is None:
+                literals = []
+                passes.append(literals)
+
+            literals.append((char, routine.repl))
+
+        return passes
+
+    def clean_text(self, text: str) -> str:
+        for step in self.passes:
+            if isinstance(step, list):
+                for char, repl in step:
+                    text = text.replace(char, repl)
+            else:
+                pattern, repl = step
+                text = pattern.sub(repl, text)
+
+        return text.lower()
+
+    def clean(self, text: str) -> List[str]:
+        return self.words.findall(self.clean_text(text))
+
+
+# Cleaner for the default routines, compiled at import
+default_cleaner = TextCleaner(DEFAULT_ROUTINES)
@@ -7,6 +7,7 @@ from ..helpers import noArgClock
 import uuid
 
 from .Entity import POC
+from .InternPool import intern_pool
 
 
 class Cluster(namedtuple('Cluster', ['msg_id', 'date', 'conn_u',
@@ -185,15 +186,15 @@ class UserNodeBuilder:
                         connection_type = pair[_v]['poc']
 
                     connection = Cluster(
-                        pair[_u]['msg_id'],  # msg ID
-                        pair[_u]['date'],    # datetime object
-                        pair[_u]['email'],   # email perspective 'self'
-                        pair[_u]['name'],    # entity name
-                        pair[_u]['domain'],  # domain name
-                        originator,          # who originated the message
-                        pair[_v]['email'],   # conn between orig and 'other' from perspective of 'self'
-                        connection_type,     # type of connection between prev 2
-                        score                # score of the connection
+                        pair[_u]['msg_id'],                      # msg ID
+                        pair[_u]['date'],                        # datetime object
+                        intern_pool.intern(pair[_u]['email']),   # email perspective 'self'
+                        intern_pool.intern(pair[_u]['name']),    # entity name
+                        intern_pool.intern(pair[_u]['domain']),  # domain name
+                        originator,                              # who originated the message
+                        intern_pool.intern(pair[_v]['email']),   # conn between orig and 'other' from perspective of 'self'
+                        connection_type,                         # type of connection between prev 2
+                        score                                    # score of the connection
                     )
 
                     # bit flip to change perspective (╯°□°)╯︵ ┻━┻
@@ -225,7 +226,7 @@ class UserNodeBuilder:
             # Heavily CPU bound, could probably paralellize this
             # in background tasks by chunking the generators and
             # sending to different instances of UserNodeBuilder
-            self._gen_permutations(cluster, originator[0]['email'])
+            self._gen_permutations(cluster, intern_pool.intern(originator[0]['email']))
 
 
         msg_out = f'Number of nodes: {len(self.connections)} \
@@ -18,5 +18,5 @@ target_set = set([
     'Subject'
 ])
 
-# Routine definition for plaintext cleaning generator
+# Routine definition for the plaintext TextCleaner
 Routine = namedtuple('Operation', 'pattern repl op_name')
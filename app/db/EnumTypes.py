@@ -43,3 +43,16 @@ class TaskTypes(enum.Enum):
     USER_NODES = 5
     AUTHENTICATE = 6
     NEW_USER = 7
+
+class CheckpointStatus(enum.Enum):
+    '''
+    PENDING = 1
+    IN_FLIGHT = 2
+    DONE = 3
+    RESUMING = 4
+    '''
+    PENDING = 1
+    IN_FLIGHT = 2
+    DONE = 3
+    # Claimed by a worker that is re-queueing it after a restart
+    RESUMING = 4
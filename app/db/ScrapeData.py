@@ -1,4 +1,5 @@
-from sqlalchemy import Table, Column, Integer, String, ForeignKey, DateTime, ARRAY, Text, JSON, Enum
+from sqlalchemy import Table, Column, Integer, SmallInteger, String, ForeignKey, DateTime, ARRAY, Text, JSON, Enum, LargeBinary, \
+    UniqueConstraint
 
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -29,7 +30,24 @@ comm_nodes = Table(
     Column("subject", Text()),
     Column("date", DateTime),
     Column("keywords", JSON),
-    Column("labels", ARRAY(String(length=100)))
+    Column("labels", ARRAY(String(length=100))),
+    Column("attachments", JSON),
+    # Truncation mask of the body size limits the message ran into
+    Column("truncated", SmallInteger),
+    # One comm node per message, re-scraped messages are skipped on insert
+    UniqueConstraint("message_id", name="uq_comm_nodes_message_id")
+)
+
+# Append only segments of each user's hashed term-document matrix,
+# one per flushed batch of comm nodes, stacked back together for analytics
+term_segments = Table(
+    "term_segments", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("owner", UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False, index=True),
+    Column("message_count", Integer),
+    Column("n_features", Integer),
+    Column("data", LargeBinary),
+    Column("time_created", DateTime)
 )
 
 # Entities are created for each party in each conversation
@@ -42,5 +60,6 @@ entities = Table(
     Column("name", String(length=200)),
     Column("domain", String(length=200)),
     Column("msg_id", String(length=20), ForeignKey('message_objs.message_id', ondelete="CASCADE")),
-    Column('poc', Enum(PartOfConvo))
+    Column('poc', Enum(PartOfConvo)),
+    UniqueConstraint("msg_id", "email", "poc", name="uq_entities_msg_id_email_poc")
 )
@@ -1,8 +1,9 @@
-from sqlalchemy import Table, Column, Enum, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Table, Column, Enum, DateTime, Boolean, Text, ForeignKey, String, Integer, Float, JSON, \
+    UniqueConstraint
 
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 
-from . import TaskTypes
+from . import TaskTypes, CheckpointStatus
 from . import metadata
 
 # Tasks are stored in DB upon creation of a task object through the
@@ -17,3 +18,60 @@ tasks = Table(
     Column("error", Text()),
     Column("success", Boolean)
 )
+
+# Each chunk of message ids queued by a Hermes task is checkpointed
+# so unfinished chunks can be re-queued after a restart.
+scrape_checkpoints = Table(
+    "scrape_checkpoints", metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True, nullable=False),
+    Column("task_id", UUID(as_uuid=True), ForeignKey('tasks.id', ondelete="CASCADE"), nullable=False, index=True),
+    Column("owner", UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False),
+    Column("status", Enum(CheckpointStatus), nullable=False),
+    Column("scrape_format", String(length=20)),
+    # MESSAGES or THREADS, decides whether message_ids holds thread ids
+    Column("fetch_mode", String(length=20)),
+    Column("first_id", String(length=20)),
+    Column("last_id", String(length=20)),
+    Column("message_ids", ARRAY(String(length=20))),
+    Column("fetched_count", Integer),
+    Column("time_updated", DateTime)
+)
+
+# Batch sizing chosen by the tuner and the throughput a Hermes task reached
+task_metrics = Table(
+    "task_metrics", metadata,
+    Column("task_id", UUID(as_uuid=True), ForeignKey('tasks.id', ondelete="CASCADE"), primary_key=True, nullable=False),
+    Column("owner", UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False),
+    Column("window_size", Integer),
+    Column("max_workers", Integer),
+    Column("message_count", Integer),
+    Column("request_count", Integer),
+    Column("error_count", Integer),
+    Column("elapsed", Float),
+    Column("messages_per_sec", Float),
+    # [window_size, max_workers, messages/sec] for every tuner sample
+    Column("adjustments", JSON),
+    # Messages that hit each body size limit, eg: {'bytes': 0, 'chars': 3, 'tokens': 1}
+    Column("truncations", JSON),
+    # Address header cache hits, misses and hit_rate over the parse workers
+    Column("address_cache", JSON),
+    Column("time_recorded", DateTime)
+)
+
+# Ids that still failed after every fetch round of a scrape. The dead letter
+# worker retries them with exponential backoff, next_attempt is NULL once
+# a row has used up its attempts.
+dead_letters = Table(
+    "dead_letters", metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True, nullable=False),
+    Column("owner", UUID(as_uuid=True), ForeignKey('users.id', ondelete="CASCADE"), nullable=False),
+    Column("task_id", UUID(as_uuid=True), ForeignKey('tasks.id', ondelete="SET NULL"), index=True),
+    Column("message_id", String(length=20), nullable=False),
+    Column("fetch_mode", String(length=20)),
+    Column("scrape_format", String(length=20)),
+    Column("attempts", Integer, nullable=False),
+    Column("last_error", Text()),
+    Column("next_attempt", DateTime, index=True),
+    Column("time_created", DateTime),
+    UniqueConstraint("owner", "message_id")
+)
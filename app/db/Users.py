@@ -17,6 +17,8 @@ users = Table(
     Column("name", String(length=100)),
     Column("permission_level", Enum(PermissionLevel), nullable=False),
     Column("last_fetch", DateTime),
+    # Gmail historyId recorded after the last successful sync
+    Column("history_id", String(length=30)),
     Column("token", String()),
     Column("refresh_token", String()),
     Column("token_uri", String()),
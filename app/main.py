@@ -12,6 +12,9 @@ from .routes import app_routes
 from .db.dbListeners import start_db, stop_db
 
 from .workers.listeners import create_task_queue
+from .wrappers import close_session, configure_raw_cache, configure_message_cache, attach_message_cache_redis
+from .data_structures.ParsePool import configure_parse_pool, shutdown_parse_pool
+from .data_structures.BodyGuard import BodyLimits
 from .helpers import random_string
 from .config import configSwitch
 
@@ -26,9 +29,21 @@ app_config = configSwitch(os.getenv('ENV_NAME'))
 app.config.from_object(app_config)
 app.config.OAUTH_VERIFIER = random_string(40)
 
+configure_parse_pool(app.config.PARSE_WORKERS,
+                     app.config.KEYWORD_BATCH_SIZE,
+                     app.config.KEYWORD_PROCESSES,
+                     BodyLimits(app.config.MAX_BODY_BYTES,
+                                app.config.MAX_BODY_CHARS,
+                                app.config.MAX_KEYWORD_TOKENS))
+configure_raw_cache(app.config.RAW_CACHE_DIR, app.config.RAW_CACHE_MAX_BYTES)
+configure_message_cache(app.config.MESSAGE_CACHE_SIZE, app.config.MESSAGE_CACHE_TTL)
+
 app.register_listener(start_db, 'after_server_start')
+app.register_listener(attach_message_cache_redis, 'after_server_start')
 app.register_listener(create_task_queue, 'after_server_start')
 app.register_listener(stop_db, 'before_server_stop')
+app.register_listener(close_session, 'before_server_stop')
+app.register_listener(shutdown_parse_pool, 'before_server_stop')
 
 app.blueprint(app_routes)
 
@@ -3,7 +3,7 @@ from sanic.response import json, redirect
 
 from functools import partial
 
-from app.wrappers import Pipeline, Gmail
+from app.wrappers import Pipeline, Gmail, ScrapeFormat, FetchMode
 from app.workers.mediators import HermesMediator
 from app.db import TaskTypes
 from app.helpers import credentials_to_dict, authorized, withOauth
@@ -18,12 +18,38 @@ gmail_bp = Blueprint('gmail', url_prefix='/gmail')
 # Otherwise, use @authorized() decorator to retrieve creds from session
 
 
-# host/api/gmail/start
+# host/api/gmail/start?mode=<full|metadata>&fetch=<messages|threads>
 @gmail_bp.route('/start', methods=['POST', 'GET'])
 @authorized()
-async def load_data(request, auth_obj, user_uuid):
+async def load_data(request, credentials):
+    user_uuid = request['session'].get('user_id', None)
+
+    if not user_uuid:
+        return redirect('/authorize')
+
+    mode = request.args.get('mode', 'full')
+    fetch = request.args.get('fetch', 'messages')
+
     try:
-        pipeline_interface = Pipeline(auth_obj, 0.7, '')
+        scrape_format = ScrapeFormat[mode.upper()]
+    except KeyError:
+        return json({
+            'status': 'Invalid',
+            'message': f'Unknown scrape mode: {mode}'
+        }, 400)
+
+    try:
+        fetch_mode = FetchMode[fetch.upper()]
+    except KeyError:
+        return json({
+            'status': 'Invalid',
+            'message': f'Unknown fetch mode: {fetch}'
+        }, 400)
+
+    try:
+        pipeline_interface = Pipeline(credentials, 0.7, '',
+                                      scrape_format=scrape_format,
+                                      fetch_mode=fetch_mode)
 
         mediator = HermesMediator(
             request.app,
@@ -32,10 +58,19 @@ async def load_data(request, auth_obj, user_uuid):
             pipeline_interface,
         )
 
+        config = request.app.config
         hermes_tracker = await mediator._async_init()
-        tracked_hermes = partial(hermes_tracker.wrap_pipeline, 500, 2500, 15, 4, True)
+        if hermes_tracker is None:
+            raise Exception(f'could not log a task: {", ".join(mediator.errors)}')
 
-        await request.app.long_queue.put(tracked_hermes)
+        tracked_hermes = partial(hermes_tracker.wrap_pipeline,
+                                 config.CHUNK_SIZE,
+                                 config.QUERY_LIMIT,
+                                 config.WINDOW_SIZE,
+                                 config.FETCH_WORKERS,
+                                 True)
+
+        await request.app.long_queue.put(tracked_hermes, user_uuid)
 
     except Exception as e:
         return json({
@@ -44,18 +79,53 @@ async def load_data(request, auth_obj, user_uuid):
         }, 500)
 
 
-    return json({'status': 'Success', 'message': 'Task queued successfully', 'task_id': auth_obj.task_uuid}, 200)
+    return json({'status': 'Success', 'message': 'Task queued successfully', 'task_id': mediator.task_uuid}, 200)
 
 
 
 
+# host/api/gmail/replay
+# Re-parses the session user's mailbox from the raw message cache without calling Gmail
+@gmail_bp.route('/replay', methods=['POST', 'GET'])
+@authorized()
+async def replay_data(request, credentials):
+    user_id = request['session'].get('user_id', None)
+
+    if not user_id:
+        return redirect('/authorize')
+
+    try:
+        pipeline_interface = Pipeline(credentials, 0.7, '')
+
+        mediator = HermesMediator(
+            request.app,
+            user_id,
+            TaskTypes['HERMES'],
+            pipeline_interface,
+        )
+
+        replay = partial(mediator.wrap_replay, 200)
+
+        await request.app.long_queue.put(replay, user_id)
+
+    except Exception as e:
+        return json({
+            'status': 'Error starting task',
+            'message': f'something went wrong: {e}'
+        }, 500)
+
+    return json({'status': 'Success', 'message': 'Replay queued successfully', 'task_id': mediator.task_uuid}, 200)
+
+
 # host/api/gmail/getmessage/<msg_id>
 @gmail_bp.route('/getmessage/<msg_id>', methods=['POST', 'GET'])
 @authorized()
-async def get_single_message(request, auth_obj, msg_id):
+async def get_single_message(request, credentials, msg_id):
+    user_id = request['session'].get('user_id', None)
+
     try:
-        interface = Gmail(auth_obj.credentials)
-        message = await interface.getSingleMessage(msg_id)
+        interface = Gmail(credentials)
+        message = await interface.getSingleMessage(msg_id, user_id)
     except Exception as e:
         return json({
             'status': 'Error',
@@ -73,12 +143,29 @@ async def get_single_message(request, auth_obj, msg_id):
 @gmail_bp.route('/scrape', methods=['GET'])
 @authorized()
 async def scrape_data(request, credentials):
+    user_id = request['session'].get('user_id', None)
+
+    if not user_id:
+        return redirect('/authorize')
+
     try:
+        config = request.app.config
         pipeline_interface = Pipeline(credentials, 0.7, '')
 
-        untracked_hermes = partial(pipeline_interface.hermes, 500, 2500, 15, 4)
+        mediator = HermesMediator(
+            request.app,
+            user_id,
+            TaskTypes['HERMES'],
+            pipeline_interface,
+        )
+
+        untracked_hermes = partial(mediator.wrap_pipeline,
+                                   config.CHUNK_SIZE,
+                                   config.QUERY_LIMIT,
+                                   config.WINDOW_SIZE,
+                                   config.FETCH_WORKERS)
 
-        await request.app.long_queue.put(untracked_hermes)
+        await request.app.long_queue.put(untracked_hermes, user_id)
 
     except Exception as e:
         return json({
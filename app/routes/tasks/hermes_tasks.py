@@ -83,17 +83,43 @@ async def checkTaskStatus(request, task_type):
             'status': 'No result found',
         }, 200)
 
+    try:
+        # Ids that failed every fetch round and are waiting on the dead letter worker
+        pending_query = '''
+        SELECT count(*) AS pending FROM dead_letters
+        WHERE dead_letters.task_id = :task_id AND dead_letters.next_attempt IS NOT NULL
+        '''
+
+        pending = await request.app.database.fetch_val(
+            query=pending_query,
+            values={'task_id': result['id']},
+        )
+
+    except Exception as e:
+        return json({
+            "status": 'Error',
+            "message": f'Unable to query dead letters: {e}'
+        })
+
+    if result['time_finished'] is None:
+        return json({
+            'status': 'Running',
+            'pending_ids': pending
+        }, 200)
+
     if result['success'] is True:
         return json({
             'status': 'Success',
-            'finished': result['time_finished'].date()
+            'finished': result['time_finished'].date(),
+            'pending_ids': pending
         }, 200)
 
     if result['success'] is False:
         return json({
             'status': 'Failure',
             'message': 'Task was not completed successfully',
-            'finished': result['time_finished'].date()
+            'finished': result['time_finished'].date(),
+            'pending_ids': pending
         }, 200)
 
     else:
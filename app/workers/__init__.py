@@ -1,5 +1,6 @@
 from .db_workers import db_worker
 from .gmail_workers import gmail_worker
 from .graph_workers import graph_worker
+from .dead_letter_workers import dead_letter_worker
 
 from ..db import users, message_objs, comm_nodes, entities, tasks, graph_nodes, interactions, TaskTypes
@@ -0,0 +1,26 @@
+import asyncio
+
+from typing import Callable, Awaitable
+
+
+async def dead_letter_worker(name: str,
+                             retry: Callable[[], Awaitable[int]],
+                             interval: float,
+                             *args,
+                             **kwargs
+                             ) -> None:
+    '''
+    Periodically drains the dead letters that are due. The fetches
+    themselves run on the long queue next to the regular scrapes.
+    '''
+    while True:
+        try:
+            queued = await retry(*args, **kwargs)
+        except Exception as e:
+            print(f'{name} failed to retry dead letters: {e}')
+            queued = 0
+
+        if queued > 0:
+            print(f'{name} queued {queued} dead letters, sleeping for {interval} seconds...')
+
+        await asyncio.sleep(interval)
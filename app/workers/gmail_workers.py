@@ -1,22 +1,81 @@
 import asyncio
-import json
-import itertools
+import time
 import uuid
 
-from datetime import datetime
-
-from typing import Callable, Generator, Dict, List, Tuple, Optional
+from typing import Callable, Generator, Dict, List, Tuple, Optional, AsyncIterator, Awaitable, Union
 
 from ..helpers.clock import coClock, clock
+from ..data_structures.CommNodeBatch import CommNodeBatch
+
+
+async def micro_batches(results: Union[List['CommNode'], AsyncIterator['CommNodeBatch']],
+                        flush_size: int,
+                        flush_interval: float,
+                        ) -> AsyncIterator['CommNodeBatch']:
+    '''
+    Regroups a stream of parsed CommNodeBatches into batches of about
+    flush_size messages. A partial batch is flushed once flush_interval
+    seconds have passed so that a slow fetch still lands rows in Postgres promptly.
+    A plain list of CommNodes is packed into batches of at most flush_size.
+    '''
+    if not hasattr(results, '__aiter__'):
+        for i in range(0, len(results), flush_size):
+            yield CommNodeBatch.from_nodes(results[i:i+flush_size])
+        return
+
+    iterator = results.__aiter__()
+    parts = []
+    count = 0
+    deadline = time.monotonic() + flush_interval
+    pending = None
+
+    try:
+        while True:
+            # Keep the next batch in flight while waiting on the clock
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            done, _ = await asyncio.wait({pending}, timeout=max(0, deadline - time.monotonic()))
+
+            if pending in done:
+                fetched, pending = pending, None
+                try:
+                    part = fetched.result()
+                except StopAsyncIteration:
+                    break
+
+                parts.append(part)
+                count += len(part)
+
+            timed_out = time.monotonic() >= deadline
+
+            if count >= flush_size or (timed_out and count > 0):
+                yield CommNodeBatch.concat(parts)
+                parts = []
+                count = 0
+
+            if count == 0 or timed_out:
+                deadline = time.monotonic() + flush_interval
+
+        if count > 0:
+            yield CommNodeBatch.concat(parts)
+    finally:
+        # Don't leave a fetch in flight or the source half consumed when the consumer stops early
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+        if hasattr(iterator, 'aclose'):
+            await iterator.aclose()
+
 
 # @clock
 async def gmail_worker(name: str,
-                       long_queue: asyncio.Queue,
-                       db_callback: Callable[[
-                           List[Tuple[str, Generator[Dict[str, 'Table'], None, None]]],
-                           str,
-                           Optional[str]], None],
+                       long_queue: 'FairQueue',
+                       db_callback: Callable[..., Awaitable[asyncio.Future]],
                        * args,
+                       db_stream: Callable[[str], Awaitable['DBMediator']] = None,
+                       flush_size: int = 250,
+                       flush_interval: float = 5.0,
                        **kwargs
                        ) -> None:
 
@@ -32,62 +91,52 @@ async def gmail_worker(name: str,
         size = long_queue.qsize()
 
         try:
-            results, user_uuid = await job(*args, **kwargs)
+            output = await job(*args, **kwargs)
         except Exception as e:
             print(f'something went wrong with the current task: {e}')
-            return
-
-        msg_objs = ({
-            'owner': user_uuid,
-            'message_id': node.msg_id,
-            'thread_id': node.thread_id,
-            'last_fetch': datetime.now()
-        } for node in results)
-
-        comm_nodes = ({
-            'message_id': node.msg_id,
-            'html_body': node.html_body,
-            'text_body': node.plaintext_body,
-            'mimetypes': node.mimetypes,
-            'ip_address': node.ip_address,
-            'subject': node.subject,
-            'date': node.date,
-            'keywords': json.dumps(node.keywords),
-            'labels': node.labels
-        } for node in results)
-
-        # flattens all the Entity arrays nested in array of comm nodes
-        all_entities = list(
-            itertools.chain.from_iterable(
-                [node.entities for node in results]
-            )
-        )
-
-        entities = ({
-            'email': entity.email,
-            'name': entity.name,
-            'domain': entity.domain,
-            'msg_id': entity.msg_id,
-            'poc': entity.poc.name
-        } for entity in all_entities)
-
-        # free up memory
-        del all_entities
+            long_queue.task_done(job)
+            continue
 
-        try:
-            executables = [
-                ('msg_objs', msg_objs),
-                ('comm_nodes', comm_nodes),
-                ('entities', entities)
-            ]
+        # Mediator jobs only fan work out onto the queue
+        if output is None:
+            long_queue.task_done(job)
+            continue
 
-            await db_callback(executables, user_uuid)
+        try:
+            # Replays ask for the stored rows of every batch to be replaced
+            results, user_uuid, *options = output
+            replace = bool(options and options[0])
+
+            # One DB_INSERT task for the whole stream rather than one per flush
+            mediator = await db_stream(user_uuid)
+            batches = micro_batches(results, flush_size, flush_interval)
+            stored = []
+            flushed = 0
+
+            try:
+                # Persist the messages in micro batches while the fetch is still running
+                async for batch in batches:
+                    stored.append(await db_callback(batch, user_uuid, mediator=mediator, replace=replace))
+                    flushed += len(batch)
+
+            finally:
+                # Stops the fetch when the stream was abandoned part way
+                await batches.aclose()
+
+                # The task is only closed once the db worker has run every flush
+                if stored:
+                    await asyncio.gather(*stored, return_exceptions=True)
+                await mediator._finalize_task()
 
         except Exception as e:
             print(f'Error sending results to next long_queue: {e}')
-            break
+            continue
+
+        finally:
+            # Frees the user's in flight slot on the fair queue
+            long_queue.task_done(job)
 
-        print(f"{name} has completed a task from {long_queue} with {size} remaining. Sleeping for 3 seconds... \n\n")
+        print(f"{name} has completed a task from {long_queue} with {size} remaining. Flushed {flushed} messages. Sleeping for 3 seconds... \n\n")
         await asyncio.sleep(3)
 
     return
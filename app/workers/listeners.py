@@ -1,34 +1,81 @@
 import asyncio
-from typing import List, Tuple, Generator, Dict, Optional
+from typing import List, Tuple, Generator, Dict, Optional, Union
 
 from functools import partial
 
-from .mediators import DBMediator, GraphMediator
+from ..data_structures.FairQueue import FairQueue
+from ..data_structures.CommNodeBatch import CommNodeBatch
+from .mediators import DBMediator, GraphMediator, resume_checkpoints, retry_dead_letters
 
 from . import users, message_objs, comm_nodes, entities
 from . import tasks, TaskTypes
 from . import graph_nodes, interactions
-from . import gmail_worker, graph_worker, db_worker
+from . import gmail_worker, graph_worker, db_worker, dead_letter_worker
 
 async def create_task_queue(app, loop):
     app.queue = asyncio.Queue(loop=loop, maxsize=app.config.MAX_QUEUE_SIZE)
-    app.long_queue = asyncio.Queue(loop=loop, maxsize=app.config.MAX_QUEUE_SIZE)
+
+    async def user_weight(user_uuid: str) -> int:
+        ''' Scheduler weight of a user, from their permission level '''
+        row = await app.database.fetch_one(
+            query='SELECT permission_level FROM users WHERE id = :owner',
+            values={'owner': user_uuid}
+        )
+
+        if row is None or row['permission_level'] is None:
+            return 1
+
+        level = getattr(row['permission_level'], 'name', row['permission_level'])
+        return app.config.SCHEDULER_WEIGHTS.get(level, 1)
+
+    # Per-user lanes so one large backfill can't starve everyone else
+    app.long_queue = FairQueue(
+        maxsize=app.config.MAX_QUEUE_SIZE,
+        max_in_flight=app.config.USER_MAX_IN_FLIGHT,
+        weight_lookup=user_weight,
+    )
     app.graph_queue = asyncio.Queue(loop=loop, maxsize=app.config.MAX_QUEUE_SIZE)
 
+    async def db_stream(user_uuid: str) -> DBMediator:
+        ''' Starts the one DB_INSERT task every flush of a persisted stream is logged under '''
+        mediator = DBMediator(app.database, user_uuid, TaskTypes['DB_INSERT'])
+        return await mediator._async_init() or mediator
+
     async def db_callback(
-        row_generators: List[Tuple[str, Generator[Dict[str, 'Table'], None, None]]],
+        row_generators: Union[CommNodeBatch, List[Tuple[str, Generator[Dict[str, 'Table'], None, None]]]],
         user_uuid: str,
         update_graph: Optional[bool] = True,
         *args,
+        mediator: Optional[DBMediator] = None,
+        replace: bool = False,
         **kwargs
-    ) -> str:
+    ) -> asyncio.Future:
+        '''
+        Queues an insert and returns a future that resolves to the task id once it has run.
+        A stream passes its own mediator and finalizes it after the last flush,
+        a one off call gets a task of its own.
+        '''
+        log_task = mediator is None
+        if mediator is None:
+            mediator = await db_stream(user_uuid)
 
-        mediator = DBMediator(app.database, user_uuid, TaskTypes['DB_INSERT'])
-        init_db_mediator = await mediator._async_init()
-        mediated_db_task = partial(init_db_mediator.handleDbInserts, row_generators)
+        # Parsed messages are bulk loaded from their columns, everything else goes row by row
+        if isinstance(row_generators, CommNodeBatch):
+            mediated_db_task = partial(mediator.handleBatchInsert, row_generators, log_task, replace)
+        else:
+            mediated_db_task = partial(mediator.handleDbInserts, row_generators, log_task)
+
+        stored = asyncio.get_event_loop().create_future()
+
+        async def tracked_db_task(*args, **kwargs) -> None:
+            try:
+                await mediated_db_task(*args, **kwargs)
+            finally:
+                if not stored.done():
+                    stored.set_result(mediator.task_uuid)
 
         # Add the job to the queue
-        await app.queue.put(mediated_db_task)
+        await app.queue.put(tracked_db_task)
 
         # if update_graph:
         #     graph_mediator = GraphMediator(app.database, user_uuid, TaskTypes['USER_NODES'])
@@ -41,8 +88,7 @@ async def create_task_queue(app, loop):
 
         #     await app.graph_queue.put(mediated_graph_task)
 
-        # return the task id
-        return init_db_mediator.task_uuid
+        return stored
 
     # Workers to handle pulling Gmail message ids and creating comm nodes
     for i in range(4):
@@ -51,6 +97,9 @@ async def create_task_queue(app, loop):
                 f"Gmail-Worker-{i}",
                 app.long_queue,
                 db_callback,
+                db_stream=db_stream,
+                flush_size=app.config.FLUSH_SIZE,
+                flush_interval=app.config.FLUSH_INTERVAL,
             )
         )
 
@@ -71,3 +120,15 @@ async def create_task_queue(app, loop):
                 app.queue
             )
         )
+
+    # Pick up chunks from Hermes tasks that were cut short by a restart
+    app.add_task(resume_checkpoints(app))
+
+    # Retries ids that failed every fetch round, with exponential backoff
+    app.add_task(
+        dead_letter_worker(
+            "DeadLetter-Worker",
+            partial(retry_dead_letters, app),
+            app.config.DEAD_LETTER_INTERVAL,
+        )
+    )
@@ -12,7 +12,8 @@ from sqlalchemy.sql import select, insert, update, join
 
 from . import users, message_objs, comm_nodes, entities, \
     tasks, interactions, interaction_groups, graph_nodes, \
-    TaskTypes, form_data, subscriptions
+    TaskTypes, form_data, subscriptions, scrape_checkpoints, task_metrics, \
+    dead_letters, term_segments
 
 class BaseMediator:
     '''
@@ -80,6 +81,10 @@ class BaseMediator:
             'interaction_groups': interaction_groups,
             'users': users,
             'tasks': tasks,
+            'scrape_checkpoints': scrape_checkpoints,
+            'task_metrics': task_metrics,
+            'dead_letters': dead_letters,
+            'term_segments': term_segments,
         }
 
     @property
@@ -97,7 +102,7 @@ class BaseMediator:
         '''
         self.errors.append(str(error.message))
 
-    async def async_init(self) -> 'Mediator':
+    async def _async_init(self) -> 'Mediator':
         '''
         Asynchronously stores the initial task details in Postgres.
         Returns a Mediator copy with all attributes.
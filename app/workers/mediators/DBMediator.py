@@ -1,13 +1,30 @@
 import datetime
 
-from typing import Generator, List, Tuple, Dict
+from typing import Generator, List, Tuple, Dict, Iterator, Optional, Set
 from sqlalchemy.sql import select
 from sqlalchemy.dialects.postgresql import insert
 
-from app.db import TaskTypes
+from app.db import TaskTypes, message_objs
+from app.data_structures.CommNodeBatch import CommNodeBatch
+from app.data_structures.TermMatrix import TermSegment, N_FEATURES
 
 from . import BaseMediator
 
+# Inserts a whole column of message ids in one statement, skipping
+# re-scraped and replayed messages that already have a message_objs row
+UNNEST_MSG_OBJS = f'''
+    INSERT INTO {message_objs.name} (owner, message_id, thread_id, last_fetch)
+    SELECT $1::uuid, message_id, thread_id, $4::timestamp
+    FROM unnest($2::varchar[], $3::varchar[]) AS batch (message_id, thread_id)
+    ON CONFLICT (message_id) DO NOTHING
+'''
+
+# Clears the user's rows of a batch that's about to be stored again
+DELETE_BATCH = f'''
+    DELETE FROM {{table}} USING {message_objs.name}
+    WHERE {{table}}.{{column}} = {message_objs.name}.message_id
+    AND {message_objs.name}.owner = $1::uuid AND {{table}}.{{column}} = ANY($2::varchar[])
+'''
 
 
 class DBMediator(BaseMediator):
@@ -18,6 +35,8 @@ class DBMediator(BaseMediator):
     --------
         loadGraphClusters(self, startDate: datetime, endDate: datetime)
             returns a generator that yields groups of entities clustered by msg_id
+        handleBatchInsert(self, batch: CommNodeBatch, log_task: bool = True, replace: bool = False)
+            bulk loads the columns of a CommNodeBatch with COPY and unnest in one transaction
 
     '''
 
@@ -89,9 +108,17 @@ class DBMediator(BaseMediator):
             if gen[0] == 'graph_nodes':
                 await self.handleConflicts(gen[0], gen[1])
 
+            query = self.table_refs[gen[0]].insert()
+
+            # Re-scraped and replayed messages already have a message_objs row
+            if gen[0] == 'msg_objs':
+                query = insert(self.table_refs[gen[0]]).on_conflict_do_nothing(
+                    index_elements=['message_id']
+                )
+
             try:
                 await self.database.execute_many(
-                    query=self.table_refs[gen[0]].insert(),
+                    query=query,
                     values=gen[1]
                 )
                 print(f'successfully saved {gen[0]} to DB')
@@ -106,6 +133,109 @@ class DBMediator(BaseMediator):
 
         return
 
+    async def handleBatchInsert(self,
+                                batch: CommNodeBatch,
+                                log_task: bool = True,
+                                replace: bool = False,
+                                *args,
+                                **kwargs
+                                ) -> None:
+        '''
+        Loads a parsed CommNodeBatch straight from its columns on the raw
+        asyncpg connection, in one transaction so a batch lands whole or not
+        at all. message_objs goes in as one unnest statement, comm_nodes and
+        entities are streamed with COPY into temp tables as plain tuples and
+        moved over with ON CONFLICT DO NOTHING, so re-scraped messages don't
+        leave duplicates and no row is ever turned into a dict. The term
+        segment only holds the comm_nodes rows that were actually inserted,
+        a replay re-parses messages the term matrix already has and adds none.
+
+        Params:
+        --------
+        batch: CommNodeBatch
+            Parsed messages to store for the mediator's user
+        log_task: bool
+            Finalizes the mediator's task once the batch is stored
+        replace: bool
+            Drops the batch's existing comm_nodes and entities first, used
+            when a mailbox is re-parsed from the raw cache
+        '''
+        comm_node_table = self.table_refs['comm_nodes'].name
+        entity_table = self.table_refs['entities'].name
+
+        try:
+            async with self.database.connection() as connection:
+                async with connection.transaction():
+                    raw = connection.raw_connection
+
+                    if replace:
+                        await raw.execute(DELETE_BATCH.format(table=comm_node_table, column='message_id'),
+                                          self.user_uuid, batch.msg_ids)
+                        await raw.execute(DELETE_BATCH.format(table=entity_table, column='msg_id'),
+                                          self.user_uuid, batch.msg_ids)
+
+                    await raw.execute(UNNEST_MSG_OBJS, self.user_uuid, batch.msg_ids,
+                                      batch.thread_ids, datetime.datetime.now())
+
+                    inserted = await self._copyIgnoringConflicts(raw, comm_node_table,
+                                                                 CommNodeBatch.COMM_NODE_COLUMNS,
+                                                                 batch.comm_node_records(),
+                                                                 returning='message_id')
+                    await self._copyIgnoringConflicts(raw, entity_table,
+                                                      CommNodeBatch.ENTITY_COLUMNS,
+                                                      batch.entity_records())
+
+                    # One appended segment of the user's term matrix per flushed batch,
+                    # re-scraped and replayed messages already have their row
+                    segment = TermSegment.from_batch(batch, N_FEATURES, only=() if replace else inserted)
+                    if len(segment) > 0:
+                        await connection.execute(self.table_refs['term_segments'].insert().values(
+                            owner=self.user_uuid,
+                            message_count=len(segment),
+                            n_features=N_FEATURES,
+                            data=segment.encode(),
+                            time_created=datetime.datetime.now()
+                        ))
+
+            print(f'successfully saved a batch of {len(batch)} messages to DB')
+
+        except Exception as e:
+            print(f'Error saving a batch of {len(batch)} messages to DB: {e}')
+            self._update_errors(e)
+
+        if log_task:
+            await self._finalize_task()
+
+        return
+
+    @staticmethod
+    async def _copyIgnoringConflicts(raw: 'asyncpg.Connection',
+                                     table_name: str,
+                                     columns: Tuple[str, ...],
+                                     records: Iterator[Tuple],
+                                     returning: Optional[str] = None,
+                                     ) -> Set[str]:
+        '''
+        COPY can't skip conflicting rows, so records go through a temp table dropped
+        on commit. Returns the returning column of every row inserted, if one is given
+        '''
+        staging = f'staging_{table_name}'
+        column_list = ', '.join(columns)
+        returning_clause = f'RETURNING {returning}' if returning else ''
+
+        await raw.execute(f'''
+            CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP
+        ''')
+        await raw.copy_records_to_table(staging, records=records, columns=columns)
+        rows = await raw.fetch(f'''
+            INSERT INTO {table_name} ({column_list})
+            SELECT {column_list} FROM {staging}
+            ON CONFLICT DO NOTHING
+            {returning_clause}
+        ''')
+
+        return {row[returning] for row in rows} if returning else set()
+
     async def insertRow(self,
                         table_name: str,
                         row: Dict[str, any],
@@ -1,6 +1,6 @@
 import datetime
 
-from typing import Generator, List, Tuple
+from typing import Generator, List, Tuple, Optional
 from sqlalchemy.sql import select, insert, join
 
 from itertools import groupby
@@ -8,7 +8,9 @@ from itertools import groupby
 from app.db import TaskTypes
 
 from . import BaseMediator
-from . import entities, comm_nodes, graph_nodes, interactions
+from . import entities, comm_nodes, graph_nodes, interactions, term_segments
+
+from app.data_structures.TermMatrix import TermMatrix, TermSegment
 
 
 class GraphMediator(BaseMediator):
@@ -19,6 +21,12 @@ class GraphMediator(BaseMediator):
     --------
         loadGraphClusters(self, startDate: datetime, endDate: datetime)
             returns a generator that yields groups of entities clustered by msg_id
+        loadTermMatrix(self) -> TermMatrix
+            stacks the user's term segments into one sparse term-document matrix
+        contactTopTerms(self, email: str, n: int = 20) -> List[Tuple[str, int]]
+            most frequent keywords over every message a contact is part of
+        similarMessages(self, msg_id: str, n: int = 10) -> List[Tuple[str, float]]
+            messages closest to msg_id by tf-idf cosine similarity
 
     '''
 
@@ -85,3 +93,50 @@ class GraphMediator(BaseMediator):
 
         # Returns the cluster generator to build the user nodes in the graph worker
         return grouped_gen, self.user_uuid
+
+    async def loadTermMatrix(self) -> TermMatrix:
+        ''' Reads every term segment for the user in write order and stacks them '''
+        query = select([term_segments.c.data]). \
+            where(term_segments.c.owner == self.user_uuid). \
+            order_by(term_segments.c.id)
+
+        rows = await self.database.fetch_all(query)
+
+        return TermMatrix.from_segments(TermSegment.decode(row['data']) for row in rows)
+
+    async def contactTopTerms(self,
+                              email: str,
+                              n: int = 20,
+                              matrix: Optional[TermMatrix] = None,
+                              ) -> List[Tuple[str, int]]:
+        '''
+        Sums the keyword counts of every message a contact shows up on
+
+        Params:
+        -------
+            email: str
+                Contact email address
+            n: int
+                Number of terms to return
+            matrix: Optional[TermMatrix]
+                Already loaded matrix, to run many queries off one load
+        '''
+        matrix = matrix or await self.loadTermMatrix()
+
+        # Entities aren't scoped to a user, the matrix only has this user's messages
+        query = select([entities.c.msg_id]).distinct(). \
+            where(entities.c.email == email)
+
+        rows = await self.database.fetch_all(query)
+
+        return matrix.top_terms((row['msg_id'] for row in rows), n)
+
+    async def similarMessages(self,
+                              msg_id: str,
+                              n: int = 10,
+                              matrix: Optional[TermMatrix] = None,
+                              ) -> List[Tuple[str, float]]:
+        ''' Ranks the user's messages by tf-idf cosine similarity to msg_id '''
+        matrix = matrix or await self.loadTermMatrix()
+
+        return matrix.similar(msg_id, n)
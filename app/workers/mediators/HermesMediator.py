@@ -4,13 +4,22 @@ import os
 import uuid
 import asyncio
 
+from datetime import datetime, timedelta
 from functools import partial
+from itertools import groupby
 from threading import Lock
 
-from typing import Dict, Callable, Awaitable, Tuple, Generator, List
+from typing import Dict, Callable, Awaitable, Tuple, Generator, List, Optional, AsyncIterator
 
-from app.wrappers import Pipeline, Gmail
-from app.db import TaskTypes
+from sqlalchemy import String
+from sqlalchemy.sql import and_, text, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from app.wrappers import Pipeline, Gmail, HistoryExpired, ScrapeFormat, FetchMode, \
+    BatchTuner, get_limiter, get_raw_cache, replay_messages
+import google.oauth2.credentials
+
+from app.db import TaskTypes, CheckpointStatus
 from . import BaseMediator
 from . import users
 
@@ -27,24 +36,95 @@ class HermesMediator(BaseMediator):
     _get_last_message
         Fetches the last message scraped for a specific user
 
-    _chunk_message_bundles(chunk_size: int, query_limit: int)
-        Fetches all message ids for a specific user that are not
-        already stored in the db. Will only fetch message ids up
-        to the specified limit.
+    _get_history_id
+        Fetches the Gmail historyId stored after the user's last sync
+
+    _store_history_id
+        Saves the historyId captured at the start of this sync
 
-    _enqueue_chunks(chunk_gen: Generator[List[str], None, None],
+    _apply_deletions(msg_ids: List[str])
+        Removes messages deleted in Gmail from message_objs,
+        cascading to comm_nodes and entities
+
+    _message_id_stream(query_limit: int)
+        Yields lists of message ids for a specific user that are not
+        already stored in the db. Uses history.list when a historyId
+        is stored and falls back to a full list when it has expired.
+        Full lists are sharded by date, streamed window by window and
+        never capped. History and top up ids are all yielded, in lists of
+        at most query_limit.
+
+    _chunk_message_bundles(chunk_size: int, query_limit: int)
+        Re-chunks the message id stream into chunk_size lists
+        so fetching starts before listing is done
+
+    _filter_known(chunk: List[str])
+        Bulk anti-joins a chunk of candidate ids against message_objs
+        and returns only the ids that haven't been stored yet.
+        Chunks of thread ids are checked against thread_id
+
+    _dedupe_chunks(chunk_gen: AsyncIterator[List[str]])
+        Runs every chunk through _filter_known before it is queued
+
+    _save_checkpoint(checkpoint_id: str, chunk: List[str])
+        Persists a chunk of message ids as a PENDING checkpoint
+        tied to this task
+
+    _set_checkpoint_status(checkpoint_id: str,
+                           status: CheckpointStatus,
+                           fetched_count: Optional[int]
+                           )
+        Moves a checkpoint to PENDING, IN_FLIGHT or DONE
+
+    _queue_chunk(checkpoint_id: str,
+                 chunk: List[str],
+                 window_size: int,
+                 max_workers: int
+                 )
+        Clones the interface for a checkpointed chunk and
+        puts the fetch on the long queue
+
+    _run_chunk(interface: Pipeline,
+               chunk: List[str],
+               window_size: int,
+               max_workers: int
+               )
+        Marks the chunk's checkpoint IN_FLIGHT, then starts the fetch
+
+    _enqueue_chunks(chunk_gen: AsyncIterator[List[str]],
                     window_size: int,
                     max_workers: int
                     )
-        Takes a chunk generator and sends it to be
-        processed in a parallel task queue. The window size
+        Takes a chunk generator, checkpoints every chunk and sends
+        it to be processed in a parallel task queue. The window size
         corresponds to the bundle size for batch Gmail http
         requests and max_workers corresponds to the maximum
         number of parallel worker threads
 
-    tracking_callback(task_details: Tuple[str, int])
+    tracking_callback(task_details: Tuple[str, int, Dict[str, str]])
         Thread safe callback for parallel processing threads
-        to keep track of their progress and status
+        to keep track of their progress and status, marks
+        the chunk's checkpoint DONE and dead letters the ids
+        that failed every fetch round
+
+    _store_dead_letters(failed: Dict[str, str])
+        Upserts ids that exhausted their fetch rounds into
+        dead_letters along with their last error
+
+    _run_retry(interface: Pipeline, chunk: List[str], attempts: Dict[str, int])
+        Fetches a chunk of dead letters again
+
+    _settle_dead_letters(chunk: List[str], attempts: Dict[str, int], task_details)
+        Deletes the dead letters that were fetched and pushes the
+        next attempt of the rest out exponentially
+
+    _make_tuner(window_size: int, max_workers: int)
+        Builds the BatchTuner shared by every chunk of this task,
+        bounded by the app config
+
+    _record_metrics
+        Stores the batch sizing the tuner settled on and the
+        throughput the task reached in task_metrics
 
     wrap_pipeline(chunk_size: int,
                   query_limit: int,
@@ -53,6 +133,16 @@ class HermesMediator(BaseMediator):
                   )
         Main interface for chunking and parallelizing the gmail scrape
 
+    _fan_out(bundle_gen: AsyncIterator[List[str]], window_size: int, max_workers: int)
+        Background task that queues the chunks and logs the task once they finish
+
+    _wait_for_chunks
+        waits for every queued chunk to report back
+
+    wrap_replay(batch_size: int)
+        Re-parses a user's cached raw messages without calling Gmail and
+        returns the node stream for the gmail worker to persist
+
     log_after_complete
         waits for the chunks to finish processing, then
         updates the Task table to reflect the success and 
@@ -71,9 +161,21 @@ class HermesMediator(BaseMediator):
         super().__init__(app.database, user_uuid, TaskType)
         self.app = app
         self.interface = interface
+        # Every Pipeline cloned from this interface shares the user's quota limiter
+        if self.interface.limiter is None:
+            self.interface.limiter = get_limiter(user_uuid)
         self.chunk_count = 0
         self.total_messages = 0
         self.finished_bundles = list()  # List[Tuple[interface_id, msg_count]]
+        self.history_id = None
+        # Set once the id listing ran to the end, the history id only moves forward then
+        self.listing_complete = False
+        self.shard_count = 16
+        self.skipped_messages = 0
+        # Full listings can fetch whole threads, history and top ups always fetch messages
+        self.fetch_mode = self.interface.fetch_mode
+        # Only tracked tasks have a tasks row to hang checkpoints off
+        self.tracked = False
         self._lock = Lock()
 
     @property
@@ -95,50 +197,270 @@ class HermesMediator(BaseMediator):
         else:
             return
 
+    async def _get_history_id(self) -> str:
+        ''' Looks up the historyId stored after the user's last sync '''
+
+        query = '''SELECT history_id FROM users WHERE id = :owner'''
+        row = await self.database.fetch_one(query=query, values={"owner": self.user_uuid})
+
+        if row is not None:
+            return row['history_id']
+        else:
+            return
+
+    async def _store_history_id(self) -> None:
+        '''
+        Saves the historyId captured when this sync started. Skipped when the
+        listing failed or was cut short, the next sync has to list again or
+        the ids it missed would never be fetched.
+        '''
+        if self.history_id is None:
+            return
+
+        if not self.listing_complete:
+            print(f'listing for user: {self.user_uuid} did not finish, keeping the stored history id')
+            return
+
+        try:
+            update_user = self.table_refs['users'].update(). \
+                where(self.table_refs['users'].c.id == self.user_uuid). \
+                values(history_id=self.history_id)
+
+            await self.database.execute(update_user)
+
+        except Exception as e:
+            print(f'error storing history id for user: {self.user_uuid} error: {e}')
+
+    async def _apply_deletions(self, msg_ids: List[str]) -> None:
+        '''
+        Removes messages that were deleted in Gmail. comm_nodes and
+        entities reference message_objs with ON DELETE CASCADE.
+        '''
+        if len(msg_ids) == 0:
+            return
+
+        msg_objs = self.table_refs['msg_objs']
+
+        try:
+            delete_stmt = msg_objs.delete().where(
+                and_(msg_objs.c.owner == self.user_uuid,
+                     msg_objs.c.message_id.in_(msg_ids))
+            )
+
+            await self.database.execute(delete_stmt)
+
+        except Exception as e:
+            print(f'error applying deletions for user: {self.user_uuid} error: {e}')
+
+    async def _message_id_stream(self, query_limit: int) -> AsyncIterator[List[str]]:
+        '''
+        Yields lists of message ids to fetch. Uses history.list when a
+        history id is stored, otherwise lists the mailbox over date shards
+        and yields each window's ids as soon as it is listed.
+        '''
+        start_history_id = await self._get_history_id()
+
+        if start_history_id:
+            try:
+                # Only the messages added or deleted since the last sync
+                msg_ids, deleted, self.history_id = await self.interface.queryHistory(start_history_id)
+                await self._apply_deletions(deleted)
+                self.fetch_mode = FetchMode.MESSAGES
+
+                # The history id moves past every id listed, so none of them can be dropped
+                for i in range(0, len(msg_ids), query_limit):
+                    yield msg_ids[i:i + query_limit]
+
+                self.listing_complete = True
+                return
+
+            except HistoryExpired:
+                print(f'history id {start_history_id} expired, re-listing mailbox')
+
+        # Snapshot the history id before listing so nothing
+        # that arrives mid-scrape is missed by the next sync
+        self.history_id = await self.interface.getHistoryId()
+        # Fetch most recent message
+        last_message = await self._get_last_message()
+
+        if last_message:
+            # Top up from the newest message until we reach the last one we stored
+            # Not capped either: the next top up starts from the newest stored message,
+            # so ids past a cap would never be listed
+            msg_ids, msg_count, complete = await self.interface.queryGmail(last_message, None)
+            self.fetch_mode = FetchMode.MESSAGES
+
+            for i in range(0, len(msg_ids), query_limit):
+                yield msg_ids[i:i + query_limit]
+
+            # False when a page failed to list
+            self.listing_complete = complete
+            return
+
+        # Nothing stored yet, list the whole mailbox (or its threads) concurrently.
+        # Not capped, the history id saved afterwards assumes every id was listed
+        async for msg_ids in self.interface.iterMessageIds(self.shard_count):
+            yield msg_ids
+
+        self.listing_complete = True
+
     async def _chunk_message_bundles(self,
                                      chunk_size: int,
                                      query_limit: int,
-                                     ) -> Generator[List[str], None, None]:
+                                     ) -> AsyncIterator[List[str]]:
         '''
-        Chunks bundles of messages and returns a generator that
-        yields lists of msg id strings.
+        Async generator that re-chunks the message id stream into
+        lists of chunk_size msg id strings as the ids come in.
         '''
+        pending = []
 
-        # Fetch most recent message
-        last_message = await self._get_last_message()
-        # Get a list of all message ids and the count of all message ids from Gmail
-        msg_ids, msg_count = await self.interface.queryGmail(last_message, query_limit)
-        self.total_messages = msg_count
+        async for msg_ids in self._message_id_stream(query_limit):
+            self.total_messages += len(msg_ids)
+            pending.extend(msg_ids)
+
+            while len(pending) >= chunk_size:
+                yield pending[:chunk_size]
+                pending = pending[chunk_size:]
 
-        # Create a generator to bundle the message ids into chunks
-        bundle_gen = self.interface._bundler(msg_ids, chunk_size)
+        if len(pending) > 0:
+            yield pending
+
+    async def _filter_known(self, chunk: List[str]) -> List[str]:
+        '''
+        Returns the ids in chunk that aren't in message_objs for this user,
+        using a single array anti-join rather than a lookup per id.
+        In THREADS mode a thread is skipped once any of its messages is stored.
+        '''
+        column = 'thread_id' if self.fetch_mode == FetchMode.THREADS else 'message_id'
+
+        query = text(f'''
+            SELECT candidate.id FROM unnest(:ids) WITH ORDINALITY AS candidate(id, pos)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM message_objs
+                WHERE message_objs.owner = :owner AND message_objs.{column} = candidate.id
+            )
+            ORDER BY candidate.pos
+        ''').bindparams(
+            bindparam('owner', value=self.user_uuid),
+            bindparam('ids', value=chunk, type_=ARRAY(String)),
+        )
+
+        try:
+            rows = await self.database.fetch_all(query)
+        except Exception as e:
+            print(f'error checking chunk against message_objs: {e}')
+            return chunk
+
+        return [row['id'] for row in rows]
+
+    async def _dedupe_chunks(self,
+                             chunk_gen: AsyncIterator[List[str]],
+                             ) -> AsyncIterator[List[str]]:
+        ''' Drops the ids we've already stored from every chunk before it is queued '''
+        async for chunk in chunk_gen:
+            unseen = await self._filter_known(chunk)
+            self.skipped_messages += len(chunk) - len(unseen)
+
+            yield unseen
+
+    async def _save_checkpoint(self, checkpoint_id: str, chunk: List[str]) -> None:
+        ''' Stores a chunk of message ids as a PENDING checkpoint for this task '''
+        if not self.tracked:
+            return
 
-        return bundle_gen
+        new_checkpoint = {
+            'id': checkpoint_id,
+            'task_id': self.task_uuid,
+            'owner': self.user_uuid,
+            'status': CheckpointStatus['PENDING'].name,
+            'scrape_format': self.interface.scrape_format.name,
+            'fetch_mode': self.fetch_mode.name,
+            'first_id': chunk[0],
+            'last_id': chunk[-1],
+            'message_ids': chunk,
+            'fetched_count': 0,
+            'time_updated': datetime.now(),
+        }
+
+        try:
+            insert_stmt = self.table_refs['scrape_checkpoints'].insert().values(new_checkpoint)
+            await self.database.execute(insert_stmt)
+
+        except Exception as e:
+            # The chunk still gets fetched, it just won't survive a restart
+            print(f'error saving checkpoint for task: {self.task_uuid} error: {e}')
+
+    async def _set_checkpoint_status(self,
+                                     checkpoint_id: str,
+                                     status: CheckpointStatus,
+                                     fetched_count: Optional[int] = None,
+                                     ) -> None:
+        ''' Moves a checkpoint to a new status '''
+        checkpoints = self.table_refs['scrape_checkpoints']
+        values = {'status': status.name, 'time_updated': datetime.now()}
+
+        if fetched_count is not None:
+            values['fetched_count'] = fetched_count
+
+        try:
+            update_checkpoint = checkpoints.update(). \
+                where(checkpoints.c.id == checkpoint_id). \
+                values(**values)
+
+            await self.database.execute(update_checkpoint)
+
+        except Exception as e:
+            print(f'error updating checkpoint: {checkpoint_id} error: {e}')
+
+    async def _queue_chunk(self,
+                           checkpoint_id: str,
+                           chunk: List[str],
+                           window_size: int,
+                           max_workers: int,
+                           ) -> None:
+        ''' Puts the fetch for a checkpointed chunk on the long queue '''
+        # The checkpoint id doubles as the id used to track progress
+        parallel_interface = self.interface._clone_interface(checkpoint_id, self.fetch_mode)
+        routine = partial(self._run_chunk,
+                          parallel_interface,
+                          chunk,
+                          window_size,
+                          max_workers,
+                          )
+
+        await self.app.long_queue.put(routine, self.user_uuid)
+        self.chunk_count += 1
+
+    async def _run_chunk(self,
+                         interface: Pipeline,
+                         chunk: List[str],
+                         window_size: int,
+                         max_workers: int,
+                         ) -> Tuple[AsyncIterator['CommNodeBatch'], str]:
+        ''' Marks the chunk IN_FLIGHT once a worker picks it up and starts the fetch '''
+        await self._set_checkpoint_status(interface.interface_id, CheckpointStatus['IN_FLIGHT'])
+
+        return await interface.hermes(chunk,
+                                      window_size,
+                                      max_workers,
+                                      self.user_uuid,
+                                      self.tracking_callback
+                                      )
 
     async def _enqueue_chunks(self,
-                              chunk_gen: Generator[List[str], None, None],
+                              chunk_gen: AsyncIterator[List[str]],
                               window_size: int,
                               max_workers: int,
                               ) -> None:
 
-
-        for chunk in chunk_gen:
+        async for chunk in chunk_gen:
             # Don't queue empty lists
             if len(chunk) == 0:
                 continue
-            # Make an id to track progress on the different processes
-            tracking_id = uuid.uuid4
-            parallel_interface = self.interface._clone_interface(str(tracking_id))
-            routine = partial(parallel_interface.hermes,
-                              chunk,
-                              window_size,
-                              max_workers,
-                              self.user_uuid,
-                              self.tracking_callback
-                              )
-
-            await self.app.long_queue.put(routine)
-            self.chunk_count += 1
+
+            checkpoint_id = str(uuid.uuid4())
+            await self._save_checkpoint(checkpoint_id, chunk)
+            await self._queue_chunk(checkpoint_id, chunk, window_size, max_workers)
 
     async def tracking_callback(self, task_details: Tuple[str, int]) -> None:
         '''
@@ -163,13 +485,146 @@ class HermesMediator(BaseMediator):
             finally:
                 self._lock.release()
 
+        await self._set_checkpoint_status(task_details[0], CheckpointStatus['DONE'], task_details[1])
+
+        if len(task_details) > 2 and len(task_details[2]) > 0:
+            await self._store_dead_letters(task_details[2])
+
+    async def _store_dead_letters(self, failed: Dict[str, str]) -> None:
+        '''
+        Parks ids that failed every fetch round so the dead letter
+        worker can retry them without holding up the scrape
+        '''
+        now = datetime.now()
+        next_attempt = now + timedelta(seconds=self.app.config.DEAD_LETTER_BASE_DELAY)
+
+        rows = [{
+            'id': str(uuid.uuid4()),
+            'owner': self.user_uuid,
+            'task_id': self.task_uuid if self.tracked else None,
+            'message_id': msg_id,
+            'fetch_mode': self.fetch_mode.name,
+            'scrape_format': self.interface.scrape_format.name,
+            'attempts': 0,
+            'last_error': error,
+            'next_attempt': next_attempt,
+            'time_created': now,
+        } for msg_id, error in failed.items()]
+
+        stmt = insert(self.table_refs['dead_letters'])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['owner', 'message_id'],
+            set_={
+                'task_id': stmt.excluded.task_id,
+                'last_error': stmt.excluded.last_error,
+                'next_attempt': stmt.excluded.next_attempt,
+            }
+        )
+
+        try:
+            await self.database.execute_many(query=stmt, values=rows)
+        except Exception as e:
+            print(f'error storing {len(rows)} dead letters for user: {self.user_uuid} error: {e}')
+
+    async def _run_retry(self,
+                         interface: Pipeline,
+                         chunk: List[str],
+                         attempts: Dict[str, int],
+                         ) -> Tuple[AsyncIterator['CommNodeBatch'], str]:
+        ''' Fetches a chunk of dead letters, settled once the fetch is over '''
+        return await interface.hermes(chunk,
+                                      interface.tuner.window_size,
+                                      interface.tuner.max_workers,
+                                      self.user_uuid,
+                                      partial(self._settle_dead_letters, chunk, attempts)
+                                      )
+
+    async def _settle_dead_letters(self,
+                                   chunk: List[str],
+                                   attempts: Dict[str, int],
+                                   task_details: Tuple[str, int, Dict[str, str]],
+                                   ) -> None:
+        '''
+        Deletes the dead letters that were fetched this time. The rest wait
+        DEAD_LETTER_BASE_DELAY * 2 ** attempts seconds for their next try,
+        or get no next try once DEAD_LETTER_MAX_ATTEMPTS is used up.
+        '''
+        config = self.app.config
+        dead_letters = self.table_refs['dead_letters']
+        failed = task_details[2]
+        fetched = [msg_id for msg_id in chunk if msg_id not in failed]
+        now = datetime.now()
+
+        try:
+            if len(fetched) > 0:
+                await self.database.execute(dead_letters.delete().where(
+                    and_(dead_letters.c.owner == self.user_uuid,
+                         dead_letters.c.message_id.in_(fetched))
+                ))
+
+            for msg_id, error in failed.items():
+                tries = attempts.get(msg_id, 0) + 1
+                next_attempt = None
+                if tries < config.DEAD_LETTER_MAX_ATTEMPTS:
+                    next_attempt = now + timedelta(seconds=config.DEAD_LETTER_BASE_DELAY * 2 ** tries)
+
+                await self.database.execute(dead_letters.update().where(
+                    and_(dead_letters.c.owner == self.user_uuid,
+                         dead_letters.c.message_id == msg_id)
+                ).values(attempts=tries, last_error=error, next_attempt=next_attempt))
+
+        except Exception as e:
+            print(f'error settling dead letters for user: {self.user_uuid} error: {e}')
+
+    def _make_tuner(self, window_size: int, max_workers: int) -> BatchTuner:
+        ''' Starts a tuner at the given sizes, bounded by the app config '''
+        config = self.app.config
+
+        return BatchTuner(window_size,
+                          max_workers,
+                          min_window=config.MIN_WINDOW_SIZE,
+                          max_window=config.MAX_WINDOW_SIZE,
+                          min_workers=config.MIN_FETCH_WORKERS,
+                          max_workers_limit=config.MAX_FETCH_WORKERS,
+                          )
+
+    async def _record_metrics(self) -> None:
+        ''' Stores the tuner's chosen values, the task's throughput, how often body limits hit and the address cache hit rate '''
+        if self.interface.tuner is None:
+            return
+
+        summary = self.interface.tuner.summary()
+        summary['truncations'] = dict(self.interface.truncations)
+
+        hits, misses = self.interface.address_cache['hits'], self.interface.address_cache['misses']
+        summary['address_cache'] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+        print(f'hermes task {self.task_uuid} metrics: {summary}')
+
+        try:
+            insert_stmt = self.table_refs['task_metrics'].insert().values(
+                task_id=self.task_uuid,
+                owner=self.user_uuid,
+                time_recorded=datetime.now(),
+                **summary
+            )
+            await self.database.execute(insert_stmt)
+
+        except Exception as e:
+            print(f'error recording metrics for task: {self.task_uuid} error: {e}')
 
     async def wrap_pipeline(self,
                             chunk_size: int = 1000,
                             query_limit: int = 2000,
                             window_size: int = 15,
                             max_workers: int = 4,
-                            tracked: bool = False) -> None:
+                            tracked: bool = False,
+                            scrape_format: Optional[ScrapeFormat] = None,
+                            shard_count: int = 16,
+                            fetch_mode: Optional[FetchMode] = None) -> None:
         '''
         Task wrapper for chunked pipeline execution
 
@@ -178,19 +633,77 @@ class HermesMediator(BaseMediator):
         chunk_size: int = 1000
             Number of message ids in chunk to bundle and fetch from Gmail API
         query_limit: int = 2000
-            Max number of message ids to gather and query
+            Size of the lists history and top up ids are yielded in,
+            no listing is capped so the history id can move past it
         window_size: int = 15
-            Size of bundle to fetch from Gmail API
+            Starting size of the bundles fetched from Gmail API, tuned at runtime
         max_workers: int = 4
-            Max number of worker threads to run in executor
+            Starting number of batches in flight, tuned at runtime
+        scrape_format: Optional[ScrapeFormat] = None
+            METADATA to only pull the headers needed for the contact graph
+        shard_count: int = 16
+            Number of date windows to list concurrently on a full listing
+        fetch_mode: Optional[FetchMode] = None
+            THREADS to fetch whole conversations with threads.get on a full listing
         '''
-        bundle_gen = await self._chunk_message_bundles(chunk_size, query_limit)
-        await self._enqueue_chunks(bundle_gen, window_size, max_workers)
-
-        if tracked:
+        self.shard_count = shard_count
+        if scrape_format is not None:
+            self.interface.scrape_format = scrape_format
+        if fetch_mode is not None:
+            self.interface.fetch_mode = fetch_mode
+            self.fetch_mode = fetch_mode
+
+        self.tracked = tracked
+
+        self.interface.tuner = self._make_tuner(window_size, max_workers)
+
+        bundle_gen = self._dedupe_chunks(
+            self._chunk_message_bundles(chunk_size, query_limit)
+        )
+
+        # Listing and queueing run beside the gmail workers so they don't hold a
+        # worker slot while waiting on this user's lane of the long queue
+        self.app.add_task(self._fan_out(bundle_gen, window_size, max_workers))
+
+    async def _fan_out(self,
+                       bundle_gen: AsyncIterator[List[str]],
+                       window_size: int,
+                       max_workers: int,
+                       ) -> None:
+        ''' Queues every chunk, then waits on the chunks if the task is tracked '''
+        try:
+            await self._enqueue_chunks(bundle_gen, window_size, max_workers)
+        except Exception as e:
+            print(f'error queueing chunks for task: {self.task_uuid} error: {e}')
+            self.errors.append(str(e))
+
+        if self.tracked:
             await self.log_after_complete()
+        else:
+            await self._wait_for_chunks()
+            await self._store_history_id()
 
-    async def log_after_complete(self):
+    async def wrap_replay(self, batch_size: int = 200) -> Tuple[AsyncIterator['CommNodeBatch'], str, bool]:
+        '''
+        Task wrapper to re-process a mailbox from the raw message cache. The
+        trailing True asks the db worker to replace the comm_nodes and entities
+        of every batch in the same transaction that stores the re-parsed rows,
+        so a failed replay never leaves messages without them. message_objs
+        rows are left in place.
+
+        Params:
+        -------
+        batch_size: int = 200
+            Number of cached messages handed to a parse process at a time
+        '''
+        cache = get_raw_cache()
+        if cache is None:
+            raise Exception('raw message cache is not configured')
+
+        return replay_messages(cache, self.user_uuid, batch_size), self.user_uuid, True
+
+    async def _wait_for_chunks(self) -> None:
+        ''' Waits until every queued chunk has reported back through tracking_callback '''
         while True:
             if self.chunk_count > len(self.finished_bundles):
                 await asyncio.sleep(3)
@@ -198,4 +711,200 @@ class HermesMediator(BaseMediator):
             else:
                 break
 
+    async def log_after_complete(self):
+        await self._wait_for_chunks()
+
+        # Only move the sync point forward once every chunk has landed
+        await self._store_history_id()
+        await self._record_metrics()
         await self._finalize_task()
+
+
+def _mediator_from_row(app: Sanic, row: 'Record') -> Optional[HermesMediator]:
+    '''
+    Rebuilds a HermesMediator for a stored row that carries the owner,
+    scrape_format and fetch_mode plus the owner's oauth columns from users.
+    Returns None when the user has no stored credentials.
+    '''
+    if not row['refresh_token']:
+        return
+
+    creds = google.oauth2.credentials.Credentials(
+        token=row['token'],
+        refresh_token=row['refresh_token'],
+        token_uri=row['token_uri'],
+        client_id=row['client_id'],
+        client_secret=row['client_secret'],
+        scopes=row['scopes'],
+    )
+    scrape_format = ScrapeFormat[row['scrape_format'] or 'FULL']
+    fetch_mode = FetchMode[row['fetch_mode'] or 'MESSAGES']
+
+    mediator = HermesMediator(
+        app,
+        str(row['owner']),
+        TaskTypes['HERMES'],
+        Pipeline(creds, 0.7, '', scrape_format=scrape_format, fetch_mode=fetch_mode),
+    )
+    mediator.interface.tuner = mediator._make_tuner(app.config.WINDOW_SIZE,
+                                                    app.config.FETCH_WORKERS)
+
+    return mediator
+
+
+async def resume_checkpoints(app: Sanic) -> int:
+    '''
+    Claims and re-queues every unfinished checkpoint that belongs to a
+    Hermes task that never finished, eg: after a deploy or crash. Claimed
+    rows move to RESUMING in the same statement that selects them, so
+    workers starting side by side never queue the same chunk twice. A
+    claim left behind by a worker that died mid resume is taken over after
+    an hour. Ids that were stored before the restart are dropped before
+    the chunk is queued again. Returns the number of chunks re-queued.
+    '''
+    now = datetime.now()
+
+    query = '''
+        UPDATE scrape_checkpoints SET status = 'RESUMING', time_updated = :now
+        FROM users
+        WHERE users.id = scrape_checkpoints.owner AND scrape_checkpoints.id IN (
+            SELECT scrape_checkpoints.id FROM scrape_checkpoints
+            JOIN tasks ON tasks.id = scrape_checkpoints.task_id
+            WHERE tasks.time_finished IS NULL
+            AND (scrape_checkpoints.status IN ('PENDING', 'IN_FLIGHT')
+                 OR (scrape_checkpoints.status = 'RESUMING' AND scrape_checkpoints.time_updated <= :stale))
+            FOR UPDATE OF scrape_checkpoints SKIP LOCKED
+        )
+        RETURNING scrape_checkpoints.id, scrape_checkpoints.task_id, scrape_checkpoints.owner,
+            scrape_checkpoints.scrape_format, scrape_checkpoints.fetch_mode,
+            scrape_checkpoints.message_ids,
+            users.token, users.refresh_token, users.token_uri,
+            users.client_id, users.client_secret, users.scopes
+    '''
+
+    try:
+        rows = await app.database.fetch_all(query=query, values={
+            'now': now,
+            'stale': now - timedelta(hours=1),
+        })
+    except Exception as e:
+        print(f'error claiming scrape checkpoints: {e}')
+        return 0
+
+    # RETURNING comes back unordered
+    rows = sorted(rows, key=lambda row: str(row['task_id']))
+
+    resumed = 0
+
+    for task_id, task_rows in groupby(rows, key=lambda row: str(row['task_id'])):
+        task_rows = list(task_rows)
+        mediator = _mediator_from_row(app, task_rows[0])
+
+        if mediator is None:
+            print(f'no stored credentials to resume task: {task_id}')
+
+            # Hand the claim back so the task can resume once the user signs in again
+            try:
+                await app.database.execute(query='''
+                    UPDATE scrape_checkpoints SET status = 'PENDING'
+                    WHERE task_id = :task_id AND status = 'RESUMING'
+                ''', values={'task_id': task_id})
+            except Exception as e:
+                print(f'error releasing checkpoints for task: {task_id} error: {e}')
+            continue
+
+        # Pick the original task back up rather than logging a new one
+        mediator.task_uuid = str(task_id)
+        mediator.tracked = True
+
+        for row in task_rows:
+            checkpoint_id = str(row['id'])
+            chunk = await mediator._filter_known(row['message_ids'] or [])
+
+            if len(chunk) == 0:
+                await mediator._set_checkpoint_status(checkpoint_id, CheckpointStatus['DONE'])
+                continue
+
+            # Stays RESUMING until a gmail worker marks it IN_FLIGHT
+            await mediator._queue_chunk(checkpoint_id,
+                                        chunk,
+                                        app.config.WINDOW_SIZE,
+                                        app.config.FETCH_WORKERS,
+                                        )
+            resumed += 1
+
+        app.add_task(mediator.log_after_complete())
+
+    print(f'resumed {resumed} scrape checkpoints')
+    return resumed
+
+
+async def retry_dead_letters(app: Sanic) -> int:
+    '''
+    Claims the dead letters that are due and queues them to be fetched
+    again. Claimed rows are leased for an hour so a slow retry isn't
+    picked up twice. Returns the number of ids queued.
+    '''
+    config = app.config
+    now = datetime.now()
+
+    query = '''
+        UPDATE dead_letters SET next_attempt = :lease
+        FROM users
+        WHERE users.id = dead_letters.owner AND dead_letters.id IN (
+            SELECT id FROM dead_letters
+            WHERE next_attempt <= :now
+            ORDER BY next_attempt
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING dead_letters.owner, dead_letters.message_id, dead_letters.attempts,
+            dead_letters.scrape_format, dead_letters.fetch_mode,
+            users.token, users.refresh_token, users.token_uri,
+            users.client_id, users.client_secret, users.scopes
+    '''
+
+    try:
+        rows = await app.database.fetch_all(query=query, values={
+            'lease': now + timedelta(hours=1),
+            'now': now,
+            'limit': config.DEAD_LETTER_BATCH_SIZE,
+        })
+    except Exception as e:
+        print(f'error claiming dead letters: {e}')
+        return 0
+
+    def group_key(row):
+        return (str(row['owner']), row['fetch_mode'] or '', row['scrape_format'] or '')
+
+    queued = 0
+
+    for key, group in groupby(sorted(rows, key=group_key), key=group_key):
+        group = list(group)
+        mediator = _mediator_from_row(app, group[0])
+
+        if mediator is None:
+            print(f'no stored credentials to retry dead letters for user: {key[0]}')
+            continue
+
+        attempts = {row['message_id']: row['attempts'] for row in group}
+        msg_ids = await mediator._filter_known(list(attempts))
+
+        # Stored by another scrape in the meantime
+        unseen = set(msg_ids)
+        stored = [msg_id for msg_id in attempts if msg_id not in unseen]
+        if len(stored) > 0:
+            await mediator._settle_dead_letters(stored, attempts, ('', 0, {}))
+
+        for i in range(0, len(msg_ids), config.CHUNK_SIZE):
+            chunk = msg_ids[i:i+config.CHUNK_SIZE]
+            parallel_interface = mediator.interface._clone_interface(str(uuid.uuid4()))
+            routine = partial(mediator._run_retry, parallel_interface, chunk, attempts)
+
+            await app.long_queue.put(routine, mediator.user_uuid)
+            queued += len(chunk)
+
+    if queued > 0:
+        print(f'queued {queued} dead letters for another try')
+
+    return queued
@@ -1,9 +1,10 @@
 from ...db import users, message_objs, comm_nodes, \
     entities, tasks, interactions, interaction_groups, \
-    graph_nodes, TaskTypes, subscriptions, form_data
+    graph_nodes, TaskTypes, subscriptions, form_data, \
+    scrape_checkpoints, task_metrics, dead_letters, term_segments, CheckpointStatus
 
 from .BaseMediator import BaseMediator
 from .AuthMediator import AuthMediator
 from .GraphMediator import GraphMediator
 from .DBMediator import DBMediator
-from .HermesMediator import HermesMediator
+from .HermesMediator import HermesMediator, resume_checkpoints, retry_dead_letters
@@ -6,10 +6,10 @@ from typing import Optional, Union, List, Dict, Generator
 
 from functools import partial
 
-from googleapiclient.discovery import build
 from httplib2 import Http
 
 from ..helpers.clock import coClock, clock
+from .ServiceFactory import get_service
 
 import asyncio
 from asyncio import Semaphore
@@ -32,6 +32,32 @@ class WrapperOpts(Enum):
     MESSAGES = 2
     THREADS = 3
 
+class ScrapeFormat(Enum):
+    '''
+    How much of each message to pull from the gmail API:
+    Attributes:
+    -----------
+        FULL = 1
+        METADATA = 2
+    '''
+
+    FULL = 1
+    METADATA = 2
+
+class FetchMode(Enum):
+    '''
+    Which Gmail resource a scrape lists and fetches:
+    Attributes:
+    -----------
+        MESSAGES = 1
+            one messages.get per message
+        THREADS = 2
+            one threads.get per conversation, fanned out into messages
+    '''
+
+    MESSAGES = 1
+    THREADS = 2
+
 class BaseWrapper:
     '''
     Base Class interface to provide an easier mechanism to interact with Gmail API
@@ -47,16 +73,20 @@ class BaseWrapper:
     Methods:
     --------
         _genServiceObjs(self)
-            Helper method to generate service object and query wrappers
+            Helper method to fetch the shared service object for the creds
+
+        @property
+        wrappers(self)
+            Query wrappers for labels, messages and threads, built on first use
 
     '''
-    __slots__ = ['creds', 'userId', 'maxResults', 'wrappers', 'service']
+    __slots__ = ['creds', 'userId', 'maxResults', '_wrappers', 'service']
 
     def __init__(self, creds: any, max_results: Optional[int] = 5) -> None:
         self.creds = creds
         self.userId = 'me'
         self.maxResults = max_results
-        self.wrappers = {}
+        self._wrappers = None
         self.service = None
 
 
@@ -68,21 +98,26 @@ class BaseWrapper:
 
     def _genServiceObjs(self) -> None:
         '''
-        Helper function to generate a gmail api service object when
-        Gmail wrapper is instantiated with creds. Also stores a few
-        convenience methods for accessing specific portions of the gmail api.
+        Helper function to grab the gmail api service object when
+        Gmail wrapper is instantiated with creds. The service is built
+        from the bundled discovery document and shared by every wrapper
+        using the same creds, so this is cheap to call per instance.
+        '''
+        self.service = get_service(self.creds)
+
+    @property
+    def wrappers(self) -> Dict[WrapperOpts, 'HttpRequest']:
+        '''
+        Stores a few convenience methods for accessing specific
+        portions of the gmail api. Built on first access since most
+        interfaces never use them.
         '''
-        service = build(
-            os.environ.get('API_SERVICE_NAME'),
-            os.environ.get('API_VERSION'),
-            credentials=self.creds
-        )
-
-        self.service = service
-
-        self.wrappers = {
-            WrapperOpts(1): service.users().labels().list(userId=self.userId),
-            WrapperOpts(2): service.users().messages().list(userId=self.userId),
-            WrapperOpts(3): service.users().threads().list(userId=self.userId,
-                                                           maxResults=self.maxResults),
-        }
+        if self._wrappers is None:
+            self._wrappers = {
+                WrapperOpts(1): self.service.users().labels().list(userId=self.userId),
+                WrapperOpts(2): self.service.users().messages().list(userId=self.userId),
+                WrapperOpts(3): self.service.users().threads().list(userId=self.userId,
+                                                                    maxResults=self.maxResults),
+            }
+
+        return self._wrappers
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import uuid
+
+from typing import Optional, List, Dict, Tuple, Callable, Union
+from urllib.parse import urlencode
+
+import aiohttp
+
+from google.auth.transport.requests import Request
+
+
+API_ROOT = 'https://www.googleapis.com'
+SERVICE_PATH = '/gmail/v1/'
+BATCH_PATH = '/batch/gmail/v1'
+
+# Process wide keep-alive session shared by every AsyncBatchClient
+_session = None
+
+
+class GmailError(Exception):
+    '''
+    Raised for a failed Gmail API request or batch sub-request
+
+    Attributes:
+    -----------
+        status: int
+            HTTP status code of the (sub) response
+        reason: str
+            Gmail error reason, eg: rateLimitExceeded
+        content: bytes
+            Raw response body
+    '''
+
+    def __init__(self, status: int, reason: str = '', content: bytes = b'') -> None:
+        super().__init__(f'<GmailError {status} "{reason}">')
+        self.status = status
+        self.reason = reason
+        self.content = content
+
+    @classmethod
+    def from_response(cls, status: int, content: bytes) -> 'GmailError':
+        ''' Pulls the error reason out of a Gmail json error body '''
+        reason = ''
+        try:
+            error = json.loads(content).get('error', {})
+            errors = error.get('errors', [])
+            reason = errors[0].get('reason', '') if errors else error.get('message', '')
+        except Exception:
+            reason = content[:100].decode('utf-8', 'replace')
+
+        return cls(status, reason, content)
+
+
+async def get_session(connection_limit: int = 100) -> aiohttp.ClientSession:
+    '''
+    Returns the process wide aiohttp session, creating it on first use.
+    Connections are kept alive and re-used across batches so that each
+    batch doesn't pay for a fresh TCP + TLS handshake.
+    '''
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=connection_limit, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=120)
+        )
+
+    return _session
+
+
+async def close_session(*args, **kwargs) -> None:
+    ''' Closes the shared session, registered as a server stop listener '''
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+    _session = None
+
+
+class BatchRequest:
+    '''
+    A multipart/mixed batch of Gmail API GET requests
+
+    Attributes:
+    -----------
+        callback: Callable[[str, any, Exception], None]
+            called once per sub-request with a 1-based request_id string,
+            the parsed json response (or None) and an exception (or None)
+        requests: List[str]
+            Relative request paths including query string
+
+    Methods:
+    --------
+        add(self, path: str, params: Optional[Dict[str, any]] = None)
+            Adds a GET request for a path relative to the Gmail v1 service root
+        encode(self) -> Tuple[bytes, str]
+            Returns the multipart body and its content type header
+    '''
+    __slots__ = ['callback', 'requests', 'boundary']
+
+    def __init__(self, callback: Callable[[str, any, Exception], None]) -> None:
+        self.callback = callback
+        self.requests = list()
+        self.boundary = f'batch_{uuid.uuid4().hex}'
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def add(self, path: str, params: Optional[Dict[str, any]] = None) -> None:
+        if params:
+            path = f'{path}?{urlencode(params, doseq=True)}'
+
+        self.requests.append(path)
+
+    def encode(self) -> Tuple[bytes, str]:
+        delimiter = f'--{self.boundary}'
+        parts = []
+
+        for request_id, path in enumerate(self.requests, 1):
+            parts.append(
+                f'{delimiter}\r\n'
+                'Content-Type: application/http\r\n'
+                'Content-Transfer-Encoding: binary\r\n'
+                f'Content-ID: <{request_id}>\r\n\r\n'
+                f'GET {SERVICE_PATH}{path} HTTP/1.1\r\n\r\n'
+            )
+
+        parts.append(f'{delimiter}--\r\n')
+        body = ''.join(parts).encode('utf-8')
+
+        return body, f'multipart/mixed; boundary={self.boundary}'
+
+
+class AsyncBatchClient:
+    '''
+    asyncio native transport for the Gmail API. Batches are encoded as
+    multipart/mixed requests and the responses are demultiplexed back into
+    per-request callbacks, all over a pooled keep-alive session so that
+    hundreds of batches can be in flight on one event loop.
+
+    Attributes:
+    -----------
+        creds: any
+            Google Oauth2 credential object with appropriate scopes
+
+    Methods:
+    --------
+        new_batch_http_request(self, callback)
+            Returns an empty BatchRequest, mirrors the googleapiclient service method
+        execute(self, batch: BatchRequest)
+            Sends the batch and dispatches every sub-response to the batch callback
+        request(self, path: str, params: Optional[Dict[str, any]] = None)
+            Sends a single GET request and returns the parsed json response
+        _split_multipart(body: bytes, boundary: bytes)
+            Splits a multipart/mixed batch response into (content_id, status, body) tuples
+    '''
+    __slots__ = ['creds', '_refresh_lock']
+
+    def __init__(self, creds: any) -> None:
+        self.creds = creds
+        self._refresh_lock = None
+
+    @staticmethod
+    def new_batch_http_request(callback: Callable[[str, any, Exception], None]) -> BatchRequest:
+        return BatchRequest(callback)
+
+    async def _auth_headers(self, force_refresh: bool = False) -> Dict[str, str]:
+        ''' Refreshes expired credentials off the event loop and returns the auth header '''
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        async with self._refresh_lock:
+            if force_refresh or not self.creds.valid:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.creds.refresh, Request())
+
+        headers = {}
+        self.creds.apply(headers)
+        return headers
+
+    async def _send(self, method: str, url: str, **kwargs) -> Tuple[int, Dict[str, str], bytes]:
+        session = await get_session()
+        extra_headers = kwargs.pop('headers', {})
+
+        for attempt in range(2):
+            headers = await self._auth_headers(force_refresh=attempt > 0)
+            headers.update(extra_headers)
+
+            async with session.request(method, url, headers=headers, **kwargs) as response:
+                content = await response.read()
+
+                # Stale token, refresh once and try again
+                if response.status == 401 and attempt == 0:
+                    continue
+
+                return response.status, response.headers, content
+
+    async def request(self, path: str, params: Optional[Dict[str, any]] = None) -> Dict[str, any]:
+        '''
+        Sends a single GET request to the Gmail API
+
+        Params:
+        -------
+            path: str
+                Path relative to the Gmail v1 service root, eg: users/me/messages
+            params: Optional[Dict[str, any]]
+                Query string parameters
+
+        Raises GmailError on a non 2xx response
+        '''
+        url = f'{API_ROOT}{SERVICE_PATH}{path}'
+        if params:
+            url = f'{url}?{urlencode(params, doseq=True)}'
+
+        status, headers, content = await self._send('GET', url)
+
+        if status >= 300:
+            raise GmailError.from_response(status, content)
+
+        return json.loads(content)
+
+    async def execute(self, batch: BatchRequest) -> None:
+        '''
+        Executes a BatchRequest and dispatches each sub-response to the batch callback.
+        A request the response has no usable part for is failed with a GmailError.
+        Raises GmailError if the batch as a whole fails.
+        '''
+        if len(batch) == 0:
+            return
+
+        body, content_type = batch.encode()
+        status, headers, content = await self._send(
+            'POST',
+            f'{API_ROOT}{BATCH_PATH}',
+            data=body,
+            headers={'Content-Type': content_type}
+        )
+
+        if status >= 300:
+            raise GmailError.from_response(status, content)
+
+        response_type = headers.get('Content-Type', '')
+        if 'boundary=' not in response_type:
+            raise GmailError(status, 'missing multipart boundary', content)
+
+        boundary = response_type.split('boundary=', 1)[1].split(';')[0].strip('"')
+
+        answered = set()
+
+        for content_id, sub_status, sub_content in self._split_multipart(content, boundary.encode()):
+            # Content-ID comes back as <response-N>
+            request_id = content_id.rsplit('-', 1)[-1]
+
+            # Can't be matched to a request, the request is failed below instead
+            if not request_id.isdigit() or not 0 < int(request_id) <= len(batch) or request_id in answered:
+                print(f'Skipping batch part with Content-ID: {content_id!r}')
+                continue
+
+            answered.add(request_id)
+
+            if sub_status >= 300:
+                batch.callback(request_id, None, GmailError.from_response(sub_status, sub_content))
+                continue
+
+            try:
+                parsed = json.loads(sub_content)
+            except ValueError as e:
+                batch.callback(request_id, None, e)
+                continue
+
+            batch.callback(request_id, parsed, None)
+
+        for request_id in map(str, range(1, len(batch) + 1)):
+            if request_id not in answered:
+                batch.callback(request_id, None, GmailError(500, 'missing batch sub-response'))
+
+    @staticmethod
+    def _split_multipart(body: bytes, boundary: bytes) -> List[Tuple[str, int, bytes]]:
+        '''
+        Walks a multipart/mixed batch response without building a MIME tree.
+        Each part wraps an http response: status line, headers, blank line, body.
+        '''
+        output = []
+
+        for part in body.split(b'--' + boundary):
+            part = part.strip(b'\r\n')
+            if not part or part == b'--':
+                continue
+
+            outer_headers, _, http_response = part.partition(b'\r\n\r\n')
+
+            content_id = ''
+            for line in outer_headers.split(b'\r\n'):
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-id':
+                    content_id = value.strip().strip(b'<>').decode('utf-8')
+
+            status_block, _, sub_content = http_response.partition(b'\r\n\r\n')
+            status_line = status_block.split(b'\r\n', 1)[0]
+
+            try:
+                status = int(status_line.split(b' ')[1])
+            except (IndexError, ValueError):
+                status = 500
+
+            output.append((content_id, status, sub_content))
+
+        return output
@@ -0,0 +1,183 @@
+import time
+
+from typing import List, Tuple, Dict
+
+# Gmail rejects batches over 100 requests and recommends staying at or under 50
+MAX_BATCH_SIZE = 50
+
+
+class BatchTuner:
+    '''
+    Hill climbing controller for the batch window size and the number of
+    batches in flight. Every Pipeline cloned for a task shares one tuner,
+    which samples batch latency, the per sub-request error rate and
+    messages/sec, then nudges one knob at a time within its bounds.
+
+    Attributes:
+    -----------
+        window_size: int
+            Number of requests to put in the next batch
+        max_workers: int
+            Number of batches allowed in flight at once
+        min_window / max_window: int
+            Bounds for window_size
+        min_workers / max_workers_limit: int
+            Bounds for max_workers
+        target_latency: float
+            Batches slower than this (in seconds) are treated as overload
+        max_error_rate: float
+            Share of failed sub-requests that counts as overload
+        sample_size: int
+            Number of batches observed between two adjustments
+        adjustments: List[Tuple[int, int, float]]
+            (window_size, max_workers, messages/sec) measured for every sample
+
+    Methods:
+    --------
+        record(self, requests: int, failures: int, latency: float, messages: int) -> None
+            Feeds a finished batch into the current sample
+        summary(self) -> Dict[str, any]
+            Returns the chosen values and throughput over the whole task
+    '''
+    __slots__ = ['window_size', 'max_workers', 'min_window', 'max_window',
+                 'min_workers', 'max_workers_limit', 'target_latency', 'max_error_rate',
+                 'sample_size', 'adjustments', 'request_count', 'error_count',
+                 'message_count', '_sample', '_sample_start', '_started',
+                 '_best_rate', '_previous', '_knob']
+
+    def __init__(self,
+                 window_size: int = 15,
+                 max_workers: int = 4,
+                 min_window: int = 5,
+                 max_window: int = MAX_BATCH_SIZE,
+                 min_workers: int = 1,
+                 max_workers_limit: int = 16,
+                 target_latency: float = 5.0,
+                 max_error_rate: float = 0.05,
+                 sample_size: int = 8,
+                 ) -> None:
+        self.min_window = min_window
+        self.max_window = min(max_window, MAX_BATCH_SIZE)
+        self.min_workers = min_workers
+        self.max_workers_limit = max_workers_limit
+        self.window_size = self._clamp(window_size, self.min_window, self.max_window)
+        self.max_workers = self._clamp(max_workers, self.min_workers, self.max_workers_limit)
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.sample_size = sample_size
+        self.adjustments = list()
+        self.request_count = 0
+        self.error_count = 0
+        self.message_count = 0
+        # [batches, requests, failures, latency, messages]
+        self._sample = [0, 0, 0, 0.0, 0]
+        self._sample_start = None
+        self._started = None
+        self._best_rate = 0.0
+        # (window_size, max_workers) before the last probe, None when there's nothing to undo
+        self._previous = None
+        self._knob = 'window_size'
+
+    @staticmethod
+    def _clamp(value: int, low: int, high: int) -> int:
+        return max(low, min(high, value))
+
+    def record(self, requests: int, failures: int, latency: float, messages: int) -> None:
+        ''' Adds a finished batch to the current sample and adjusts once the sample is full '''
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now - latency
+        if self._sample_start is None:
+            self._sample_start = now - latency
+
+        self.request_count += requests
+        self.error_count += failures
+        self.message_count += messages
+
+        sample = self._sample
+        sample[0] += 1
+        sample[1] += requests
+        sample[2] += failures
+        sample[3] += latency
+        sample[4] += messages
+
+        if sample[0] >= self.sample_size:
+            self._adjust(now)
+
+    def _adjust(self, now: float) -> None:
+        batches, requests, failures, latency, messages = self._sample
+        elapsed = max(now - self._sample_start, 1e-6)
+        rate = messages / elapsed
+
+        self.adjustments.append((self.window_size, self.max_workers, round(rate, 2)))
+        self._sample = [0, 0, 0, 0.0, 0]
+        self._sample_start = now
+
+        error_rate = failures / requests if requests else 0
+
+        if error_rate > self.max_error_rate:
+            # Errors mean too much pressure on the quota, drop a worker first
+            if self.max_workers > self.min_workers:
+                self.max_workers -= 1
+            else:
+                self.window_size = self._clamp(int(self.window_size * 0.75),
+                                               self.min_window, self.max_window)
+            self._rebaseline()
+            return
+
+        if latency / batches > self.target_latency:
+            # Slow batches, shrink them
+            self.window_size = self._clamp(int(self.window_size * 0.75),
+                                           self.min_window, self.max_window)
+            self._rebaseline()
+            return
+
+        if self._previous is not None and rate < self._best_rate * 1.05:
+            # The last step didn't pay off, undo it and probe the other knob next
+            self.window_size, self.max_workers = self._previous
+            self._previous = None
+            self._knob = 'max_workers' if self._knob == 'window_size' else 'window_size'
+            return
+
+        # Either the step paid off or this sample is a fresh baseline
+        self._best_rate = rate if self._previous is None else max(self._best_rate, rate)
+        self._previous = (self.window_size, self.max_workers)
+
+        # Stuck against a bound, move on to the other knob
+        if not self._step():
+            self._knob = 'max_workers' if self._knob == 'window_size' else 'window_size'
+            if not self._step():
+                self._previous = None
+
+    def _rebaseline(self) -> None:
+        ''' Forgets the last step so the next sample becomes the new baseline '''
+        self._previous = None
+
+    def _step(self) -> bool:
+        ''' Grows the current knob by one step, returns False at its upper bound '''
+        if self._knob == 'window_size':
+            previous = self.window_size
+            step = max(1, self.window_size // 5)
+            self.window_size = self._clamp(self.window_size + step,
+                                           self.min_window, self.max_window)
+            return self.window_size != previous
+
+        previous = self.max_workers
+        self.max_workers = self._clamp(self.max_workers + 1,
+                                       self.min_workers, self.max_workers_limit)
+        return self.max_workers != previous
+
+    def summary(self) -> Dict[str, any]:
+        ''' Returns the chosen values and throughput over everything recorded so far '''
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+
+        return {
+            'window_size': self.window_size,
+            'max_workers': self.max_workers,
+            'message_count': self.message_count,
+            'request_count': self.request_count,
+            'error_count': self.error_count,
+            'elapsed': round(elapsed, 3),
+            'messages_per_sec': round(self.message_count / elapsed, 2) if elapsed > 0 else 0.0,
+            'adjustments': [list(adjustment) for adjustment in self.adjustments],
+        }
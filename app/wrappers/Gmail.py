@@ -1,10 +1,14 @@
 import asyncio
+from functools import partial
 from typing import Optional, Union, List, Dict
 
-from googleapiclient.discovery import build
 from ..helpers.clock import coClock, clock
 from .BaseWrapper import BaseWrapper, WrapperOpts
-from ..data_structures.CommNode import CommNodeBuildManager, CommNode
+from .BatchClient import AsyncBatchClient
+from .RateLimiter import QUOTA_COSTS, get_limiter
+from .MessageCache import get_message_cache
+from ..data_structures.CommNode import CommNode
+from ..data_structures.ParsePool import get_parse_pool, parse_batch
 
 
 class Gmail(BaseWrapper):
@@ -21,9 +25,9 @@ class Gmail(BaseWrapper):
 
     Methods:
     --------
-        getSingleMessage(self, msg_id: str)
+        getSingleMessage(self, msg_id: str, owner: Optional[str] = None)
             Gets a single message from Gmail api and
-            creates a comm node for testing + debugging
+            creates a comm node, cached per owner
 
         queryGmail(self, action: WrapperOpts)
             Queries the Gmail api within a predefined scope of actions:
@@ -35,29 +39,48 @@ class Gmail(BaseWrapper):
 
     def __init__(self, creds: any, max_results: Optional[int] = 5) -> None:
         super().__init__(creds, max_results)
+        self.batch_client = AsyncBatchClient(creds)
 
+    async def _fetchSingleMessage(self, msg_id: str, owner: Optional[str] = None) -> CommNode:
+        if owner is not None:
+            await get_limiter(owner).acquire(QUOTA_COSTS['messages.get'])
 
-    async def getSingleMessage(self, msg_id: str) -> CommNode:
+        response = await self.batch_client.request(f'users/{self.userId}/messages/{msg_id}')
+
+        loop = asyncio.get_event_loop()
+        nodes, failed = await loop.run_in_executor(get_parse_pool(), parse_batch, [response])
+        if len(nodes) == 0:
+            raise ValueError(f'could not parse message {msg_id}: {failed.get(msg_id, "")}')
+
+        return nodes[0]
+
+    async def getSingleMessage(self, msg_id: str, owner: Optional[str] = None) -> CommNode:
         '''
         Gets a single message from Gmail api by message ID,
-        generates a comm node and returns it for testing / debugging.
+        generates a comm node and returns it. The request goes out over
+        the async transport and parsing runs in the parse pool, so the
+        event loop never waits on either.
 
         Params:
         -------
             msg_id: str
                 Gmail message id string to Query for
+            owner: Optional[str]
+                uuid of the mailbox owner, results are cached per owner
+                and concurrent requests share one fetch. Uncached when None
 
         '''
+        fetch = partial(self._fetchSingleMessage, msg_id, owner)
+
         try:
-            response = self.service.users().messages().get(userId=self.userId, id=msg_id).execute()
+            if owner is None:
+                return await fetch()
 
-            comm_node = CommNodeBuildManager.construct(response)
+            return await get_message_cache().get_or_fetch(owner, msg_id, fetch)
         except Exception as e:
             msg = f'Errory querying Gmail API for msg {msg_id} \nError: {e}\n\n'
             return msg
 
-        return comm_node
-
     @coClock
     async def queryGmail(self,
                          action: WrapperOpts,
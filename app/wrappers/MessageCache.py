@@ -0,0 +1,128 @@
+import pickle
+import asyncio
+
+from typing import Optional, Tuple, Callable, Awaitable
+
+from cachetools import TTLCache
+
+from ..data_structures.CommNode import CommNode
+
+# Process wide cache, configured on startup
+_cache = None
+
+
+class MessageCache:
+    '''
+    Cache of parsed CommNodes for interactive single message views. Entries live
+    in a size bounded in-process LRU with a TTL and, when a redis pool is
+    attached, are shared with every other worker through redis. Concurrent
+    requests for the same (owner, msg_id) wait on a single fetch.
+
+    Attributes:
+    -----------
+        maxsize: int
+            Max number of nodes kept in process
+        ttl: float
+            Seconds a node is served from the cache
+        redis: Optional[aioredis.Redis]
+            Optional redis pool used as a second level
+        hits / misses: int
+            Lookup counters, redis hits count as hits
+
+    Methods:
+    --------
+        get_or_fetch(self, owner: str, msg_id: str, fetch: Callable[[], Awaitable[CommNode]])
+            Returns a cached node or runs fetch once for every concurrent caller
+    '''
+    __slots__ = ['maxsize', 'ttl', 'redis', 'hits', 'misses', '_local', '_in_flight']
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, redis: Optional['Redis'] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis = redis
+        self.hits = 0
+        self.misses = 0
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        # (owner, msg_id) -> Future for the fetch that is running
+        self._in_flight = {}
+
+    @staticmethod
+    def _redis_key(key: Tuple[str, str]) -> str:
+        return 'hermes:message:{}:{}'.format(*key)
+
+    async def _redis_get(self, key: Tuple[str, str]) -> Optional[CommNode]:
+        if self.redis is None:
+            return
+
+        try:
+            raw = await self.redis.get(self._redis_key(key))
+            return pickle.loads(raw) if raw is not None else None
+        except Exception as e:
+            print(f'error reading message {key[1]} from redis: {e}')
+
+    async def _redis_set(self, key: Tuple[str, str], node: CommNode) -> None:
+        if self.redis is None:
+            return
+
+        try:
+            await self.redis.setex(self._redis_key(key), int(self.ttl), pickle.dumps(node))
+        except Exception as e:
+            print(f'error writing message {key[1]} to redis: {e}')
+
+    async def _load(self,
+                    key: Tuple[str, str],
+                    fetch: Callable[[], Awaitable[CommNode]],
+                    ) -> CommNode:
+        node = await self._redis_get(key)
+
+        if node is None:
+            self.misses += 1
+            node = await fetch()
+            await self._redis_set(key, node)
+        else:
+            self.hits += 1
+
+        self._local[key] = node
+        return node
+
+    async def get_or_fetch(self,
+                           owner: str,
+                           msg_id: str,
+                           fetch: Callable[[], Awaitable[CommNode]],
+                           ) -> CommNode:
+        key = (owner, msg_id)
+
+        node = self._local.get(key)
+        if node is not None:
+            self.hits += 1
+            return node
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, fetch))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # One caller going away mustn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+
+def configure_message_cache(maxsize: int, ttl: float) -> None:
+    global _cache
+    _cache = MessageCache(maxsize, ttl)
+
+
+def get_message_cache() -> MessageCache:
+    ''' Returns the shared message cache, creating a default one on first use '''
+    global _cache
+
+    if _cache is None:
+        _cache = MessageCache()
+
+    return _cache
+
+
+async def attach_message_cache_redis(app: 'Sanic', *args, **kwargs) -> None:
+    ''' Shares the message cache through app.redis, registered after the db listener '''
+    if app.config.MESSAGE_CACHE_REDIS and getattr(app, 'redis', None) is not None:
+        get_message_cache().redis = app.redis
@@ -1,16 +1,45 @@
 import time
 import asyncio
-import concurrent.futures
-import random
 
-from typing import Optional, List, Generator, Dict, Union, Tuple, Awaitable, Callable, Optional
+from typing import Optional, List, Generator, Dict, Union, Tuple, Awaitable, Callable, AsyncIterator
 from functools import partial
-from httplib2 import Http
+from collections import Counter
 
-from .BaseWrapper import BaseWrapper, WrapperOpts
+from .BaseWrapper import BaseWrapper, WrapperOpts, ScrapeFormat, FetchMode
+from .BatchClient import AsyncBatchClient, BatchRequest, GmailError
+from .RateLimiter import QuotaLimiter, QUOTA_COSTS, get_limiter, is_throttle
+from .BatchTuner import BatchTuner
+from .RawCache import RawMessageCache, get_raw_cache
 from ..data_structures.CommNode import CommNode, CommNodeBuildManager, CommNodeBuilder
+from ..data_structures.CommNodeBatch import CommNodeBatch
+from ..data_structures.BodyGuard import truncation_counts
+from ..data_structures.ParsePool import get_parse_pool, reset_parse_pool, parse_columnar
+
+# Headers and fields requested when only the contact graph is needed
+METADATA_HEADERS = ['From', 'To', 'Cc', 'Bcc', 'Subject']
+METADATA_FIELDS = 'id,threadId,labelIds,internalDate,payload/headers'
+THREAD_METADATA_FIELDS = f'id,messages({METADATA_FIELDS})'
+
+# Nothing in a Gmail mailbox predates the Gmail launch (April 2004)
+GMAIL_EPOCH = 1080777600
+
+# Ids still failing after this many rounds are handed back as dead letters
+MAX_FETCH_ROUNDS = 3
+
+# Sub-request statuses a retry can't fix, 404 means the message is gone
+GONE_STATUSES = (404,)
+INVALID_STATUSES = (400,)
+
+
+class HistoryExpired(Exception):
+    ''' Raised when a stored historyId is too old for history.list and a full re-list is needed '''
+    pass
+
+
+class ListingIncomplete(Exception):
+    ''' Raised at the end of a sharded listing when some of its date windows couldn't be listed '''
+    pass
 
-from queue import Queue
 
 class Pipeline(BaseWrapper):
     '''
@@ -21,14 +50,15 @@ class Pipeline(BaseWrapper):
         creds: any
             Google Oauth2 credential object with appropriate scopes
 
-        comm_nodes: List[CommNode]
-            List of messages that have been fully cleaned and parsed
+        fetched_count: int
+            Number of messages that have been fully cleaned and parsed
 
         query_list: List[str]
             List of msg id strings to pass back through the executioner
 
         throttle_coefficient: float
-            Scales the sleep timing on subsequent bundle requests
+            No longer used for pacing, the limiter spaces out retry rounds.
+            Kept so existing callers and clones keep their signature
 
         message_count: int
             Number of messages returned by gmail query
@@ -36,6 +66,43 @@ class Pipeline(BaseWrapper):
         message_ids: List[Dict[str, str]]
             List of message id dictionaries returned by gmail query
 
+        batch_client: AsyncBatchClient
+            asyncio transport used to execute the batch requests
+
+        truncations: Counter
+            Messages that hit each body size limit, shared with clones like the tuner
+
+        address_cache: Counter
+            Address header cache hits and misses in the parse workers, shared with clones
+
+        limiter: QuotaLimiter
+            Quota aware rate limiter shared by every Pipeline for the same user
+
+        scrape_format: ScrapeFormat
+            FULL pulls and parses message bodies, METADATA only pulls
+            the address headers, date and ids
+
+        raw_cache: Optional[RawMessageCache]
+            On-disk store every raw FULL response is written to, if configured
+
+        user_id: str
+            uuid of the user the messages belong to
+
+        fetch_mode: FetchMode
+            MESSAGES fetches one message per request, THREADS fetches
+            whole conversations and query_list holds thread ids
+
+        tuner: BatchTuner
+            Picks the batch window size and number of batches in flight,
+            shared by every Pipeline cloned for the same task
+
+        failures: Dict[str, str]
+            Last error seen for every id that failed a fetch round
+
+        dead_letters: Dict[str, str]
+            Ids that failed in a way another round can't fix (a 400 or
+            a parse error), handed back without being retried
+
     Methods:
     --------
         _bundler(record_list: List[str], window_size: int)
@@ -45,39 +112,88 @@ class Pipeline(BaseWrapper):
         _clean_ids(self, msg_res: List[Dict[str,str]])
             Takes a list of dictionaries containing msg_id
             from gmail query and returns a list of msg_id strings
-        _clone_interface(self)
+        _clone_interface(self, interface_id: str, fetch_mode: Optional[FetchMode] = None)
             Returns a copy of the Pipeline interface to allow for splitting the hermes workload on different worker processes
         queryGmail(self, most_recent: str, limit: Optional[int] = 500)
             queries Gmail for a list of message id dictionaries
-            and returns a list of msg_id strings
+            and returns (msg_id strings, count, complete) on every path
+
+        getHistoryId(self)
+            returns the current historyId of the mailbox
+
+        iterMessageIds(self, shard_count: int, limit: Optional[int] = None)
+            lists message ids (thread ids in THREADS mode) concurrently over
+            date windows and yields the new ids from each window as soon as it finishes
+
+        _date_windows(start: int, end: int, shard_count: int)
+            splits an epoch range into windows that narrow towards the present
+
+        _list_window(self, after: int, before: int, results: Queue)
+            pages through messages.list or threads.list for a single date window
 
-        hermes(self, record_list: List[Postgres Records], window_size: int)
-            data scraping and processing chain for gmail messages
+        queryHistory(self, start_history_id: str)
+            returns the msg_ids added and deleted since start_history_id
+            along with the latest historyId
 
-        _enqueue(self, bundle_gen: Generator[str, None, None], queue: Queue)
-            returns the bundle size and populates the main work queue
+        hermes(self, message_list: List[str], window_size: int, max_workers: int, user_id: str)
+            data scraping and processing chain for gmail messages,
+            returns an async iterator of parsed CommNodeBatches
 
-        _batcher(self, id_bundle: List[str])
-            takes a list of msg_ids and bundles them into a
-            batch httprequest object. The callback re-populates
+        iter_batches(self, message_list: List[str], window_size: int, max_workers: int)
+            async generator that yields a CommNodeBatch per parsed bundle while the fetch is still running
+
+        _fetch(self, batch_queue: Queue, message_list: List[str])
+            runs the batch requests and retry rounds, feeding the node queue.
+            Bundles are cut and dispatched with the tuner's current values
+
+        _executioner(self, id_bundle: List[str], batch_queue: Queue, attempt: int)
+            executes a single batch request on the event loop and
+            parses the successful responses in the parse process pool
+
+        _batcher(self, id_bundle: List[str], raw_responses: List[Dict[str, any]], errors: List[Exception])
+            takes a list of msg_ids (or thread ids) and bundles them
+            into a batch request object. The callback re-populates
             the query_list instance attribute
 
+        _fan_out(raw_responses: List[Dict[str, any]])
+            flattens threads.get responses into their messages
+
 
     '''
-    __slots__ = ['comm_nodes', 'query_list', 'message_count', 'throttle_coefficient', 'message_ids', 'interface_id']
+    __slots__ = ['fetched_count', 'query_list', 'message_count', 'throttle_coefficient',
+                 'message_ids', 'interface_id', 'batch_client', 'limiter', 'scrape_format',
+                 'raw_cache', 'user_id', 'fetch_mode', 'tuner', 'failures', 'dead_letters',
+                 'truncations', 'address_cache']
 
     def __init__(self,
                  creds: Dict[str, Union[str, List[str]]],
                  throttle_coefficient: float,
                  interface_id: Optional[str] = '',
+                 limiter: Optional[QuotaLimiter] = None,
+                 scrape_format: ScrapeFormat = ScrapeFormat.FULL,
+                 fetch_mode: FetchMode = FetchMode.MESSAGES,
+                 tuner: Optional[BatchTuner] = None,
+                 truncations: Optional[Counter] = None,
+                 address_cache: Optional[Counter] = None,
                  ) -> None:
         super().__init__(creds)
-        self.comm_nodes = list()
+        self.fetched_count = 0
         self.query_list = list()
         self.message_count = 0
         self.throttle_coefficient = throttle_coefficient
         self.message_ids = list()
         self.interface_id = interface_id
+        self.batch_client = AsyncBatchClient(self.creds)
+        self.limiter = limiter
+        self.scrape_format = scrape_format
+        self.raw_cache = get_raw_cache()
+        self.user_id = ''
+        self.fetch_mode = fetch_mode
+        self.tuner = tuner
+        self.failures = dict()
+        self.dead_letters = dict()
+        self.truncations = truncations if truncations is not None else Counter()
+        self.address_cache = address_cache if address_cache is not None else Counter()
 
 
     @staticmethod
@@ -97,16 +213,22 @@ class Pipeline(BaseWrapper):
             yield record_list[i:i+window_size]
             i += window_size
 
-        yield record_list[i:-1]
+        if i < len(record_list):
+            yield record_list[i:]
 
-    def _clone_interface(self, interface_id: str) -> 'Pipeline':
-        return Pipeline(self.creds, self.throttle_coefficient, interface_id)
+    def _clone_interface(self,
+                         interface_id: str,
+                         fetch_mode: Optional[FetchMode] = None,
+                         ) -> 'Pipeline':
+        return Pipeline(self.creds, self.throttle_coefficient, interface_id,
+                        self.limiter, self.scrape_format, fetch_mode or self.fetch_mode,
+                        self.tuner, self.truncations, self.address_cache)
 
 
     async def queryGmail(self,
                          most_recent: Optional[str],
-                         limit: int = 500,
-                         ) -> Tuple[List[Dict[str, str]], int]:
+                         limit: Optional[int] = 500,
+                         ) -> Tuple[List[str], int, bool]:
         '''
         Queries the Gmail api for a list of message_ids
 
@@ -114,53 +236,250 @@ class Pipeline(BaseWrapper):
         -----------
             most_recent: str
                 most recently pulled msg_id for a particular user
-            limit: int
+            limit: Optional[int]
                 The max number of entries to be pulled from paginated API
-                increments by 100
+                increments by 100, None pages until most_recent
 
         Returns:
         --------
-            Union[List[Dict[str, str]], Dict[str, List[Dict[str, str]]]]
-                A list of dicts or a dict with a string key mapped dict list
+            Tuple[List[str], int, bool]
+                The msg_ids pulled, how many there are and whether the
+                listing reached most_recent (or the end of the mailbox).
+                False when it stopped at the limit or on an error
         '''
         query = self.service.users().messages().list(userId=self.userId)
 
         try:
+            if self.limiter is not None:
+                await self.limiter.acquire(QUOTA_COSTS['messages.list'])
             response = query.execute()
         except Exception as e:
             print(f'Error querying Gmail api: {e}')
-            return list()
+            return list(), 0, False
 
         msg_ids = []
+        page_ids = []
+        complete = True
         if 'messages' in response:
-            msg_ids.extend(self._clean_ids(response['messages']))
+            page_ids = self._clean_ids(response['messages'])
+            msg_ids.extend(page_ids)
 
         while 'nextPageToken' in response:
             # if the most recently pulled message is in the
-            # previous batch of 100 msg_ids, break the loop
-            if most_recent and most_recent in set(msg_ids):
+            # previous page of 100 msg_ids, break the loop
+            if most_recent and most_recent in page_ids:
                 break
 
             # break the loop if we pulled more than the limit
-            if len(msg_ids) >= limit:
+            if limit is not None and len(msg_ids) >= limit:
+                complete = False
                 break
 
             try:
                 page_token = response['nextPageToken']
 
+                if self.limiter is not None:
+                    await self.limiter.acquire(QUOTA_COSTS['messages.list'])
+
                 response = self.service.users().messages().list(
                     userId=self.userId,
                     pageToken=page_token
                 ).execute()
 
-                msg_ids.extend(self._clean_ids(response['messages']))
+                page_ids = self._clean_ids(response.get('messages', []))
+                msg_ids.extend(page_ids)
 
             except Exception as e:
-                print(f'\nError paginating over results from {action}: \n{e}\n')
-                return msg_ids
+                print(f'\nError paginating over messages.list results: \n{e}\n')
+                complete = False
+                break
+
+
+        return msg_ids, len(msg_ids), complete
+
+    @staticmethod
+    def _date_windows(start: int, end: int, shard_count: int) -> List[Tuple[int, int]]:
+        '''
+        Splits [start, end) into shard_count windows of epoch seconds. Mail volume
+        grows towards the present, so the windows narrow quadratically towards end.
+        '''
+        span = end - start
+        bounds = [
+            start + int(span * (1 - (1 - i / shard_count) ** 2))
+            for i in range(shard_count + 1)
+        ]
+
+        return [(bounds[i], bounds[i + 1]) for i in range(shard_count)]
+
+    async def _list_window(self,
+                           after: int,
+                           before: int,
+                           results: asyncio.Queue,
+                           ) -> None:
+        '''
+        Pages through messages.list (or threads.list) for one date window and
+        puts (ids, error) on results, error is None once every page was listed
+        '''
+        resource = 'threads' if self.fetch_mode == FetchMode.THREADS else 'messages'
+        msg_ids = []
+        error = None
+        # before is pushed out a second so boundary messages aren't lost, dupes are dropped later
+        params = {'q': f'after:{after} before:{before + 1}', 'maxResults': 500}
+        failures = 0
+
+        try:
+            while True:
+                if self.limiter is not None:
+                    await self.limiter.acquire(QUOTA_COSTS[f'{resource}.list'])
+
+                t0 = time.perf_counter()
+                try:
+                    response = await self.batch_client.request(f'users/{self.userId}/{resource}', params)
+                except GmailError as e:
+                    if self.limiter is not None:
+                        self.limiter.record(time.perf_counter() - t0, is_throttle(e))
+                    failures += 1
+                    if failures > 3:
+                        raise
+
+                    # Back off before asking for the same page again
+                    await asyncio.sleep(2 ** failures)
+                    continue
+
+                if self.limiter is not None:
+                    self.limiter.record(time.perf_counter() - t0)
+                msg_ids.extend(self._clean_ids(response.get(resource, [])))
+
+                if 'nextPageToken' not in response:
+                    break
+
+                params['pageToken'] = response['nextPageToken']
+
+        except Exception as e:
+            print(f'Error listing {resource} between {after} and {before}: {e}')
+            error = e
+
+        finally:
+            results.put_nowait((msg_ids, error))
+
+    async def iterMessageIds(self,
+                             shard_count: int = 16,
+                             limit: Optional[int] = None,
+                             ) -> AsyncIterator[List[str]]:
+        '''
+        Lists the whole mailbox by sharding messages.list over date windows.
+        Windows are listed concurrently under the shared rate limiter and the
+        new ids from each window are yielded as soon as that window finishes.
+        In THREADS mode the windows list thread ids instead. The ids a failed
+        window did list are still yielded, then ListingIncomplete is raised
+        once every window is over.
+
+        Parameters:
+        -----------
+            shard_count: int
+                Number of date windows to list concurrently
+            limit: Optional[int]
+                Stop after this many unique message (or thread) ids
+        '''
+        end = int(time.time()) + 24 * 60 * 60
+        windows = self._date_windows(GMAIL_EPOCH, end, shard_count)
+
+        results = asyncio.Queue()
+        listers = [
+            asyncio.ensure_future(self._list_window(after, before, results))
+            for after, before in windows
+        ]
+
+        seen = set()
+        failed = 0
+        try:
+            for _ in range(len(listers)):
+                window_ids, error = await results.get()
+                failed += error is not None
+
+                new_ids = [msg_id for msg_id in window_ids if msg_id not in seen]
+                seen.update(new_ids)
+
+                if limit is not None and len(seen) >= limit:
+                    overflow = len(seen) - limit
+                    yield new_ids[:len(new_ids) - overflow]
+                    break
+
+                yield new_ids
+
+        finally:
+            for lister in listers:
+                if not lister.done():
+                    lister.cancel()
+
+        if failed > 0:
+            raise ListingIncomplete(f'{failed} of {len(listers)} date windows failed to list')
+
+    async def getHistoryId(self) -> str:
+        ''' Returns the mailbox's current historyId from the user's Gmail profile '''
+        if self.limiter is not None:
+            await self.limiter.acquire(QUOTA_COSTS['users.getProfile'])
+
+        profile = await self.batch_client.request(f'users/{self.userId}/profile')
+
+        return profile['historyId']
+
+    async def queryHistory(self,
+                           start_history_id: str,
+                           ) -> Tuple[List[str], List[str], str]:
+        '''
+        Queries history.list for every message added or deleted since start_history_id
+
+        Parameters:
+        -----------
+            start_history_id: str
+                historyId stored after the user's last successful sync
+
+        Returns:
+        --------
+            Tuple[List[str], List[str], str]
+                added msg_ids, deleted msg_ids and the latest historyId
+
+        Raises HistoryExpired if Gmail no longer has history for start_history_id
+        '''
+        # dict keeps the added ids ordered and unique
+        added = {}
+        deleted = set()
+        params = {
+            'startHistoryId': start_history_id,
+            'historyTypes': ['messageAdded', 'messageDeleted'],
+        }
+        latest_history_id = start_history_id
+
+        while True:
+            if self.limiter is not None:
+                await self.limiter.acquire(QUOTA_COSTS['history.list'])
+
+            try:
+                response = await self.batch_client.request(f'users/{self.userId}/history', params)
+            except GmailError as e:
+                if e.status == 404:
+                    raise HistoryExpired(start_history_id)
+                raise
+
+            latest_history_id = response.get('historyId', latest_history_id)
+
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    added[item['message']['id']] = None
+
+                for item in record.get('messagesDeleted', []):
+                    msg_id = item['message']['id']
+                    # Added then deleted within the window, nothing to fetch
+                    added.pop(msg_id, None)
+                    deleted.add(msg_id)
+
+            if 'nextPageToken' not in response:
+                break
 
+            params['pageToken'] = response['nextPageToken']
 
-        return msg_ids, len(msg_ids)
+        return list(added), list(deleted), latest_history_id
 
     async def hermes(self,
                      message_list: List[str],
@@ -168,9 +487,10 @@ class Pipeline(BaseWrapper):
                      max_workers: int,
                      user_id: str,
                      callback: Callable[[str, int], None] = None
-                     ) -> None:
+                     ) -> Tuple[AsyncIterator[CommNodeBatch], str]:
         '''
-        Bundles message ids and requests the messages from google using ThreadPool
+        Returns an async iterator that fetches and parses the messages
+        as it is consumed, so callers can persist nodes while the fetch is running
 
         Args:
         ------
@@ -178,23 +498,77 @@ class Pipeline(BaseWrapper):
                 list of message id strings
 
             window_size: int
-                size of bundle to query Gmail api in batches
+                starting size of the bundles sent to the Gmail api in batches
 
             max_workers: int
-                Max number of threads to use with the batch http requests
+                starting number of batch requests in flight at once
 
             user_id: str
                 uuid of the user running the data pull
 
-            callback: Callable[[str, int], None]
-                callback function to track progress across different threads
+            callback: Callable[[Tuple[str, int, Dict[str, str]]], None]
+                called once the fetch is over with the interface id, the number
+                of fetched messages and the ids that failed every round mapped
+                to their last error
 
         '''
+        if self.limiter is None:
+            self.limiter = get_limiter(user_id)
 
-        # container to store batch request objects
-        queue = Queue()
-        loop = asyncio.get_event_loop()
+        # The tuner adjusts both values from here on
+        if self.tuner is None:
+            self.tuner = BatchTuner(window_size, max_workers)
+
+        self.user_id = user_id
+
+        return self.iter_batches(message_list, window_size, max_workers, callback), user_id
+
+    async def iter_batches(self,
+                           message_list: List[str],
+                           window_size: int,
+                           max_workers: int,
+                           callback: Callable[[str, int], None] = None
+                           ) -> AsyncIterator[CommNodeBatch]:
+        '''
+        Async generator that yields a CommNodeBatch as soon as its bundle has been parsed.
+        The batch queue is bounded, so a slow consumer pauses the fetch instead
+        of letting parsed messages pile up in memory.
+        '''
+        batch_queue = asyncio.Queue(maxsize=max_workers * 2)
+        fetch = asyncio.ensure_future(
+            self._fetch(batch_queue, message_list, callback)
+        )
+
+        try:
+            while True:
+                batch = await batch_queue.get()
+                # None marks the end of the fetch
+                if batch is None:
+                    break
+
+                yield batch
+
+        except BaseException:
+            # Consumer went away, stop fetching
+            fetch.cancel()
+            raise
+
+        # Surfaces fetch errors and waits for the progress callback
+        await fetch
 
+    async def _fetch(self,
+                     batch_queue: asyncio.Queue,
+                     message_list: List[str],
+                     callback: Callable[[str, int], None] = None
+                     ) -> None:
+        '''
+        Bundles message ids and requests the messages from google
+        with concurrent batch requests on the event loop, retrying failed ids.
+        Each bundle is cut with the tuner's current window size and a new one
+        is only dispatched while fewer than its max_workers are in flight.
+        Ids that fail MAX_FETCH_ROUNDS rounds are handed to the callback
+        instead of holding up the rest of the scrape.
+        '''
         # list of message ids to bundle and get from Gmail
         self.query_list = message_list
         self.message_count = self.message_count + len(self.query_list)
@@ -202,109 +576,205 @@ class Pipeline(BaseWrapper):
         t0 = time.perf_counter()
 
         attempt = 0
+        in_flight = set()
+        cancelled = False
 
-        while True:
-            # Increment attempt variable to throttle subsequent queries
-            attempt += 1
-            routine = partial(self._executioner, queue, attempt)
-
-            try:
-                # Generator function to package the ids into bundles of size == window_size
-                bundle_generator = self._bundler(self.query_list, window_size)
-                bundle_count = self._enqueue(bundle_generator, queue)
-
-                if bundle_count <= 1:
-                    break
+        try:
+            while len(self.query_list) > 0:
+                attempt += 1
 
-                if attempt > 5:
+                if attempt > MAX_FETCH_ROUNDS:
                     break
 
-            except Exception as e:
-                print(f'error populating queue: {e}')
-                break
-
-            # Set query_list attribute to an empty list after filling queue
-            # So that it can be re-populated by the batch callback
-            self.query_list = list()
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
-                futures = [
-                    loop.run_in_executor(pool, routine)
-                    for _ in range(0, bundle_count)
-                ]
-                result = await asyncio.gather(*futures)
+                # Retry rounds go straight out, the limiter paces the requests themselves
+                pending = self.query_list
+
+                # Set query_list attribute to an empty list before dispatching
+                # So that it can be re-populated by the batch callback
+                self.query_list = list()
+
+                while len(pending) > 0 or len(in_flight) > 0:
+                    while len(pending) > 0 and len(in_flight) < self.tuner.max_workers:
+                        bundle = pending[:self.tuner.window_size]
+                        pending = pending[self.tuner.window_size:]
+                        in_flight.add(asyncio.ensure_future(
+                            self._executioner(bundle, batch_queue, attempt)
+                        ))
+
+                    done, in_flight = await asyncio.wait(
+                        in_flight, return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                    for task in done:
+                        if task.exception() is not None:
+                            print(f'Error in batch executioner: {task.exception()}')
+
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+            if cancelled:
+                # The consumer went away, nothing will drain a full queue
+                try:
+                    batch_queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+            else:
+                await batch_queue.put(None)
 
         t1 = time.perf_counter() - t0
 
+        dead_letters = dict(self.dead_letters)
+        dead_letters.update(
+            (msg_id, self.failures.get(msg_id, 'fetch rounds exhausted'))
+            for msg_id in self.query_list
+        )
+
         # clear msg_ids and free memory
-        del self.query_list
+        self.query_list = list()
+        self.failures = dict()
+        self.dead_letters = dict()
 
         out_msg = f'\nIt takes {t1} seconds to get {self.message_count} messages \
-                    \nnumber of messages downloaded: {len(self.comm_nodes)} \
-                    \nnumber of attempts: {attempt}'
+                    \nnumber of messages downloaded: {self.fetched_count} \
+                    \nnumber of attempts: {attempt} \
+                    \nnumber of dead letters: {len(dead_letters)} \
+                    \ntruncated bodies: {dict(self.truncations)} \
+                    \naddress cache: {dict(self.address_cache)}'
 
         print(out_msg)
 
         # Use callbacks to track progress of different threads
         if callback is not None:
-            await callback((self.interface_id, len(self.comm_nodes)))
-
-        return self.comm_nodes, user_id
-
-    def _enqueue(self, bundle_gen: Generator[str, None, None], queue: Queue) -> int:
-        bundle_count = 0
-
-        while True:
-            try:
-                bundle = next(bundle_gen)
-                bundle_count += 1
-                queue.put(self._batcher(bundle))
-            except StopIteration:
-                break
-
-        return bundle_count
+            await callback((self.interface_id, self.fetched_count, dead_letters))
 
-    # @clock
-    def _executioner(self, queue: Queue, attempt: int = 1) -> str:
+    async def _executioner(self,
+                           id_bundle: List[str],
+                           batch_queue: asyncio.Queue,
+                           attempt: int = 1
+                           ) -> str:
         '''
-        Worker that Executes the bundle query to Gmail API on a separate thread
+        Executes the bundle query to Gmail API on the event loop
 
         Params:
         -------
-           queue: Queue[Batch Request Objects]
-               Reference to a thread-safe queue data structure
+            id_bundle: List[str]
+                a list of msg id strings of length == window_size
+            batch_queue: asyncio.Queue
+                Bounded queue the parsed CommNodeBatches are handed off on
             attempt:
                 Number of times this query has failed
         '''
-        # Generate a small random number to sleep for
-        sleep_start = random.uniform(0.3, 10**(-4))
-        sleep_modifier = sleep_start + (attempt * self.throttle_coefficient)
-        time.sleep(sleep_modifier)
-        http = Http()
+        loop = asyncio.get_event_loop()
+        raw_responses = list()
+        errors = list()
+        batch = self._batcher(id_bundle, raw_responses, errors)
+        fetch_threads = self.fetch_mode == FetchMode.THREADS
+        cost = QUOTA_COSTS['threads.get' if fetch_threads else 'messages.get']
+
+        # Wait for enough quota units to cover every request in the batch
+        await self.limiter.acquire(cost * len(batch))
+
+        t0 = time.perf_counter()
         try:
-            batch = queue.get()
-            batch.execute(http=http)
+            await self.batch_client.execute(batch)
         except Exception as e:
             print(f'Error executing batch query: {e}')
+            latency = time.perf_counter() - t0
+            self.limiter.record(latency, is_throttle(e))
+            self.tuner.record(len(batch), len(batch), latency, 0)
+            # The whole batch failed, send every id back to the query_list
+            self.query_list.extend(id_bundle)
+            self.failures.update((msg_id, str(e)) for msg_id in id_bundle)
+            return
+
+        latency = time.perf_counter() - t0
+        throttled = any(is_throttle(error) for error in errors)
+        self.limiter.record(latency, throttled)
+
+        # Every message of a conversation is parsed like a messages.get response
+        messages = self._fan_out(raw_responses) if fetch_threads else raw_responses
+
+        # Parsing holds the GIL, hand the raw batch to a parse process
+        metadata_only = self.scrape_format == ScrapeFormat.METADATA
+        try:
+            parsed, parse_failures = await loop.run_in_executor(
+                get_parse_pool(), parse_columnar, messages, metadata_only
+            )
+        except Exception as e:
+            print(f'Error parsing batch: {e}')
+            # A crashed worker breaks the whole pool, start a new one.
+            # raw_responses holds thread responses in THREADS mode, so whole threads are retried
+            reset_parse_pool()
+            failed_ids = [response['id'] for response in raw_responses]
+            self.query_list.extend(failed_ids)
+            self.failures.update((msg_id, f'parse error: {e}') for msg_id in failed_ids)
+            self.tuner.record(len(batch), len(errors), latency, 0)
             return
 
+        self.tuner.record(len(batch), len(errors), latency, len(parsed))
+
+        # Another round would fail to parse them the same way, dead letter them now.
+        # Dead letters hold thread ids in THREADS mode, like query_list
+        if len(parse_failures) > 0:
+            if fetch_threads:
+                thread_ids = {message.get('id'): message.get('threadId') for message in messages}
+                parse_failures = {thread_ids.get(msg_id, msg_id): error
+                                  for msg_id, error in parse_failures.items()}
+            self.dead_letters.update(parse_failures)
+
+        # Keep the raw payloads around so the mailbox can be re-parsed offline
+        if self.raw_cache is not None and not metadata_only:
+            try:
+                await loop.run_in_executor(None, self.raw_cache.store, self.user_id, messages)
+            except Exception as e:
+                print(f'Error writing batch to raw cache: {e}')
+
+        # Share the repeated strings with every other batch held in this process
+        parsed.intern()
+
+        self.fetched_count += len(parsed)
+        self.truncations.update(truncation_counts(parsed.truncated))
+        self.address_cache.update(parsed.address_cache)
+
+        if len(parsed) > 0:
+            await batch_queue.put(parsed)
+
         return 'finished processing batch'
 
+    @staticmethod
+    def _fan_out(raw_responses: List[Dict[str, any]]) -> List[Dict[str, any]]:
+        ''' Flattens threads.get responses into the messages.get shaped responses they contain '''
+        return [
+            message
+            for thread in raw_responses
+            for message in thread.get('messages', [])
+        ]
 
     def _batcher(self,
                  id_bundle: List[str],
-                 ) -> any:
+                 raw_responses: List[Dict[str, any]],
+                 errors: List[Exception],
+                 ) -> BatchRequest:
         '''
         takes bundles of msg ids and bundles them into an http batch request
 
         Params:
         -------
            id_bundle: List[str]
-               a list of msg id strings of length == window_size
+               a list of msg id (or thread id) strings of length == window_size
+           raw_responses: List[Dict[str, any]]
+               container the callback fills with successful message (or thread) responses
+           errors: List[Exception]
+               container the callback fills with sub-request exceptions
 
         Returns:
         --------
-           HTTP batch request object to be stored in a queue for execution
+           BatchRequest object to be executed by the batch client
 
         Callback:
         --------
@@ -322,20 +792,43 @@ class Pipeline(BaseWrapper):
             '''General callback for the batch request'''
             if exception is None:
 
-                self.comm_nodes.append(CommNodeBuildManager.construct(response))
+                raw_responses.append(response)
+                return
+
+            target = id_bundle[int(request_id)-1]
+            status = getattr(exception, 'status', None)
+
+            if status in GONE_STATUSES:
+                # Deleted since it was listed, there's nothing left to fetch
+                print(f'request_id {request_id}: {target} no longer exists, dropping it')
+
+            elif status in INVALID_STATUSES:
+                # The request itself is bad, retrying it only burns quota
+                self.dead_letters[target] = str(exception)
+                print(f'request_id {request_id}: {target} was rejected, dead lettering it\nException: {exception}\n')
 
             else:
                 # If there's an error, add the id back to the query_list
-                target = id_bundle[int(request_id)-1]
                 self.query_list.append(target)
+                self.failures[target] = str(exception)
+                errors.append(exception)
+
+                print(f'request_id throwing error: {request_id}\nthrowing batch back to the queue: {target}\nException: {exception}\n')
+
+        batch = self.batch_client.new_batch_http_request(callback=collaback)
 
-                print(f'request_id throwing error: {request_id}\nthrowing batch back to the queue: {id_bundle[int(request_id)-1]}\nException: {exception}\n')
+        fetch_threads = self.fetch_mode == FetchMode.THREADS
+        resource = 'threads' if fetch_threads else 'messages'
 
-        batch = self.service.new_batch_http_request(callback=collaback)
+        params = None
+        if self.scrape_format == ScrapeFormat.METADATA:
+            params = {
+                'format': 'metadata',
+                'metadataHeaders': METADATA_HEADERS,
+                'fields': THREAD_METADATA_FIELDS if fetch_threads else METADATA_FIELDS,
+            }
 
         for msg_id in id_bundle:
-            batch.add(self.service.users()
-                      .messages()
-                      .get(userId=self.userId, id=msg_id))
+            batch.add(f'users/{self.userId}/{resource}/{msg_id}', params)
 
         return batch
@@ -0,0 +1,151 @@
+import time
+import asyncio
+
+from typing import Dict, Optional
+
+from .BatchClient import GmailError
+
+# Gmail API quota units per method
+# https://developers.google.com/gmail/api/reference/quota
+QUOTA_COSTS = {
+    'users.getProfile': 1,
+    'history.list': 2,
+    'labels.list': 1,
+    'messages.list': 5,
+    'messages.get': 5,
+    'threads.list': 10,
+    'threads.get': 10,
+}
+
+# Per-user quota ceiling in units per second
+USER_QUOTA = 250
+
+# Registry of limiters keyed by user uuid so that every
+# cloned Pipeline for a user draws from the same bucket
+_limiters = {}
+
+
+def is_throttle(exception: Exception) -> bool:
+    ''' Returns True if the exception is Gmail telling us to slow down '''
+    if not isinstance(exception, GmailError):
+        return False
+
+    return exception.status == 429 or exception.reason in (
+        'rateLimitExceeded', 'userRateLimitExceeded'
+    )
+
+
+class QuotaLimiter:
+    '''
+    Token bucket that meters Gmail quota units for a single user. The refill
+    rate is adjusted with AIMD: it grows additively while batches succeed
+    within the target latency and is cut multiplicatively on every
+    429 / rateLimitExceeded, so the scrape settles just under the quota ceiling.
+
+    Attributes:
+    -----------
+        rate: float
+            Current refill rate in quota units per second
+        min_rate: float
+            Floor for the refill rate
+        max_rate: float
+            Ceiling for the refill rate, defaults to the Gmail per-user quota
+        capacity: float
+            Max number of units that can be spent in a single burst
+        tokens: float
+            Units currently available, goes negative while callers are queued
+        increase_step: float
+            Units per second added to the rate after each healthy batch
+        decrease_factor: float
+            Multiplier applied to the rate after a throttled batch
+        target_latency: float
+            Batches slower than this (in seconds) don't grow the rate
+        cooldown: float
+            Min number of seconds between two rate decreases
+
+    Methods:
+    --------
+        acquire(self, units: float) -> None
+            Waits until the requested number of quota units are available
+        record(self, latency: float, throttled: bool) -> None
+            Feeds a batch outcome back into the AIMD controller
+    '''
+    __slots__ = ['rate', 'min_rate', 'max_rate', 'capacity', 'tokens',
+                 'increase_step', 'decrease_factor', 'target_latency',
+                 'cooldown', 'throttle_count', '_last_refill', '_last_decrease', '_lock']
+
+    def __init__(self,
+                 rate: float = USER_QUOTA / 2,
+                 min_rate: float = 10.0,
+                 max_rate: float = USER_QUOTA,
+                 capacity: Optional[float] = None,
+                 increase_step: float = 5.0,
+                 decrease_factor: float = 0.5,
+                 target_latency: float = 5.0,
+                 cooldown: float = 1.0,
+                 ) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = capacity if capacity is not None else max_rate
+        self.tokens = self.capacity
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.throttle_count = 0
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self, units: float) -> None:
+        '''
+        Reserves quota units, sleeping until the bucket has paid them back.
+        Callers are served in arrival order by letting the balance go negative.
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+            self.tokens -= units
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, latency: float, throttled: bool = False) -> None:
+        ''' Additive increase on healthy batches, multiplicative decrease on throttling '''
+        now = time.monotonic()
+
+        if throttled:
+            self.throttle_count += 1
+
+            # One burst of 429s should only cut the rate once
+            if now - self._last_decrease < self.cooldown:
+                return
+
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drop any saved up burst so the next requests obey the new rate
+            self.tokens = min(self.tokens, 0)
+            self._last_decrease = now
+
+        elif latency <= self.target_latency:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+def get_limiter(user_id: str) -> QuotaLimiter:
+    ''' Returns the shared QuotaLimiter for a user, creating it on first use '''
+    limiter = _limiters.get(user_id)
+
+    if limiter is None:
+        limiter = QuotaLimiter()
+        _limiters[user_id] = limiter
+
+    return limiter
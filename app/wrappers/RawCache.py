@@ -0,0 +1,291 @@
+import os
+import json
+import gzip
+import hashlib
+import time
+import asyncio
+import uuid
+
+from threading import Lock
+from collections import Counter
+from typing import Optional, List, Dict, Tuple, Iterator, AsyncIterator
+
+from ..data_structures.CommNodeBatch import CommNodeBatch
+from ..data_structures.ParsePool import get_parse_pool, parse_columnar
+
+# Process wide cache, None until configured with a directory
+_cache = None
+
+
+class RawMessageCache:
+    '''
+    On-disk store for raw messages.get responses so mailboxes can be
+    re-parsed without re-downloading them from Gmail.
+
+    Blobs are gzipped json stored under the sha256 of their content:
+        <root>/blobs/<digest[:2]>/<digest>.json.gz
+    Each user gets an append-only index mapping msg_id -> digest:
+        <root>/users/<user_id>.index
+
+    Attributes:
+    -----------
+        root: str
+            Directory the cache lives in
+        max_bytes: int
+            Total compressed size to keep, least recently written
+            entries are evicted past this
+        total_bytes: int
+            Current compressed size of every indexed blob, a blob
+            shared by several entries is counted once
+
+    Methods:
+    --------
+        store(self, user_id: str, responses: List[Dict[str, any]]) -> int
+            Writes raw responses to the cache and returns the number stored
+        load(self, digest: str) -> Dict[str, any]
+            Reads a single raw response back by digest
+        load_many(self, digests: List[str]) -> List[Dict[str, any]]
+            Reads raw responses back, skipping blobs that went missing
+        message_ids(self, user_id: str) -> List[str]
+            Returns every cached msg_id for a user
+        digests(self, user_id: str) -> List[str]
+            Returns the blob digest of every cached message for a user
+    '''
+    __slots__ = ['root', 'max_bytes', 'total_bytes', '_indexes', '_blob_refs', '_lock']
+
+    def __init__(self, root: str, max_bytes: int = 10 * 1024 ** 3) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # user_id -> {msg_id: (digest, size, written_at)}
+        self._indexes = {}
+        # digest -> number of index entries pointing at it
+        self._blob_refs = Counter()
+        self._lock = Lock()
+
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'users'), exist_ok=True)
+
+        for filename in os.listdir(os.path.join(root, 'users')):
+            if filename.endswith('.index'):
+                self._load_index(filename[:-len('.index')])
+
+    def _index_path(self, user_id: str) -> str:
+        return os.path.join(self.root, 'users', f'{user_id}.index')
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'blobs', digest[:2], f'{digest}.json.gz')
+
+    def _load_index(self, user_id: str) -> Dict[str, Tuple[str, int, float]]:
+        ''' Replays a user's index log, later lines win '''
+        index = {}
+        path = self._index_path(user_id)
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        msg_id, digest, size, written_at = json.loads(line)
+                    except ValueError:
+                        # torn write at the end of the log
+                        continue
+                    index[msg_id] = (digest, size, written_at)
+
+        for digest, size, _ in index.values():
+            self._take(digest, size)
+
+        self._indexes[user_id] = index
+        return index
+
+    def _index(self, user_id: str) -> Dict[str, Tuple[str, int, float]]:
+        if user_id not in self._indexes:
+            return self._load_index(user_id)
+
+        return self._indexes[user_id]
+
+    def _rewrite_index(self, user_id: str) -> None:
+        ''' Compacts a user's index log down to its live entries '''
+        path = self._index_path(user_id)
+        tmp_path = f'{path}.tmp'
+
+        with open(tmp_path, 'w') as f:
+            for msg_id, entry in self._indexes[user_id].items():
+                f.write(json.dumps([msg_id, *entry]) + '\n')
+
+        os.replace(tmp_path, path)
+
+    def store(self, user_id: str, responses: List[Dict[str, any]]) -> int:
+        '''
+        Compresses and writes raw responses for a user. Blocking, run it in an executor.
+
+        Params:
+        -------
+            user_id: str
+                uuid of the mailbox owner
+            responses: List[Dict[str, any]]
+                raw messages.get responses
+        '''
+        staged = []
+
+        # Compress outside the lock, new blobs wait in a temp file until they're referenced
+        for response in responses:
+            raw = json.dumps(response, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            digest = hashlib.sha256(raw).hexdigest()
+            tmp_path = None
+
+            if not os.path.exists(self._blob_path(digest)):
+                tmp_path = self._write_tmp(digest, raw)
+
+            staged.append((response['id'], digest, raw, tmp_path))
+
+        with self._lock:
+            index = self._index(user_id)
+
+            with open(self._index_path(user_id), 'a') as f:
+                for msg_id, digest, raw, tmp_path in staged:
+                    path = self._blob_path(digest)
+
+                    # Checked again under the lock, an eviction may have removed the blob since
+                    if os.path.exists(path):
+                        if tmp_path is not None:
+                            os.remove(tmp_path)
+                    else:
+                        os.replace(tmp_path or self._write_tmp(digest, raw), path)
+
+                    size = os.path.getsize(path)
+                    written_at = time.time()
+                    previous = index.get(msg_id)
+
+                    # Take the new reference first so re-storing unchanged content
+                    # can't release the blob it points at
+                    index[msg_id] = (digest, size, written_at)
+                    self._take(digest, size)
+
+                    if previous is not None:
+                        self._release(previous[0], previous[1])
+                    f.write(json.dumps([msg_id, digest, size, written_at]) + '\n')
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+        return len(staged)
+
+    def _write_tmp(self, digest: str, raw: bytes) -> str:
+        ''' Compresses raw into a temp file next to the blob's final path '''
+        path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Executor threads can write the same new blob at once
+        tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(raw)
+
+        return tmp_path
+
+    def _take(self, digest: str, size: int) -> None:
+        ''' Adds a reference to a blob, its size only counts for the first one '''
+        self._blob_refs[digest] += 1
+
+        if self._blob_refs[digest] == 1:
+            self.total_bytes += size
+
+    def _release(self, digest: str, size: int) -> None:
+        ''' Drops a reference to a blob and deletes it once nothing points at it '''
+        self._blob_refs[digest] -= 1
+
+        if self._blob_refs[digest] <= 0:
+            del self._blob_refs[digest]
+            self.total_bytes -= size
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        ''' Evicts the oldest entries across every user until the cache fits in max_bytes '''
+        entries = sorted(
+            (written_at, user_id, msg_id)
+            for user_id, index in self._indexes.items()
+            for msg_id, (_, _, written_at) in index.items()
+        )
+
+        touched = set()
+        # Evict down to 90% so we don't evict on every store
+        target = self.max_bytes * 0.9
+
+        for _, user_id, msg_id in entries:
+            if self.total_bytes <= target:
+                break
+
+            digest, size, _ = self._indexes[user_id].pop(msg_id)
+            self._release(digest, size)
+            touched.add(user_id)
+
+        for user_id in touched:
+            self._rewrite_index(user_id)
+
+    def load(self, digest: str) -> Dict[str, any]:
+        with gzip.open(self._blob_path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    def load_many(self, digests: List[str]) -> List[Dict[str, any]]:
+        output = []
+        for digest in digests:
+            try:
+                output.append(self.load(digest))
+            except (OSError, ValueError) as e:
+                print(f'Error reading cached message {digest}: {e}')
+
+        return output
+
+    def message_ids(self, user_id: str) -> List[str]:
+        with self._lock:
+            return list(self._index(user_id).keys())
+
+    def digests(self, user_id: str) -> List[str]:
+        with self._lock:
+            return [entry[0] for entry in self._index(user_id).values()]
+
+
+async def replay_messages(cache: RawMessageCache,
+                          user_id: str,
+                          batch_size: int = 200,
+                          concurrency: int = 4,
+                          ) -> AsyncIterator[CommNodeBatch]:
+    '''
+    Async generator that feeds a user's cached raw messages back through
+    the parse pool, yielding a CommNodeBatch per chunk at local disk speed without
+    touching the Gmail API.
+    '''
+    loop = asyncio.get_event_loop()
+    digests = cache.digests(user_id)
+
+    async def parse(chunk: List[str]) -> CommNodeBatch:
+        raw_responses = await loop.run_in_executor(None, cache.load_many, chunk)
+        batch, failed = await loop.run_in_executor(get_parse_pool(), parse_columnar, raw_responses)
+
+        # Nothing to re-fetch, a cached message that won't parse is only reported
+        for msg_id, error in failed.items():
+            print(f'Error replaying message {msg_id}: {error}')
+
+        return batch.intern()
+
+    chunks = [digests[i:i+batch_size] for i in range(0, len(digests), batch_size)]
+
+    for i in range(0, len(chunks), concurrency):
+        results = await asyncio.gather(*(parse(chunk) for chunk in chunks[i:i+concurrency]))
+
+        for batch in results:
+            if len(batch) > 0:
+                yield batch
+
+
+def configure_raw_cache(root: Optional[str], max_bytes: int) -> None:
+    ''' Turns the raw message cache on when a directory is configured '''
+    global _cache
+
+    _cache = RawMessageCache(root, max_bytes) if root else None
+
+
+def get_raw_cache() -> Optional[RawMessageCache]:
+    return _cache
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Tuple, Optional
+
+from googleapiclient.discovery import build_from_document
+
+# Static discovery documents shipped with the app, named <service>.<version>.json
+DISCOVERY_DIR = os.path.join(os.path.dirname(__file__), 'discovery')
+
+# (service_name, version) -> parsed discovery document
+_documents = {}
+
+# (client_id, user token, service_name, version) -> (Resource, time built), least recently used first.
+# A Resource holds its creds, so entries are bounded and expire instead of living as long as the creds
+_services = OrderedDict()
+
+SERVICE_CACHE_SIZE = int(os.environ.get('SERVICE_CACHE_SIZE', 256))
+SERVICE_CACHE_TTL = float(os.environ.get('SERVICE_CACHE_TTL', 3600))
+
+_lock = Lock()
+
+
+def _service_key(service_name: Optional[str], version: Optional[str]) -> Tuple[str, str]:
+    return (
+        service_name or os.environ.get('API_SERVICE_NAME', 'gmail'),
+        version or os.environ.get('API_VERSION', 'v1'),
+    )
+
+
+def load_discovery_document(service_name: Optional[str] = None,
+                            version: Optional[str] = None,
+                            ) -> Dict[str, any]:
+    '''
+    Returns the parsed discovery document for a service. The bundled
+    copy is read from disk once per process, it is never fetched over
+    the network.
+    '''
+    key = _service_key(service_name, version)
+    document = _documents.get(key)
+
+    if document is None:
+        with _lock:
+            document = _documents.get(key)
+            if document is None:
+                path = os.path.join(DISCOVERY_DIR, '{}.{}.json'.format(*key))
+                with open(path, 'r') as f:
+                    document = json.load(f)
+
+                _documents[key] = document
+
+    return document
+
+
+def _creds_key(creds: any) -> Optional[Tuple[str, str]]:
+    ''' Identifies the user behind a set of credentials, the refresh token outlives access tokens '''
+    token = getattr(creds, 'refresh_token', None) or getattr(creds, 'token', None)
+    if token is None:
+        return None
+
+    return getattr(creds, 'client_id', None), token
+
+
+def get_service(creds: any,
+                service_name: Optional[str] = None,
+                version: Optional[str] = None,
+                ) -> 'Resource':
+    '''
+    Returns a service handle for a set of credentials. Interfaces built
+    for the same user (eg: cloned Pipelines) share one handle for up to
+    SERVICE_CACHE_TTL seconds, the SERVICE_CACHE_SIZE most recently used
+    handles are kept. New handles only pay for wrapping the already parsed
+    discovery document.
+
+    Handles wrap an httplib2 connection and are not thread safe,
+    only use them from the event loop thread.
+    '''
+    key = _service_key(service_name, version)
+    creds_key = _creds_key(creds)
+
+    document = load_discovery_document(*key)
+    if creds_key is None:
+        return build_from_document(document, credentials=creds)
+
+    cache_key = (*creds_key, *key)
+    now = time.monotonic()
+
+    with _lock:
+        cached = _services.get(cache_key)
+        if cached is not None and now - cached[1] < SERVICE_CACHE_TTL:
+            _services.move_to_end(cache_key)
+            return cached[0]
+
+    service = build_from_document(document, credentials=creds)
+
+    with _lock:
+        _services[cache_key] = (service, now)
+        _services.move_to_end(cache_key)
+
+        while len(_services) > SERVICE_CACHE_SIZE:
+            _services.popitem(last=False)
+
+    return service
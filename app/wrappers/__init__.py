@@ -1,4 +1,10 @@
-from .BaseWrapper import WrapperOpts
+from .BaseWrapper import WrapperOpts, ScrapeFormat, FetchMode
+from .ServiceFactory import get_service, load_discovery_document
+from .BatchClient import AsyncBatchClient, GmailError, close_session
+from .RateLimiter import QuotaLimiter, get_limiter
+from .BatchTuner import BatchTuner
+from .MessageCache import MessageCache, configure_message_cache, get_message_cache, attach_message_cache_redis
+from .RawCache import RawMessageCache, configure_raw_cache, get_raw_cache, replay_messages
 from .Gmail import Gmail
 from .Hermes import Hermes
-from .Pipeline import Pipeline
+from .Pipeline import Pipeline, HistoryExpired, ListingIncomplete
@@ -0,0 +1,89 @@
+'''
+Compares the old regex/token loop in _parseEntities against the cached
+RFC 5322 address parser over a synthetic mailbox where, like a real one,
+a small set of senders and recipient lines makes up most headers.
+
+    python -m benchmarks.address_parsing
+'''
+import re
+import random
+import time
+
+from app.data_structures.AddressParser import parse_address_header, address_cache_stats, _parse_simple_mailbox
+
+ME = 'Pat Example <pat@example.com>'
+
+
+def legacy_parse(poc_value: str):
+    ''' The loop _parseEntities used to run, minus building the Entity '''
+    output = []
+    emails = set(re.findall(r"<?(\S*@[^>, ]*)", poc_value))
+    string_gen = (string for string in re.findall(r"[^<,> ]*", poc_value))
+
+    entity_name = ''
+
+    while True:
+        try:
+            curr_string = next(string_gen)
+        except StopIteration:
+            break
+
+        if curr_string in emails:
+            entity_email = curr_string.lower().replace('"', '')
+            entity_domain = entity_email.split('@')[1]
+            output.append((entity_name.replace('"', ''), entity_email, entity_domain))
+            entity_name = ''
+        else:
+            entity_name += f' {curr_string}'
+
+    return output
+
+
+def synthetic_mailbox(rng: random.Random, n_messages: int):
+    ''' From, To and Cc header values for every message '''
+    senders = [f'"Team {i}" <noreply@service{i}.com>' for i in range(300)]
+    people = [f'Person {i} <person.{i}@company{i % 40}.com>' for i in range(2000)]
+
+    headers = []
+    for i in range(n_messages):
+        # Most mail comes from a few automated senders
+        if rng.random() < 0.7:
+            sender = senders[int(rng.paretovariate(1.2)) % len(senders)]
+        else:
+            sender = rng.choice(people)
+
+        headers.append(sender)
+        headers.append(ME if rng.random() < 0.8 else ', '.join([ME] + rng.sample(people, 2)))
+
+        if rng.random() < 0.2:
+            headers.append(', '.join(rng.sample(people, rng.randint(1, 4))))
+
+    return headers
+
+
+def timed(func, headers) -> float:
+    t0 = time.perf_counter()
+    for header in headers:
+        func(header)
+    return (time.perf_counter() - t0) / len(headers)
+
+
+def main(n_messages: int = 50000) -> None:
+    rng = random.Random(0)
+    headers = synthetic_mailbox(rng, n_messages)
+
+    parse_address_header.cache_clear()
+    _parse_simple_mailbox.cache_clear()
+
+    legacy = timed(legacy_parse, headers)
+    cached = timed(parse_address_header, headers)
+
+    print(f'{len(headers)} headers over {n_messages} messages')
+    print('{:<25} {:>10.2f}us/header'.format('regex token loop', legacy * 1e6))
+    print('{:<25} {:>10.2f}us/header'.format('cached RFC 5322 parser', cached * 1e6))
+    print('{:<25} {:>10.2f}x'.format('speedup', legacy / cached))
+    print(f'cache: {address_cache_stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Parses an oversized plaintext report and an oversized html newsletter
+through parse_batch with the body limits off and with the defaults, to
+show the worst case per message latency the limits buy. A small message
+goes through both runs untouched.
+
+    python -m benchmarks.body_limits
+'''
+import base64
+import random
+import time
+
+from app.data_structures.ParsePool import parse_batch
+from app.data_structures.BodyGuard import configure_body_limits, get_body_limits, truncation_counts
+from app.data_structures.CommNodeBatch import CommNodeBatch
+
+WORDS = ('total revenue report region quarter metric value change '
+         'forecast growth customers orders').split()
+
+
+def response(msg_id: str, mimetype: str, body: str):
+    return {
+        'id': msg_id,
+        'threadId': msg_id,
+        'internalDate': '1580000000000',
+        'payload': {
+            'mimeType': mimetype,
+            'headers': [{'name': 'From', 'value': 'Reports <reports@example.com>'}],
+            'body': {'data': base64.urlsafe_b64encode(body.encode()).decode()},
+        },
+    }
+
+
+def synthetic_responses(rng: random.Random):
+    report = ' '.join(rng.choice(WORDS) for _ in range(600000))
+    rows = ''.join(f'<tr><td>{rng.choice(WORDS)} {i}</td><td style="color: red">{rng.choice(WORDS)}</td></tr>'
+                   for i in range(150000))
+    newsletter = f'<html><body><table>{rows}</table></body></html>'
+    small = '<html><body><p>lunch on thursday?</p></body></html>'
+
+    return [
+        response('report', 'text/plain', report),
+        response('newsletter', 'text/html', newsletter),
+        response('small', 'text/html', small),
+    ]
+
+
+def timed_parse(responses):
+    timings, nodes = [], []
+    for raw in responses:
+        t0 = time.perf_counter()
+        nodes.extend(parse_batch([raw])[0])
+        timings.append(time.perf_counter() - t0)
+    return timings, nodes
+
+
+def main() -> None:
+    responses = synthetic_responses(random.Random(0))
+    defaults = get_body_limits()
+
+    configure_body_limits(0, 0, 0)
+    unlimited, full_nodes = timed_parse(responses)
+
+    configure_body_limits(*defaults)
+    limited, cut_nodes = timed_parse(responses)
+
+    print(f'limits: {defaults}')
+    print('{:<12} {:>10} {:>12} {:>10} {:>12}'.format('message', 'raw KiB', 'unlimited', 'limited', 'text chars'))
+    for raw, full, cut, node in zip(responses, unlimited, limited, cut_nodes):
+        print('{:<12} {:>10.0f} {:>10.1f}ms {:>8.1f}ms {:>12}'.format(
+            raw['id'], len(raw['payload']['body']['data']) / 1024, full * 1e3, cut * 1e3,
+            len(node.plaintext_body or node.html_body)))
+
+    small_matches = full_nodes[-1].html_body == cut_nodes[-1].html_body
+    print(f'truncations: {truncation_counts(CommNodeBatch.from_nodes(cut_nodes).truncated)}, small message unchanged: {small_matches}')
+
+
+if __name__ == '__main__':
+    main()
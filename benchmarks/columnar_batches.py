@@ -0,0 +1,127 @@
+'''
+Compares shipping a parsed batch as a list of CommNodes against a
+CommNodeBatch: the pickle round trip between the parse worker and the
+event loop, and turning the batch into rows for the bulk loaders. The
+row step for nodes is the dict generators gmail_worker used to build.
+
+    python -m benchmarks.columnar_batches
+'''
+import base64
+import itertools
+import json
+import pickle
+import random
+import time
+
+from datetime import datetime
+
+from app.data_structures.ParsePool import parse_batch
+from app.data_structures.CommNodeBatch import CommNodeBatch
+from app.data_structures.TermMatrix import TermSegment
+
+WORDS = ('meeting invoice project update please review attached schedule '
+         'thanks regards team client budget report deadline launch').split()
+
+
+def synthetic_responses(rng: random.Random, n_messages: int):
+    people = [f'Person {i} <person.{i}@company{i % 40}.com>' for i in range(500)]
+
+    for i in range(n_messages):
+        body = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 200)))
+        headers = [
+            {'name': 'From', 'value': rng.choice(people)},
+            {'name': 'To', 'value': ', '.join(rng.sample(people, rng.randint(1, 4)))},
+            {'name': 'Subject', 'value': f'Subject {i}'},
+        ]
+
+        yield {
+            'id': f'{i:016x}',
+            'threadId': f'{i // 3:016x}',
+            'labelIds': ['INBOX', 'UNREAD'],
+            'internalDate': str(1580000000000 + i * 60000),
+            'payload': {
+                'mimeType': 'text/plain',
+                'headers': headers,
+                'body': {'data': base64.urlsafe_b64encode(body.encode()).decode()},
+            },
+        }
+
+
+def dict_rows(nodes, user_uuid: str) -> int:
+    ''' The dicts gmail_worker built for every flushed list of nodes '''
+    rows = 0
+    rows += sum(1 for _ in ({
+        'owner': user_uuid,
+        'message_id': node.msg_id,
+        'thread_id': node.thread_id,
+        'last_fetch': datetime.now()
+    } for node in nodes))
+    rows += sum(1 for _ in ({
+        'message_id': node.msg_id,
+        'html_body': node.html_body,
+        'text_body': node.plaintext_body,
+        'mimetypes': node.mimetypes,
+        'ip_address': node.ip_address,
+        'subject': node.subject,
+        'date': node.date,
+        'keywords': json.dumps(node.keywords),
+        'labels': node.labels
+    } for node in nodes))
+    rows += sum(1 for _ in ({
+        'email': entity.email,
+        'name': entity.name,
+        'domain': entity.domain,
+        'msg_id': entity.msg_id,
+        'poc': entity.poc.name
+    } for entity in itertools.chain.from_iterable(node.entities for node in nodes)))
+    TermSegment.from_nodes(nodes).encode()
+    return rows
+
+
+def batch_rows(batch: CommNodeBatch) -> int:
+    ''' What handleBatchInsert hands to unnest and COPY '''
+    rows = len(batch.msg_ids)
+    rows += sum(1 for _ in batch.comm_node_records())
+    rows += sum(1 for _ in batch.entity_records())
+    TermSegment.from_batch(batch).encode()
+    return rows
+
+
+def timed(func, *args, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n_messages: int = 250) -> None:
+    rng = random.Random(0)
+    nodes, _ = parse_batch(list(synthetic_responses(rng, n_messages)))
+    batch = CommNodeBatch.from_nodes(nodes)
+
+    node_blob = pickle.dumps(nodes)
+    batch_blob = pickle.dumps(batch)
+
+    node_unpickle = timed(pickle.loads, node_blob)
+    batch_unpickle = timed(pickle.loads, batch_blob)
+    node_rows = timed(dict_rows, nodes, 'owner')
+    columnar_rows = timed(batch_rows, batch)
+
+    # The batch has to come back out exactly as the nodes went in
+    mismatches = sum(
+        (a.msg_id, a.thread_id, a.date, a.subject, a.plaintext_body, a.labels, a.entities, a.keywords)
+        != (b.msg_id, b.thread_id, b.date, b.subject, b.plaintext_body, b.labels, b.entities, b.keywords)
+        for a, b in zip(nodes, batch.to_nodes())
+    )
+
+    print(f'{n_messages} messages, {len(batch.entity_emails)} entities, {mismatches} mismatches')
+    print('{:<25} {:>10.1f}KiB {:>10.2f}ms unpickle'.format('List[CommNode]', len(node_blob) / 1024, node_unpickle * 1e3))
+    print('{:<25} {:>10.1f}KiB {:>10.2f}ms unpickle'.format('CommNodeBatch', len(batch_blob) / 1024, batch_unpickle * 1e3))
+    print('{:<25} {:>10.2f}ms'.format('dict rows', node_rows * 1e3))
+    print('{:<25} {:>10.2f}ms'.format('columnar records', columnar_rows * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Compares the BeautifulSoup html extractor against the streaming lxml
+extractor on a fixture corpus of html bodies, and checks both produce
+the same text.
+
+    python -m benchmarks.html_extraction
+'''
+import random
+import time
+
+from app.data_structures.HtmlExtractor import extract_soup, extract_lxml
+
+FIXTURES = [
+    b'<html><body><p>Hello there</p></body></html>',
+    b'<p>fragment without html or body</p> trailing text',
+    b'<div>unclosed <b>bold <i>italic</div> after</p>',
+    b'<html><head><title>Title stays out</title><style>p {color: red}</style></head>'
+    b'<body>visible<script>var hidden = 1;</script> text</body></html>',
+    b'<body><div dir="ltr">Reply text</div><div class="gmail_quote">On Tue someone wrote:'
+    b'<blockquote>quoted <div class="gmail_quote">nested quote</div></blockquote></div>'
+    b'<div class="extra gmail_quote">second quote is kept</div></body>',
+    b'<body>before<!-- a comment -->after<br>line two &amp; &lt;entities&gt; &nbsp;here</body>',
+    b'<!DOCTYPE html><html><body><table><tr><td>cell one</td><td>cell two</td></tr></table></body></html>',
+    b'<html><head><meta charset="iso-8859-1"></head><body>caf\xe9 cr\xe8me</body></html>',
+    '<body>unicode ☃ snowman and été</body>'.encode('utf-8'),
+    b'<body><style>.a{}</style><style>.b{}</style>x<script>1</script><script>2</script>y</body>',
+    b'</body></html>text after a stray close<body>second body tag</body>',
+    b'<body><p>split<span></span>word</p><p>   padded   </p><p>\n\n</p></body>',
+    b'<body><![CDATA[cdata text]]> plain</body>',
+    b'',
+]
+
+WORDS = 'limited time offer save big on everything in store today only free shipping'.split()
+
+
+def marketing_email(rng: random.Random, blocks: int) -> bytes:
+    ''' Table heavy newsletter markup with inline styles, tracking scripts and a quoted reply '''
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8">',
+             '<style>' + 'td{padding:0;margin:0}' * 40 + '</style></head><body>',
+             '<table width="100%" cellpadding="0" cellspacing="0">']
+
+    for i in range(blocks):
+        text = ' '.join(rng.choice(WORDS) for i in range(rng.randint(5, 30)))
+        parts.append(f'<tr><td style="font-family:Arial;font-size:14px;color:#333333">'
+                     f'<a href="https://example.com/{i}"><span>{text}</span></a>'
+                     f'<img src="https://example.com/p/{i}.gif" width="1" height="1"></td></tr>')
+        if rng.random() < 0.1:
+            parts.append('<!-- spacer --><tr><td>&nbsp;</td></tr>')
+        if rng.random() < 0.05:
+            parts.append('<script>window.track && track("open");</script>')
+
+    parts.append('</table>')
+    if rng.random() < 0.5:
+        parts.append('<div class="gmail_quote">On Mon someone wrote:<blockquote>old text</blockquote></div>')
+    parts.append('</body></html>')
+
+    return ''.join(parts).encode('utf-8')
+
+
+def timed(func, bodies, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        for body in bodies:
+            func(body)
+    return (time.perf_counter() - t0) / (rounds * len(bodies))
+
+
+def safe(func, body: bytes) -> str:
+    try:
+        return func(body)
+    except Exception as e:
+        return f'<{type(e).__name__}>'
+
+
+def main(n_bodies: int = 200, rounds: int = 3) -> None:
+    rng = random.Random(0)
+    bodies = [marketing_email(rng, rng.choice([10, 50, 200])) for i in range(n_bodies)]
+
+    corpus = FIXTURES + bodies
+    mismatches = [body[:60] for body in corpus if safe(extract_soup, body) != safe(extract_lxml, body)]
+    print(f'{len(corpus)} documents, {len(mismatches)} outputs differ')
+    for body in mismatches:
+        print(f'    {body}')
+
+    soup = timed(extract_soup, bodies, rounds)
+    streamed = timed(extract_lxml, bodies, rounds)
+
+    print('{:<25} {:>10.2f}us/body'.format('BeautifulSoup', soup * 1e6))
+    print('{:<25} {:>10.2f}us/body'.format('lxml target', streamed * 1e6))
+    print('{:<25} {:>10.2f}x'.format('speedup', soup / streamed))
+
+
+if __name__ == '__main__':
+    main()
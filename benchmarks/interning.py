@@ -0,0 +1,85 @@
+'''
+Measures the memory held by 10k metadata CommNodes with and without the
+intern pool, using tracemalloc. Every synthetic response is decoded from
+its own json document so, like real Gmail responses, no strings are shared
+between messages up front.
+
+    python -m benchmarks.interning
+'''
+import gc
+import json
+import random
+import tracemalloc
+
+from app.data_structures.CommNode import CommNodeBuildManager
+from app.data_structures.InternPool import intern_pool
+
+LABELS = ['INBOX', 'UNREAD', 'IMPORTANT', 'CATEGORY_PERSONAL', 'CATEGORY_UPDATES',
+          'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'SENT', 'STARRED', 'Label_12']
+
+
+def synthetic_responses(rng: random.Random, n_messages: int):
+    senders = [f'"Team {i}" <noreply@service{i}.com>' for i in range(300)]
+    people = [f'Person {i} <person.{i}@company{i % 40}.com>' for i in range(2000)]
+    me = 'Pat Example <pat@example.com>'
+
+    for i in range(n_messages):
+        sender = senders[int(rng.paretovariate(1.2)) % len(senders)] if rng.random() < 0.7 else rng.choice(people)
+        headers = [
+            {'name': 'From', 'value': sender},
+            {'name': 'To', 'value': me},
+            {'name': 'Subject', 'value': f'Subject {i}'},
+        ]
+        if rng.random() < 0.2:
+            headers.append({'name': 'Cc', 'value': ', '.join(rng.sample(people, rng.randint(1, 4)))})
+
+        response = {
+            'id': f'{i:016x}',
+            'threadId': f'{i // 3:016x}',
+            'labelIds': rng.sample(LABELS, rng.randint(1, 4)),
+            'internalDate': str(1580000000000 + i * 60000),
+            'payload': {'mimeType': 'text/plain', 'headers': headers},
+        }
+
+        yield json.dumps(response)
+
+
+def retained(documents, pool_size: int) -> int:
+    ''' Bytes still allocated once every node is built and the raw responses are gone '''
+    intern_pool.maxsize = pool_size
+    intern_pool.clear()
+    gc.collect()
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+
+    nodes = [CommNodeBuildManager.construct(json.loads(document), metadata_only=True)
+             for document in documents]
+
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    del nodes
+    return used
+
+
+def main(n_messages: int = 10000) -> None:
+    rng = random.Random(0)
+    documents = list(synthetic_responses(rng, n_messages))
+
+    # Warm the address cache so both runs hold the same cached headers
+    retained(documents, 0)
+
+    plain = retained(documents, 0)
+    interned = retained(documents, 65536)
+
+    print(f'{n_messages} messages')
+    print('{:<25} {:>10.1f}KiB'.format('without interning', plain / 1024))
+    print('{:<25} {:>10.1f}KiB'.format('with interning', interned / 1024))
+    print('{:<25} {:>10.1f}KiB ({:.0%})'.format('saved', (plain - interned) / 1024, 1 - interned / plain))
+    print(f'pool: {intern_pool.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Compares building a Gmail service per interface against the shared
+service factory. Runs offline with dummy credentials.
+
+    python -m benchmarks.service_factory
+'''
+import time
+
+from googleapiclient.discovery import build_from_document
+from google.oauth2.credentials import Credentials
+
+from app.wrappers.ServiceFactory import get_service, load_discovery_document, DISCOVERY_DIR
+
+
+def dummy_creds() -> Credentials:
+    return Credentials(token='token', refresh_token='refresh',
+                       token_uri='https://oauth2.googleapis.com/token',
+                       client_id='client', client_secret='secret')
+
+
+def per_instance_build(creds: Credentials) -> None:
+    ''' What every interface used to do, minus the discovery http fetch '''
+    with open(f'{DISCOVERY_DIR}/gmail.v1.json', 'r') as f:
+        service = build_from_document(f.read(), credentials=creds)
+
+    service.users().messages().list(userId='me')
+
+
+def shared_service(creds: Credentials) -> None:
+    get_service(creds)
+
+
+def timed(func, creds_for, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        func(creds_for(i))
+    return (time.perf_counter() - t0) / rounds
+
+
+def main(rounds: int = 200) -> None:
+    shared = dummy_creds()
+    fresh = [dummy_creds() for i in range(rounds)]
+
+    # Warm the document cache so only the per interface cost is measured
+    load_discovery_document()
+
+    results = [
+        ('build per interface', timed(per_instance_build, lambda i: shared, rounds)),
+        ('factory, same creds (cloned Pipeline)', timed(shared_service, lambda i: shared, rounds)),
+        ('factory, new creds (per request)', timed(shared_service, lambda i: fresh[i], rounds)),
+    ]
+
+    for name, elapsed in results:
+        print('{:<40} {:>12.2f}us'.format(name, elapsed * 1e6))
+
+
+if __name__ == '__main__':
+    main()
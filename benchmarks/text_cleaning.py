@@ -0,0 +1,125 @@
+'''
+Compares the old mrClean generator chain against the compiled TextCleaner
+on synthetic plaintext bodies, and checks both produce the same words.
+
+    python -m benchmarks.text_cleaning
+'''
+import re
+import random
+import time
+
+from app.data_structures import Routine
+from app.data_structures.TextCleaner import default_cleaner
+
+WORDS = ('hey team just following up on the quarterly numbers can you send '
+         'the updated deck before friday thanks again it\'s been a long week').split()
+
+SNIPPETS = [
+    'https://docs.example.com/d/1a2b3c/edit?usp=sharing',
+    '<br/>',
+    '<img src="https://cdn.example.com/x.png"/>',
+    'style="color:#333;font-size:12px"',
+    'font-family: Arial;',
+    '<b>',
+    '</b>',
+    '<span></span>',
+]
+
+QUOTE = '\r\n\r\nOn Tue, Mar 3, 2020 at 9:41 AM Jane Doe <jane.doe@example.com> wrote:\r\n> '
+
+
+def legacy_routines():
+    return [
+        Routine(r"\r", '', 'removing returns'),
+        Routine(r"\n", ' ', 'removing newlines'),
+        Routine(r"On\s\w{3},?\s.*?<\s?\S*?@\S*?\s?>.*", '', 'removing email quotes'),
+        Routine(r"<.*?\/>|<.*?><\/.*?>", '', 'removing HTML elements'),
+        Routine(r"http?s?://\S+", '', 'removing urls'),
+        Routine(r"\w*?=\"\S+|\S*?:\s?\S*?;\"?", '', 'removing css styles'),
+        Routine(r" {1,}", ' ', 'removing extra spaces'),
+        Routine(r"<\S*?>", '', 'removing HTML tags'),
+        None
+    ]
+
+
+def mr_clean():
+    base_str = yield
+    while True:
+        op = yield
+        if op is None:
+            break
+        try:
+            base_str = re.sub(op.pattern, op.repl, base_str)
+        except Exception as e:
+            print(f'Error performing {op.op_name}: {e}')
+            continue
+
+    return base_str.lower()
+
+
+def legacy_clean(text: str) -> str:
+    ''' The chain _parseTextBody used to run, routine list built per message '''
+    cleaned = ''
+    text_cleaner = mr_clean()
+    next(text_cleaner)
+    text_cleaner.send(text)
+
+    for routine in legacy_routines():
+        try:
+            text_cleaner.send(routine)
+        except StopIteration as exc:
+            cleaned = exc.value
+
+    return ' '.join(re.findall(r"[a-zA-Z']{2,}", cleaned))
+
+
+def compiled_clean(text: str) -> str:
+    return ' '.join(default_cleaner.clean(text))
+
+
+def make_body(rng: random.Random, n_words: int) -> str:
+    lines, line = [], []
+    for i in range(n_words):
+        if rng.random() < 0.05:
+            line.append(rng.choice(SNIPPETS))
+        else:
+            line.append(rng.choice(WORDS))
+
+        if len(line) > rng.randint(6, 14):
+            lines.append(' '.join(line))
+            line = []
+
+    lines.append(' '.join(line))
+    body = '\r\n'.join(lines)
+
+    if rng.random() < 0.5:
+        body += QUOTE + '\r\n> '.join(lines[:5])
+
+    return body
+
+
+def timed(func, bodies, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        for body in bodies:
+            func(body)
+    return (time.perf_counter() - t0) / (rounds * len(bodies))
+
+
+def main(n_bodies: int = 500, rounds: int = 5) -> None:
+    rng = random.Random(0)
+    bodies = [make_body(rng, rng.choice([40, 150, 600, 2500])) for i in range(n_bodies)]
+
+    mismatches = sum(legacy_clean(body) != compiled_clean(body) for body in bodies)
+    print(f'{n_bodies} bodies, {mismatches} outputs differ')
+
+    legacy = timed(legacy_clean, bodies, rounds)
+    compiled = timed(compiled_clean, bodies, rounds)
+
+    print('{:<25} {:>10.2f}us/body'.format('mrClean chain', legacy * 1e6))
+    print('{:<25} {:>10.2f}us/body'.format('compiled TextCleaner', compiled * 1e6))
+    print('{:<25} {:>10.2f}x'.format('speedup', legacy / compiled))
+
+
+if __name__ == '__main__':
+    main()
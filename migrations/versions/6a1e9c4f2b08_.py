@@ -0,0 +1,35 @@
+"""unique comm_nodes per message and entities per message, email and poc
+
+Revision ID: 6a1e9c4f2b08
+Revises: 0d5a8e3b6c71
+Create Date: 2026-10-18 10:21:37.640112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1e9c4f2b08'
+down_revision = '0d5a8e3b6c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Re-scraped messages left duplicate rows behind, keep the first of each
+    op.execute('''
+        DELETE FROM comm_nodes a USING comm_nodes b
+        WHERE a.message_id = b.message_id AND a.id > b.id
+    ''')
+    op.execute('''
+        DELETE FROM entities a USING entities b
+        WHERE a.msg_id = b.msg_id AND a.email = b.email AND a.poc = b.poc AND a.id > b.id
+    ''')
+    op.create_unique_constraint('uq_comm_nodes_message_id', 'comm_nodes', ['message_id'])
+    op.create_unique_constraint('uq_entities_msg_id_email_poc', 'entities', ['msg_id', 'email', 'poc'])
+
+
+def downgrade():
+    op.drop_constraint('uq_entities_msg_id_email_poc', 'entities', type_='unique')
+    op.drop_constraint('uq_comm_nodes_message_id', 'comm_nodes', type_='unique')
@@ -0,0 +1,34 @@
+"""add a RESUMING checkpoint status for claimed checkpoints
+
+Revision ID: 9d4b2f7a1c35
+Revises: 6a1e9c4f2b08
+Create Date: 2026-10-18 14:05:52.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b2f7a1c35'
+down_revision = '6a1e9c4f2b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ADD VALUE can't run inside a transaction block before Postgres 12
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE checkpointstatus ADD VALUE IF NOT EXISTS 'RESUMING'")
+
+
+def downgrade():
+    # Postgres can't drop an enum value, rebuild the type without it
+    op.execute("UPDATE scrape_checkpoints SET status = 'PENDING' WHERE status = 'RESUMING'")
+    op.execute("ALTER TYPE checkpointstatus RENAME TO checkpointstatus_old")
+    sa.Enum('PENDING', 'IN_FLIGHT', 'DONE', name='checkpointstatus').create(op.get_bind(), checkfirst=False)
+    op.execute('''
+        ALTER TABLE scrape_checkpoints ALTER COLUMN status
+        TYPE checkpointstatus USING status::text::checkpointstatus
+    ''')
+    op.execute("DROP TYPE checkpointstatus_old")